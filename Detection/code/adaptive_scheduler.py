@@ -0,0 +1,214 @@
+# adaptive_scheduler.py
+"""
+Bộ điều khiển thích ứng giữ FPS mục tiêu theo ngân sách thời gian mỗi frame.
+
+- Đo thời gian từng stage (EMA): detect, recog, mesh, behavior.
+- Mỗi stage có nhịp chạy "every" (chạy 1 lần mỗi N frame, frame khác dùng lại kết quả).
+- Chi phí ước lượng mỗi frame = tổng (hoặc max nếu các stage chạy gối nhau) của
+  thời_gian_stage / every. Nếu vượt ngân sách 1/target_fps -> giảm tải:
+  tăng "every" của stage tốn nhất, hết cách thì giảm độ phân giải đưa vào YOLO (imgsz).
+  Nếu dư nhiều -> tăng lại chất lượng (độ phân giải trước, rồi tới nhịp các stage).
+- Mọi quyết định được ghi lại và lộ ra qua metrics().
+
+Ví dụ:
+    ctl = AdaptiveController(target_fps=30)
+    if ctl.should_run('detect'):
+        with ctl.measure('detect'):
+            res = model(frame, imgsz=ctl.imgsz)
+    ctl.frame_done()
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+STAGES = ('detect', 'recog', 'mesh', 'behavior')
+
+# Giới hạn nhịp (every) của từng stage: (nhỏ nhất, lớn nhất)
+EVERY_LIMITS = {
+    'detect':   (1, 3),
+    'recog':    (1, 10),
+    'mesh':     (1, 3),
+    'behavior': (1, 8),
+}
+IMGSZ_LEVELS  = (640, 512, 416, 320)   # Độ phân giải đưa vào YOLO, từ cao xuống thấp
+HIGH_WATER    = 1.00   # Chi phí > 100% ngân sách -> giảm tải
+LOW_WATER     = 0.70   # Chi phí dự kiến sau khi tăng chất lượng phải < 70% ngân sách
+EMA_ALPHA     = 0.2
+ADJUST_EVERY  = 15     # Số frame giữa 2 lần điều chỉnh (tránh dao động)
+DECISION_LOG  = 50     # Số quyết định gần nhất giữ lại trong metrics()
+
+
+class AdaptiveController:
+    def __init__(self, target_fps=30.0, every=None, overlapped=False, imgsz_levels=IMGSZ_LEVELS,
+                 adjust_every=ADJUST_EVERY, verbose=True):
+        """
+        every: nhịp ban đầu, ví dụ {'recog': 1, 'behavior': 2} (mặc định mọi stage = 1).
+        overlapped: True nếu các stage chạy gối nhau (stage_scheduler) -> chi phí = stage chậm nhất.
+        """
+        self.target_fps = float(target_fps)
+        self.budget_sec = 1.0 / self.target_fps
+        self.overlapped = overlapped
+        self.imgsz_levels = tuple(imgsz_levels)
+        self.level = 0
+        self.adjust_every = max(1, int(adjust_every))
+        self.verbose = verbose
+
+        self.every = {s: 1 for s in STAGES}
+        for s, v in (every or {}).items():
+            lo, hi = EVERY_LIMITS[s]
+            self.every[s] = min(hi, max(lo, int(v)))
+        self._counters = {s: 0 for s in STAGES}
+        self.stage_ema = {s: None for s in STAGES}
+
+        self._lock = threading.Lock()
+        self.frames = 0
+        self._last_frame_t = None
+        self.fps_ema = None
+        self.decisions = deque(maxlen=DECISION_LOG)
+        self.n_degrade = 0
+        self.n_upgrade = 0
+
+    # ------------------------------------------------------------------
+    @property
+    def imgsz(self):
+        return self.imgsz_levels[self.level]
+
+    def get_every(self, stage):
+        return self.every[stage]
+
+    def should_run(self, stage):
+        """Đếm lần gọi của stage; True nếu lần này tới nhịp chạy thật."""
+        with self._lock:
+            c = self._counters[stage]
+            self._counters[stage] = c + 1
+            return c % self.every[stage] == 0
+
+    def record(self, stage, seconds):
+        with self._lock:
+            old = self.stage_ema[stage]
+            self.stage_ema[stage] = seconds if old is None else (1 - EMA_ALPHA) * old + EMA_ALPHA * seconds
+
+    @contextmanager
+    def measure(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def frame_done(self):
+        """Gọi 1 lần sau mỗi frame đã xử lý xong. Định kỳ điều chỉnh nhịp / độ phân giải."""
+        now = time.perf_counter()
+        with self._lock:
+            if self._last_frame_t is not None:
+                dt = now - self._last_frame_t
+                if dt > 0:
+                    inst = 1.0 / dt
+                    self.fps_ema = inst if self.fps_ema is None else (1 - EMA_ALPHA) * self.fps_ema + EMA_ALPHA * inst
+            self._last_frame_t = now
+            self.frames += 1
+            if self.frames % self.adjust_every == 0:
+                self._adjust()
+
+    # ------------------------------------------------------------------
+    def _cost(self, every=None, level=None):
+        """Chi phí ước lượng mỗi frame (giây) với nhịp / mức độ phân giải cho trước."""
+        every = every or self.every
+        level = self.level if level is None else level
+        scale = (self.imgsz_levels[level] / self.imgsz) ** 2   # YOLO ~ tỉ lệ diện tích ảnh
+        parts = []
+        for s in STAGES:
+            ema = self.stage_ema[s]
+            if ema is None:
+                continue
+            if s in ('detect', 'behavior'):
+                ema *= scale
+            parts.append(ema / every[s])
+        if not parts:
+            return 0.0
+        return max(parts) if self.overlapped else sum(parts)
+
+    def _decide(self, action, detail, cost_before, cost_after):
+        rec = {
+            'frame': self.frames, 'action': action, 'detail': detail,
+            'cost_ms_before': round(cost_before * 1000, 2),
+            'cost_ms_after': round(cost_after * 1000, 2),
+            'budget_ms': round(self.budget_sec * 1000, 2),
+        }
+        self.decisions.append(rec)
+        if action == 'degrade':
+            self.n_degrade += 1
+        else:
+            self.n_upgrade += 1
+        if self.verbose:
+            print(f"[adaptive] {action}: {detail} (ước lượng {rec['cost_ms_before']} -> "
+                  f"{rec['cost_ms_after']} ms, ngân sách {rec['budget_ms']} ms)")
+
+    def _adjust(self):
+        # Gọi khi đang giữ self._lock
+        cost = self._cost()
+        if cost <= 0:
+            return
+        if cost > self.budget_sec * HIGH_WATER:
+            # Giảm tải: tăng nhịp của stage đang tốn nhất (theo chi phí đã chia nhịp)
+            cand = [s for s in STAGES if self.stage_ema[s] is not None and self.every[s] < EVERY_LIMITS[s][1]]
+            if cand:
+                s = max(cand, key=lambda x: self.stage_ema[x] / self.every[x])
+                new = dict(self.every); new[s] += 1
+                after = self._cost(every=new)
+                self.every = new
+                self._decide('degrade', f"{s}_every={new[s]}", cost, after)
+            elif self.level < len(self.imgsz_levels) - 1:
+                after = self._cost(level=self.level + 1)
+                self._scale_emas(self.level + 1)
+                self.level += 1
+                self._decide('degrade', f"imgsz={self.imgsz}", cost, after)
+            return
+
+        # Dư ngân sách: ưu tiên trả lại độ phân giải, rồi giảm nhịp stage rẻ nhất
+        if self.level > 0:
+            after = self._cost(level=self.level - 1)
+            if after < self.budget_sec * LOW_WATER:
+                self._scale_emas(self.level - 1)
+                self.level -= 1
+                self._decide('upgrade', f"imgsz={self.imgsz}", cost, after)
+            return
+        best = None
+        for s in STAGES:
+            if self.stage_ema[s] is None or self.every[s] <= EVERY_LIMITS[s][0]:
+                continue
+            new = dict(self.every); new[s] -= 1
+            after = self._cost(every=new)
+            if after < self.budget_sec * LOW_WATER and (best is None or after < best[2]):
+                best = (s, new, after)
+        if best is not None:
+            s, new, after = best
+            self.every = new
+            self._decide('upgrade', f"{s}_every={new[s]}", cost, after)
+
+    def _scale_emas(self, new_level):
+        scale = (self.imgsz_levels[new_level] / self.imgsz) ** 2
+        for s in ('detect', 'behavior'):
+            if self.stage_ema[s] is not None:
+                self.stage_ema[s] *= scale
+
+    # ------------------------------------------------------------------
+    def metrics(self):
+        """Toàn bộ trạng thái và quyết định của bộ điều khiển (để log / hiển thị)."""
+        with self._lock:
+            cost = self._cost()
+            return {
+                'target_fps': self.target_fps,
+                'budget_ms': round(self.budget_sec * 1000, 2),
+                'measured_fps': round(self.fps_ema, 2) if self.fps_ema else 0.0,
+                'estimated_cost_ms': round(cost * 1000, 2),
+                'load': round(cost / self.budget_sec, 3),
+                'stage_ms': {s: round(v * 1000, 2) if v is not None else None for s, v in self.stage_ema.items()},
+                'every': dict(self.every),
+                'imgsz': self.imgsz,
+                'frames': self.frames,
+                'degrades': self.n_degrade,
+                'upgrades': self.n_upgrade,
+                'decisions': list(self.decisions),
+            }
@@ -14,6 +14,7 @@ try:
     from hocsinh import HocSinhFrame
     from chitiet import ChiTietFrame
     from camera import Camera
+    from model_registry import MODELS
 except ImportError as e:
     # Cần tạo root tạm thời để hiển thị lỗi
     root_err = tk.Tk()
@@ -111,6 +112,12 @@ class MainApplication:
         
         # 3. Hiển thị trang chủ (Home)
         self.show_home()
+
+        # 4. Tải + chạy thử các model AI ở nền để lần đầu mở Camera không phải chờ
+        try:
+            MODELS.warm_up_async()
+        except Exception as e:
+            print(f"Không warm-up được model: {e}")
     
     def show_home(self):
         """Hiển thị trang chủ"""
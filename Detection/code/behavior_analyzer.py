@@ -2,20 +2,98 @@ import cv2, math, time, datetime, os
 import numpy as np
 import mediapipe as mp
 
+from media_clock import WALL_CLOCK
+from inference_backend import load_yolo
+from box_geometry import overlap_matrix, center_distance_matrix, point_distance_matrix
+
 try:
     from ultralytics import YOLO
 except Exception:
     YOLO = None
 
+BEHAVIOR_CONF_THRES = 0.35
+
+# Các vị trí có thể chứa model hành vi (thử lần lượt)
+BEHAVIOR_MODEL_CANDIDATES = [
+    os.path.join(os.path.dirname(__file__), 'best.pt'),
+    os.path.join(os.path.dirname(__file__), os.pardir, 'best.pt'),
+    os.path.join(os.path.dirname(__file__), os.pardir, 'weights', 'best.pt'),
+    r"D:\Student Behaviour Detection.v6i.yolov8\runs\detect\exp_yolov8s_first\weights\best.pt",
+    r"D:\Student Behaviour Detection.v6i.yolov8\yolov8s.pt",
+]
+
+
+def load_behavior_model(candidates=None):
+    """
+    Tải model YOLO hành vi từ vị trí đầu tiên tồn tại và load được.
+    Trả về (model, names_dict) hoặc (None, {}) nếu không có.
+    """
+    if YOLO is None:
+        return None, {}
+    for p in (candidates or BEHAVIOR_MODEL_CANDIDATES):
+        p = os.path.normpath(p)
+        if not os.path.exists(p):
+            continue
+        try:
+            model = load_yolo(p)   # CPU: ưu tiên bản INT8 (quantize_models.py) nếu có
+        except Exception:
+            continue
+        try:
+            if isinstance(model.names, dict):
+                names = model.names
+            else:
+                names = {i: n for i, n in enumerate(model.names)}
+        except Exception:
+            names = {}
+        print(f"Loaded behavior model: {p}")
+        return model, names
+    return None, {}
+
+
+def create_face_mesh():
+    """FaceMesh với cấu hình dùng trong toàn hệ thống."""
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=5, 
+        refine_landmarks=True, 
+        min_detection_confidence=0.5, 
+        min_tracking_confidence=0.5
+    )
+
+
+def parse_behavior_result(bres, behavior_names):
+    """Chuyển kết quả YOLO (1 ảnh) sang list {'label', 'conf', 'xy'}."""
+    names_list = []
+    if not bres or not getattr(bres, 'boxes', None):
+        return names_list
+    for b in list(bres.boxes):
+        try:
+            xy = b.xyxy[0].cpu().numpy()
+            x1, y1, x2, y2 = [int(v) for v in xy] 
+            conf = float(b.conf[0].cpu().numpy())
+            cls_idx = int(b.cls[0].cpu().numpy())
+            if cls_idx in behavior_names: label = behavior_names[cls_idx]
+            else: label = str(cls_idx)
+            names_list.append({'label': label, 'conf': conf, 'xy': (x1, y1, x2, y2)}) 
+        except Exception: continue 
+    return names_list
+
+
 class BieuCamAnalyzer:
-    def __init__(self):
+    def __init__(self, load_models=True, behavior_model=None, behavior_names=None, face_mesh=None,
+                 clock=None):
+        """
+        load_models=False: không tải FaceMesh / model hành vi, chỉ dùng phần logic
+        (build_analysis) với landmarks và hành vi được tính ở nơi khác (ví dụ worker process).
+        behavior_model / behavior_names / face_mesh: dùng model đã tải sẵn (dùng chung
+        giữa nhiều luồng video) thay vì tự tải.
+        clock: đồng hồ cho timer ngủ gật / phiên (mặc định thời gian thực, MediaClock khi xử lý video).
+        """
+        self.clock = clock or WALL_CLOCK
         self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=5, 
-            refine_landmarks=True, 
-            min_detection_confidence=0.5, 
-            min_tracking_confidence=0.5
-        )
+        if face_mesh is not None:
+            self.face_mesh = face_mesh
+        else:
+            self.face_mesh = create_face_mesh() if load_models else None
         self.mp_draw = mp.solutions.drawing_utils
 
         # Landmark indices
@@ -43,7 +121,7 @@ class BieuCamAnalyzer:
         self.drowsy_count = 0
         self.sleeping_count = 0
         self.yawn_count = 0
-        self.session_start_time = time.time()
+        self.session_start_time = self.clock.now()
         self.alerts_log = []
         
         # Optional behavior model (YOLO)
@@ -54,36 +132,25 @@ class BieuCamAnalyzer:
         self._behavior_frame_count = 0
         
         # Load Model
-        try:
-            if YOLO is not None:
-                cand = [
-                    os.path.join(os.path.dirname(__file__), 'best.pt'),
-                    os.path.join(os.path.dirname(__file__), os.pardir, 'best.pt'),
-                    os.path.join(os.path.dirname(__file__), os.pardir, 'weights', 'best.pt'),
-                    r"D:\Student Behaviour Detection.v6i.yolov8\runs\detect\exp_yolov8s_first\weights\best.pt",
-                    r"D:\Student Behaviour Detection.v6i.yolov8\yolov8s.pt",
-                ]
-                for p in cand:
-                    p = os.path.normpath(p)
-                    if os.path.exists(p):
-                        try:
-                            self.behavior_model = YOLO(p)
-                            try:
-                                if isinstance(self.behavior_model.names, dict):
-                                    self.behavior_names = self.behavior_model.names
-                                else:
-                                    self.behavior_names = {i: n for i, n in enumerate(self.behavior_model.names)}
-                            except Exception:
-                                self.behavior_names = {}
-                            print(f"Loaded behavior model: {p}")
-                            break
-                        except Exception:
-                            self.behavior_model = None
-        except Exception:
-            self.behavior_model = None
+        if behavior_model is not None:
+            self.behavior_model = behavior_model
+            self.behavior_names = behavior_names or {}
+        elif load_models:
+            self.behavior_model, self.behavior_names = load_behavior_model()
+
+    def reset_session(self):
+        """Xóa trạng thái theo dõi (timer mắt, bộ đếm, log) để bắt đầu phiên mới, giữ nguyên model."""
+        self.eye_closed_start_time = {}
+        self.drowsy_count = 0
+        self.sleeping_count = 0
+        self.yawn_count = 0
+        self.session_start_time = self.clock.now()
+        self.alerts_log = []
+        self.last_behaviors = []
+        self._behavior_frame_count = 0
 
     @staticmethod
-    def euclidean_dist(p1, p2): 
+    def euclidean_dist(p1, p2):
         try: return math.dist(p1, p2)
         except AttributeError: return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
 
@@ -174,63 +241,21 @@ class BieuCamAnalyzer:
         except Exception:
             return None
 
-    # --- HÀM MỚI: TÍNH TỈ LỆ CHỒNG LẤN (Overlap Ratio) ---
-    @staticmethod
-    def _calculate_overlap_ratio(face_box, behavior_box):
-        """
-        Tính tỉ lệ diện tích khuôn mặt nằm TRONG box hành vi.
-        Trả về: (Diện tích giao nhau / Diện tích khuôn mặt)
-        """
-        try:
-            fx1, fy1, fx2, fy2 = face_box
-            bx1, by1, bx2, by2 = behavior_box
-
-            # Tọa độ vùng giao nhau
-            ix1 = max(fx1, bx1)
-            iy1 = max(fy1, by1)
-            ix2 = min(fx2, bx2)
-            iy2 = min(fy2, by2)
-
-            iw = max(0, ix2 - ix1)
-            ih = max(0, iy2 - iy1)
-            intersection_area = iw * ih
-
-            # Diện tích khuôn mặt (Face Area)
-            face_area = (fx2 - fx1) * (fy2 - fy1)
-
-            if face_area <= 0: return 0.0
-            
-            # Tỉ lệ chồng lấn trên diện tích mặt
-            return intersection_area / face_area
-        except Exception:
-            return 0.0
-
     # =============================================================================
     # HÀM CHÍNH: ANALYZE FRAME (LOGIC ĐÃ SỬA ĐỔI MẠNH MẼ)
     # =============================================================================
-    def analyze_frame(self, frame, face_boxes=None):
-        t = time.time()
-        h, w, _ = frame.shape
-
-        out = {
+    def _new_result(self, t, behaviors):
+        return {
             'face_detected': False,
             'alerts': ["KHONG PHAT HIEN KHUON MAT!"],
             'statistics': { 'sleeping_count': self.sleeping_count, 'drowsy_count': self.drowsy_count, 'yawn_count': 0, 'session_time': t - self.session_start_time },
             'face_states': [], 
-            'behaviors': [] 
+            'behaviors': behaviors 
         }
-        
-        # 1. Detect behaviors (YOLO)
-        try:
-            whole_behaviors = self._detect_behaviors(frame)
-        except Exception:
-            whole_behaviors = []
-        out['behaviors'] = whole_behaviors 
 
-        if not face_boxes:
-            return out
-
-        # 2. Run FaceMesh
+    def extract_landmarks(self, frame):
+        """Chạy FaceMesh, trả về list landmarks (toạ độ pixel) cho từng khuôn mặt."""
+        h, w = frame.shape[:2]
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         results = self.face_mesh.process(rgb_frame)
         mesh_landmarks_list = []
@@ -238,87 +263,96 @@ class BieuCamAnalyzer:
             for face_landmarks in results.multi_face_landmarks:
                 landmarks = [(int(lm.x * w), int(lm.y * h)) for lm in face_landmarks.landmark]
                 mesh_landmarks_list.append(landmarks)
+        return mesh_landmarks_list
+
+    def analyze_frame(self, frame, face_boxes=None, behaviors=None, landmarks=None):
+        """
+        behaviors / landmarks: kết quả đã tính sẵn (ví dụ ở luồng/process khác).
+        Nếu None thì tự chạy model hành vi / FaceMesh trên frame.
+        """
+        t = self.clock.now()
+
+        # 1. Detect behaviors (YOLO)
+        if behaviors is None:
+            try:
+                behaviors = self._detect_behaviors(frame)
+            except Exception:
+                behaviors = []
+
+        if not face_boxes:
+            return self._new_result(t, behaviors)
+
+        # 2. Run FaceMesh
+        if landmarks is None:
+            landmarks = self.extract_landmarks(frame)
+
+        return self.build_analysis(face_boxes, behaviors, landmarks, t)
+
+    def build_analysis(self, face_boxes, whole_behaviors, mesh_landmarks_list, t=None, face_keys=None):
+        """
+        Gán hành vi + landmarks cho từng khuôn mặt và tính trạng thái (không chạy model).
+        face_keys: khóa ổn định của từng mặt (vd. track id) cho timer ngủ gật; mặc định face_{i}.
+        """
+        if t is None:
+            t = self.clock.now()
+        out = self._new_result(t, whole_behaviors)
+        if not face_boxes:
+            return out
         
         # ---------------------------------------------------------------------
         # 4. LOGIC GÁN HÀNH VI (SỬA ĐỔI: TÌM NGƯỜI PHÙ HỢP NHẤT CHO MỖI HÀNH VI)
         # ---------------------------------------------------------------------
         face_beh_map = {i: [] for i in range(len(face_boxes))}
 
-        # Duyệt qua từng hành vi được phát hiện
-        for beh in whole_behaviors:
-            try:
-                beh_box = beh.get('xy', None)
-                if beh_box is None: continue
-                beh_center = self._get_box_center(beh_box)
-                if beh_center is None: continue
-
-                best_face_idx = -1
-                max_overlap_ratio = 0.0
-                min_dist = float('inf')
-                closest_face_idx_by_dist = -1
-
-                # So sánh hành vi này với TẤT CẢ khuôn mặt để tìm người "chính chủ"
-                for i, f_box in enumerate(face_boxes):
-                    # 1. Tính tỉ lệ chồng lấn (Khuôn mặt nằm trong hành vi bao nhiêu %?)
-                    ratio = self._calculate_overlap_ratio(f_box, beh_box)
-                    
-                    if ratio > max_overlap_ratio:
-                        max_overlap_ratio = ratio
-                        best_face_idx = i  # Ứng cử viên số 1 (theo diện tích)
-
-                    # 2. Tính khoảng cách (Dự phòng)
-                    f_center = self._get_box_center(f_box)
-                    if f_center:
-                        dist = self.euclidean_dist(beh_center, f_center)
-                        if dist < min_dist:
-                            min_dist = dist
-                            closest_face_idx_by_dist = i
-
-                # --- QUYẾT ĐỊNH GÁN ---
-                # Ngưỡng 0.3: Nếu mặt nằm trong box hành vi > 30%, chắc chắn là của người đó.
-                # Ưu tiên tuyệt đối cho Overlap Ratio.
-                if max_overlap_ratio > 0.3: 
-                    # Gán cho người có tỉ lệ chồng lấn cao nhất
-                    if best_face_idx != -1:
-                        face_beh_map[best_face_idx].append(beh)
-                else:
-                    # Nếu không ai nằm trong box hành vi (hiếm gặp, hoặc hành vi ở xa),
-                    # mới dùng khoảng cách tâm.
-                    if closest_face_idx_by_dist != -1:
-                        face_beh_map[closest_face_idx_by_dist].append(beh)
-
-            except Exception as e:
-                print(f"Lỗi gán hành vi: {e}")
-                continue
+        # Tính 1 lần ma trận (mặt x hành vi) bằng box_geometry thay vì vòng lặp từng cặp
+        try:
+            behs = [b for b in whole_behaviors if b.get('xy', None) is not None]
+            if behs:
+                fb_arr = np.asarray([[int(v) for v in fb] for fb in face_boxes], dtype=np.float32)
+                bb_arr = np.asarray([[int(v) for v in b['xy']] for b in behs], dtype=np.float32)
+                # 1. Tỉ lệ chồng lấn: khuôn mặt nằm trong box hành vi bao nhiêu %
+                ratios = overlap_matrix(fb_arr, bb_arr)
+                # 2. Khoảng cách tâm (dự phòng)
+                dists = center_distance_matrix(fb_arr, bb_arr)
+                best_by_overlap = np.argmax(ratios, axis=0)
+                best_by_dist = np.argmin(dists, axis=0)
+                for j, beh in enumerate(behs):
+                    # Ngưỡng 0.3: mặt nằm trong box hành vi > 30% -> chắc chắn là của người đó
+                    # (ưu tiên tuyệt đối), nếu không mới dùng khoảng cách tâm.
+                    i = best_by_overlap[j] if ratios[best_by_overlap[j], j] > 0.3 else best_by_dist[j]
+                    face_beh_map[int(i)].append(beh)
+        except Exception as e:
+            print(f"Lỗi gán hành vi: {e}")
 
         # ---------------------------------------------------------------------
         # 5. TÍNH TOÁN TRẠNG THÁI FACE (Giữ nguyên)
         # ---------------------------------------------------------------------
         face_states = []
         face_centers = [self._get_box_center(fb) for fb in face_boxes]
+
+        # Ghép landmarks với khuôn mặt: ma trận khoảng cách (mặt x đầu mũi) tính 1 lần
+        mesh_ok, noses = [], []
+        for landmarks in mesh_landmarks_list:
+            try:
+                noses.append(tuple(landmarks[self.NOSE_TIP])[:2]); mesh_ok.append(landmarks)
+            except Exception: continue
+        centers_ok = [c if c is not None else (np.inf, np.inf) for c in face_centers]
+        lm_dists = point_distance_matrix(centers_ok, noses) if noses else None
         
         for i, fb in enumerate(face_boxes):
             face_center = face_centers[i]
             if face_center is None: continue
 
             best_landmarks = None
-            min_lm_dist = float('inf')
-            for landmarks in mesh_landmarks_list:
-                try:
-                    nose_tip = landmarks[self.NOSE_TIP]
-                    dist = self.euclidean_dist(nose_tip, face_center)
-                    if dist < min_lm_dist:
-                        min_lm_dist = dist
-                        best_landmarks = landmarks
-                except Exception: continue
-            
-            if min_lm_dist > 100: best_landmarks = None
+            if lm_dists is not None:
+                j = int(np.argmin(lm_dists[i]))
+                if lm_dists[i, j] <= 100: best_landmarks = mesh_ok[j]
 
             fs = {'eye_state': ("NO_FACE", 0), 
                   'head_orientation': {'alerts': [], 'states': ["NO_FACE"], 'angles': {}}, 
                   'attention_score': 0, 'alerts': [], 'behaviors': []}
             
-            face_id = f"face_{i}" 
+            face_id = face_keys[i] if face_keys and i < len(face_keys) else f"face_{i}"
 
             if best_landmarks:
                 try:
@@ -384,34 +418,31 @@ class BieuCamAnalyzer:
         except Exception: pass
         return frame
 
+    def run_behavior_model(self, frame, imgsz=None):
+        """Chạy model hành vi trên 1 frame (không bỏ frame). imgsz: độ phân giải đưa vào YOLO."""
+        if self.behavior_model is None: return []
+        kw = {'imgsz': imgsz} if imgsz else {}
+        bres = self.behavior_model(frame, conf=BEHAVIOR_CONF_THRES, verbose=False, **kw)[0]
+        return parse_behavior_result(bres, self.behavior_names)
+
+    def behavior_due(self):
+        """Tăng bộ đếm bỏ frame; True nếu frame này cần chạy model hành vi."""
+        self._behavior_frame_count = (self._behavior_frame_count + 1) % self.behavior_frame_skip
+        return self._behavior_frame_count == 0
+
     def _detect_behaviors(self, frame):
         beh = []
         if self.behavior_model is None: return []
         try:
-            self._behavior_frame_count = (self._behavior_frame_count + 1) % self.behavior_frame_skip
-            if self._behavior_frame_count == 0:
-                bres = self.behavior_model(frame, conf=0.35, verbose=False)[0]
-                if bres and getattr(bres, 'boxes', None):
-                    boxes = bres.boxes
-                    names_list = []
-                    for i, b in enumerate(list(boxes)):
-                        try:
-                            xy = b.xyxy[0].cpu().numpy()
-                            x1, y1, x2, y2 = [int(v) for v in xy] 
-                            conf = float(b.conf[0].cpu().numpy())
-                            cls_idx = int(b.cls[0].cpu().numpy())
-                            if cls_idx in self.behavior_names: label = self.behavior_names[cls_idx]
-                            else: label = str(cls_idx)
-                            names_list.append({'label': label, 'conf': conf, 'xy': (x1, y1, x2, y2)}) 
-                        except Exception: continue 
-                    beh = names_list
-                    self.last_behaviors = beh
+            if self.behavior_due():
+                beh = self.run_behavior_model(frame)
+                self.last_behaviors = beh
             else: beh = self.last_behaviors
         except Exception: beh = self.last_behaviors
         return beh
 
     def get_session_report(self):
-        session_time = time.time() - self.session_start_time
+        session_time = self.clock.now() - self.session_start_time
         return {
             'session_duration_minutes': session_time/60,
             'total_sleeping_episodes': self.sleeping_count,
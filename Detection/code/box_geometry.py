@@ -0,0 +1,199 @@
+# box_geometry.py
+"""
+Hình học box dạng VECTOR (NumPy): tính cả ma trận N x M trong 1 lần thay vì vòng lặp
+Python từng cặp -> chi phí gần như không đổi khi lớp học có 40+ khuôn mặt và hàng chục box
+hành vi.
+
+Box dạng xyxy (x1, y1, x2, y2). Các hàm ma trận trả về mảng (len(a), len(b)).
+    iou_matrix(a, b)              IoU
+    overlap_matrix(a, b)          diện tích giao / diện tích box a (tỉ lệ a nằm trong b)
+    center_distance_matrix(a, b)  khoảng cách tâm
+    point_distance_matrix(p, q)   khoảng cách giữa các điểm (x, y)
+    expand_boxes(boxes, m, w, h)  nới box theo tỉ lệ m, làm tròn nguyên và cắt trong ảnh w x h
+    greedy_assign / hungarian_assign: ghép cặp theo ma trận điểm (càng lớn càng tốt)
+    nms(boxes, scores, iou_thres) NMS tham lam
+
+Hungarian dùng scipy.optimize.linear_sum_assignment nếu có, nếu không dùng bản NumPy
+(Kuhn-Munkres O(n^3)) bên dưới.
+"""
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_lsa
+except Exception:
+    _scipy_lsa = None
+
+ASSIGN_GREEDY    = "greedy"
+ASSIGN_HUNGARIAN = "hungarian"
+
+
+def as_boxes(boxes):
+    """Mảng float32 (N, 4) từ list / tuple / mảng box."""
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def box_areas(boxes):
+    b = as_boxes(boxes)
+    return (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+
+def box_centers(boxes):
+    b = as_boxes(boxes)
+    return np.stack([(b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2], axis=1)
+
+
+def expand_boxes(boxes, margin, w, h):
+    """
+    Nới mỗi box margin * (rộng, cao) về mọi phía rồi cắt trong ảnh -> int64 (N, 4).
+    Làm tròn như int() của Python (về 0) để crop giống hệt cách cắt từng box trước đây.
+    """
+    b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4).astype(np.int64)
+    m = np.maximum(0, (b[:, 2:] - b[:, :2]) * margin).astype(np.int64)
+    lo = np.maximum(0, b[:, :2] - m)
+    hi = np.minimum([w, h], b[:, 2:] + m)
+    return np.concatenate([lo, hi], axis=1)
+
+
+def intersection_matrix(a, b):
+    a, b = as_boxes(a), as_boxes(b)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0]); y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2]); y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    return np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+
+def iou_matrix(a, b):
+    inter = intersection_matrix(a, b)
+    union = box_areas(a)[:, None] + box_areas(b)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def overlap_matrix(a, b):
+    """Tỉ lệ diện tích box a nằm trong box b (0 nếu box a suy biến)."""
+    inter = intersection_matrix(a, b)
+    area_a = box_areas(a)[:, None]
+    return np.where(area_a > 0, inter / np.maximum(area_a, 1e-9), 0.0)
+
+
+def point_distance_matrix(p, q):
+    p = np.asarray(p, dtype=np.float32).reshape(-1, 2)
+    q = np.asarray(q, dtype=np.float32).reshape(-1, 2)
+    return np.sqrt(((p[:, None, :] - q[None, :, :]) ** 2).sum(axis=2))
+
+
+def center_distance_matrix(a, b):
+    return point_distance_matrix(box_centers(a), box_centers(b))
+
+
+def iou_xyxy(a, b):
+    """IoU của 1 cặp box."""
+    return float(iou_matrix([a], [b])[0, 0])
+
+
+# ---------------------------------------------------------------------------
+# Ghép cặp
+# ---------------------------------------------------------------------------
+def greedy_assign(score, thres):
+    """Ghép tham lam theo điểm giảm dần (mỗi hàng / cột dùng 1 lần). Trả về list (hàng, cột)."""
+    score = np.asarray(score, dtype=np.float64)
+    if score.size == 0:
+        return []
+    rows, cols = np.unravel_index(np.argsort(-score, axis=None, kind="stable"), score.shape)
+    used_r, used_c, pairs = set(), set(), []
+    for r, c in zip(rows.tolist(), cols.tolist()):
+        if score[r, c] < thres:
+            break
+        if r in used_r or c in used_c:
+            continue
+        used_r.add(r); used_c.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+def _hungarian_numpy(cost):
+    """Kuhn-Munkres (thế vị u, v), cost (n, m) với n <= m. Trả về cột gán cho từng hàng."""
+    n, m = cost.shape
+    u = np.zeros(n + 1); v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)      # p[j]: hàng (đánh số từ 1) đang giữ cột j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            cand = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(cand)) + 1
+            delta = cand[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    cols = np.full(n, -1, dtype=np.int64)
+    for j in range(1, m + 1):
+        if p[j]:
+            cols[p[j] - 1] = j - 1
+    return cols
+
+
+def linear_assignment(cost):
+    """Ghép tối ưu (tổng cost nhỏ nhất). Trả về (rows, cols)."""
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if _scipy_lsa is not None:
+        r, c = _scipy_lsa(cost)
+        return np.asarray(r), np.asarray(c)
+    if cost.shape[0] > cost.shape[1]:
+        c, r = linear_assignment(cost.T)
+        order = np.argsort(r)
+        return r[order], c[order]
+    cols = _hungarian_numpy(cost)
+    return np.arange(cost.shape[0]), cols
+
+
+def hungarian_assign(score, thres):
+    """Ghép tối ưu (tổng điểm lớn nhất), bỏ cặp có điểm < thres. Trả về list (hàng, cột)."""
+    score = np.asarray(score, dtype=np.float64)
+    if score.size == 0:
+        return []
+    # Cặp dưới ngưỡng coi như 0 điểm để không được chọn thay cho cặp hợp lệ
+    cost = -np.where(score >= thres, score, 0.0)
+    rows, cols = linear_assignment(cost)
+    return [(int(r), int(c)) for r, c in zip(rows, cols) if score[r, c] >= thres]
+
+
+def assign(score, thres, method=ASSIGN_GREEDY):
+    if method == ASSIGN_HUNGARIAN:
+        return hungarian_assign(score, thres)
+    return greedy_assign(score, thres)
+
+
+def nms(boxes, scores, iou_thres=0.5):
+    """NMS tham lam trên box (N,4) xyxy. Trả về chỉ số các box giữ lại (theo điểm giảm dần)."""
+    boxes = as_boxes(boxes)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    order = np.argsort(-scores, kind="stable")
+    if len(order) == 0:
+        return []
+    iou = iou_matrix(boxes, boxes)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for i in order.tolist():
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= iou[i] >= iou_thres
+    return keep
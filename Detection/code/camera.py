@@ -8,7 +8,22 @@ import re
 from tkinter import Toplevel 
 from datetime import datetime 
 import traceback
-from focus_manager import FocusScoreManager # << Đã import
+from focus_manager import FocusScoreManager, calculate_rate # << Đã import
+from frame_channel import FrameChannel
+from frame_pool import FramePool
+from stage_scheduler import StageScheduler
+from adaptive_scheduler import AdaptiveController
+from contextlib import nullcontext
+from media_clock import WALL_CLOCK, MediaClock
+from video_decoder import open_capture
+from model_registry import MODELS, FACE_DETECTOR, RECOGNIZER, BEHAVIOR, FACE_MESH
+from tiled_detector import TiledFaceDetector, DETECT_FULL
+from parallel_detectors import ParallelDetectors
+from face_tracker import FaceTracker
+from box_geometry import iou_matrix
+from identity_voter import IdentityVoter
+from gallery_index import select_templates, MAX_TEMPLATES
+from gallery_store import store_exists
 
 # --- Import các file code của bạn ---
 import database 
@@ -21,7 +36,7 @@ import ai_summarizer
 
 # (Các import lõi AI của bạn)
 try:
-    from recognition_engine import RecognitionEngine, UNKNOWN_NAME, iou_xyxy
+    from recognition_engine import RecognitionEngine, UNKNOWN_NAME
     from behavior_analyzer import BieuCamAnalyzer
 except ImportError as e:
     root_err = tk.Tk()
@@ -46,10 +61,28 @@ RECOG_ENABLED   = True
 RECOG_THRES     = 0.60
 RECOG_EVERY_N   = 1
 FACE_MARGIN     = 0.15
+CLASS_PARTITION     = True  # Khi bắt đầu session: chỉ so khớp với học sinh của lớp đó
+CLASS_FALLBACK_FULL = True  # Mặt không khớp ai trong lớp -> tìm lại trên cả gallery
 DB_PATH_DEFAULT = "faces_db.npz" 
 LOOP_VIDEO      = False
 
 OUT_VIDEO_DEFAULT = "video_output.mp4" 
+
+# Kênh frame capture -> infer: 'latest' | 'drop_oldest' | 'block'
+FRAME_QUEUE_POLICY = "latest"
+FRAME_QUEUE_SIZE   = 2
+FRAME_POOL_SLOTS   = 6   # Số buffer frame cấp phát sẵn (capture/infer/GUI dùng chung)
+INFER_OVERLAP       = True  # Các stage infer chạy gối nhau (stage_scheduler.py)
+INFER_MAX_IN_FLIGHT = 3     # Số frame xử lý cùng lúc (phải < FRAME_POOL_SLOTS - 1)
+ADAPTIVE_ENABLED    = True  # Tự chỉnh nhịp dò/nhận diện/FaceMesh/hành vi + imgsz để giữ TARGET_FPS
+DETECT_MODE         = DETECT_FULL  # full / tiled / roi (tiled_detector.py): mặt nhỏ ở bàn cuối
+DETECT_TILE_SIZE    = 320    # Ô 320px trên frame 640x480 -> YOLO phóng mỗi ô lên 640 (gấp 2 lần)
+DETECT_PARALLEL     = True   # YOLO dò mặt và YOLO hành vi chạy song song trên cùng frame
+CPU_THREAD_BUDGET   = os.cpu_count() or 1             # Tổng luồng intra-op (onnx/openvino) chia cho 2 model
+# Phần chia chỉ áp được cho model chạy onnx / openvino (inference_backend.limit_threads).
+# Mặc định model hành vi là best.pt (PyTorch) -> phần 'behavior' KHÔNG có tác dụng, 2 model dùng
+# chung pool luồng torch (in cảnh báo 1 lần). Chạy quantize_models.py --behavior để có bản INT8.
+DETECTOR_THREAD_SHARES = {'detect': 0.5, 'behavior': 0.5}
 # =====================
 
 # ===================================================================
@@ -139,6 +172,11 @@ class EnrollmentDialog(simpledialog.Dialog):
 # ===================================================================
 
 
+def _face_key(track_id, index):
+    """Khóa trạng thái (điểm, timer) của khuôn mặt chưa nhận diện được: theo track, không theo vị trí."""
+    return f"track_{track_id}" if track_id is not None else f"temp_face_{index}"
+
+
 class Camera(ttk.Frame):
     """
     Đây là lớp Màn hình chính
@@ -224,12 +262,18 @@ class Camera(ttk.Frame):
         self.period = 1.0/TARGET_FPS
         self.paused = False 
         self.video_file_path = None 
-        self.frame_lock = threading.Lock(); self.latest_frame = None
+        self.frame_pool = FramePool(FRAME_POOL_SLOTS, (VIEW_H, VIEW_W, 3))
+        self._display_buf = np.empty((VIEW_H, VIEW_W, 3), np.uint8) # Bản sao GUI để vẽ
+        self.frame_channel = FrameChannel(FRAME_QUEUE_SIZE, FRAME_QUEUE_POLICY, on_drop=self._release_packet)
+        self.last_shown_seq = 0 
         self.det_lock = threading.Lock(); self.last_boxes=[]; self.last_scores=[]
         self.id_lock  = threading.Lock()
         self.last_names = [] 
         self.last_confs = []
         self.last_student_ids = [] 
+        self.last_track_ids = []
+        self.tracker = FaceTracker(uncertain_conf=RECOG_THRES)
+        self.voter = IdentityVoter(lambda embs: self.recog.predict_batch(embs))
         self.id_to_name_cache = {} 
         self.frame_count = 0
         self.force_recog_frames = 0; self.sticky = None; self.enrolling = False
@@ -238,10 +282,31 @@ class Camera(ttk.Frame):
         self.capture_thread_handle = None
         self.infer_thread_handle = None
         self.model = self.load_model(MODEL_PATH)
+        self.tiler = None
+        if DETECT_MODE != DETECT_FULL and self.model is not None:
+            self.tiler = TiledFaceDetector(self.model, conf=CONF_THRES, mode=DETECT_MODE,
+                                           tile_size=DETECT_TILE_SIZE)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.recog = RecognitionEngine(self.device, recog_thres=RECOG_THRES, face_margin=FACE_MARGIN)
-        self.analyzer = BieuCamAnalyzer()
-        self.focus_manager = FocusScoreManager(base_score=0) 
+        self.recog = MODELS.get(RECOGNIZER)   # FaceNet dùng chung; gallery được nạp lại bên dưới
+        self.recog.set_threshold(RECOG_THRES)
+        self.recog.face_margin = FACE_MARGIN
+        self.clock = WALL_CLOCK       # Webcam: thời gian thực; video: MediaClock (theo timestamp video)
+        try:
+            behavior_model, behavior_names = MODELS.get(BEHAVIOR)
+        except Exception as e:
+            print(f"Không tải được model hành vi: {e}")
+            behavior_model, behavior_names = None, {}
+        self.analyzer = BieuCamAnalyzer(load_models=False, behavior_model=behavior_model,
+                                        behavior_names=behavior_names, face_mesh=MODELS.get(FACE_MESH),
+                                        clock=self.clock)
+        # Phần luồng áp theo phiên onnx / openvino của từng model (torch thì dùng chung pool)
+        self.detectors = (ParallelDetectors(DETECTOR_THREAD_SHARES, CPU_THREAD_BUDGET,
+                                            models={'detect': self.model, 'behavior': behavior_model})
+                          if DETECT_PARALLEL else None)
+        self.focus_manager = FocusScoreManager(base_score=0, clock=self.clock) 
+        self.adaptive = None          # AdaptiveController, tạo mới mỗi lần bắt đầu stream
+        self._last_det = None
+        self._last_landmarks = None
         self.focus_logs = {}
         
         # (# === SỬA ĐỔI 1: Thêm cờ kiểm soát phân tích ===)
@@ -250,7 +315,8 @@ class Camera(ttk.Frame):
         
         # (Các biến quản lý Session giữ nguyên)
         self.current_session_id = None
-        self.session_start_time = None      # Dùng time.time() để tính duration
+        self.session_start_time = None      # Theo self.clock (video: thời gian video) để tính duration
+        self.session_clock = WALL_CLOCK     # Đồng hồ của session đang ghi (cùng đồng hồ chấm điểm)
         self.session_appeared_students = set() # Set chứa các student_id đã CÓ trong focus_record
         
         try:
@@ -259,15 +325,18 @@ class Camera(ttk.Frame):
             messagebox.showwarning("Lỗi Font", f"Không tìm thấy file font: {FONT_PATH}\n\nChữ tiếng Việt sẽ hiển thị lỗi.")
             self.pil_font = ImageFont.load_default() 
         db_path_full = os.path.join(BASE_DIR, DB_PATH_DEFAULT)
-        if os.path.exists(db_path_full):
-            try:
-                self.recog.load_db(db_path_full)
+        had_db = store_exists(db_path_full)
+        try:
+            # Luôn gắn kho gallery (tạo mới nếu chưa có) để đăng ký sau đó được ghi nối vào kho
+            self.recog.load_db(db_path_full)
+            if had_db:
                 self.set_status(f"Đã tải DB: {DB_PATH_DEFAULT} (N={len(self.recog.names)})")
-            except Exception as e:
-                messagebox.showerror("Lỗi Tải DB", f"Lỗi khi tải {DB_PATH_DEFAULT}:\n{e}")
-                self.set_status(f"Lỗi tải DB. (N={len(self.recog.names)})")
-        else:
-            self.set_status(f"Sẵn sàng. Không tìm thấy {DB_PATH_DEFAULT}. DB trống.")
+            else:
+                self.set_status(f"Sẵn sàng. Không tìm thấy {DB_PATH_DEFAULT}. DB trống.")
+        except Exception as e:
+            self.recog.clear_db()   # Engine dùng chung: bỏ gallery của lần mở trước
+            messagebox.showerror("Lỗi Tải DB", f"Lỗi khi tải {DB_PATH_DEFAULT}:\n{e}")
+            self.set_status(f"Lỗi tải DB. (N={len(self.recog.names)})")
         self.last_analysis = None
         self.after_id = None 
         self.gui_loop() # Bắt đầu vòng lặp
@@ -281,16 +350,18 @@ class Camera(ttk.Frame):
              pass 
 
     def load_model(self, path):
-        # (Hàm này giữ nguyên)
+        # Model dùng chung toàn process (model_registry.py): chỉ tải ở lần mở Camera đầu tiên
         if not os.path.exists(path):
             messagebox.showerror("Lỗi", f"Không tìm thấy model: {path}"); self.root.destroy()
             return None
-        m = YOLO(path)
-        if torch.cuda.is_available():
-            m.to("cuda"); 
-        else: self.set_status("Model CPU")
-        try: m.fuse()
-        except: pass
+        try:
+            MODELS.model_path = path
+            m = MODELS.get(FACE_DETECTOR)
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Không tải được model: {e}"); self.root.destroy()
+            return None
+        if not torch.cuda.is_available():
+            self.set_status(f"Model CPU ({getattr(m, 'backend_name', 'torch')})")
         return m
 
     def select_video_file(self):
@@ -328,11 +399,13 @@ class Camera(ttk.Frame):
                 
                 # 3. Lưu trạng thái session
                 self.current_session_id = new_session_id
-                self.session_start_time = time.time() # Dùng time.time() để tính duration
+                self.session_clock = self.clock
+                self.session_start_time = self.session_clock.now() # Cùng mốc thời gian với điểm tập trung
                 self.session_appeared_students = set()
+                self._load_class_partition(class_name)
                 
                 # Reset trình quản lý điểm cho session mới
-                self.focus_manager = FocusScoreManager(base_score=0) 
+                self.focus_manager = FocusScoreManager(base_score=0, clock=self.clock) 
                 
                 self.set_status(f"Session {self.current_session_id} ({class_name}) ĐÃ BẮT ĐẦU.")
                 return True # Bắt đầu thành công
@@ -344,11 +417,12 @@ class Camera(ttk.Frame):
         
         else:
             # 4. Người dùng chọn "Không"
+            self.recog.clear_partition()
             self.current_session_id = None
             self.session_start_time = None
             self.session_appeared_students = set()
             # Reset điểm khi chạy không ghi
-            self.focus_manager = FocusScoreManager(base_score=0)
+            self.focus_manager = FocusScoreManager(base_score=0, clock=self.clock)
             self.set_status("Đang chạy (không ghi session).")
             return True # Vẫn tiếp tục (nhưng không ghi CSDL)
 
@@ -358,9 +432,10 @@ class Camera(ttk.Frame):
             messagebox.showerror("Lỗi", "Chưa chọn file video.")
             return
         try:
-            self.cap = cv2.VideoCapture(self.video_file_path)
+            self.cap = open_capture(self.video_file_path, size=(VIEW_W, VIEW_H))
             if not self.cap.isOpened():
                 messagebox.showerror("Lỗi", f"Không mở được video: {self.video_file_path}"); return
+            self._use_clock(MediaClock())   # Timer chạy theo thời gian video (dừng khi tạm dừng)
             
             if not self.prompt_and_start_session():
                 if self.cap: self.cap.release(); self.cap = None
@@ -391,6 +466,7 @@ class Camera(ttk.Frame):
             self.btn_video.config(text="Dừng Video", state="normal") 
             self.btn_select_video.config(text="Đổi video") 
             self.btn_webcam.config(state="normal") 
+            self._reset_frame_channel()
             self.capture_thread_handle = threading.Thread(target=self.capture_thread, daemon=True)
             self.capture_thread_handle.start()
             self.infer_thread_handle = threading.Thread(target=self.infer_thread, daemon=True)
@@ -405,6 +481,13 @@ class Camera(ttk.Frame):
             messagebox.showerror("Lỗi Video", f"Lỗi không xác định khi mở video:\n{e}")
             if self.cap: self.cap.release(); self.cap = None
 
+    def _use_clock(self, clock):
+        """Đổi đồng hồ cho mọi logic theo thời gian (analyzer + FocusScoreManager)."""
+        self.clock = clock
+        self.analyzer.clock = clock
+        self.analyzer.reset_session()
+        self.focus_manager.clock = clock
+
     # (Hàm toggle_play_pause giữ nguyên)
     def toggle_play_pause(self):
         if not self.running or self.mode != 'video':
@@ -443,12 +526,13 @@ class Camera(ttk.Frame):
     # (Hàm start_webcam giữ nguyên)
     def start_webcam(self):
         try:
-            self.cap = cv2.VideoCapture(0) 
+            self.cap = open_capture(0, size=(VIEW_W, VIEW_H), flip=True)
             if not self.cap.isOpened():
-                self.cap = cv2.VideoCapture(1)
+                self.cap = open_capture(1, size=(VIEW_W, VIEW_H), flip=True)
                 if not self.cap.isOpened():
                         messagebox.showerror("Lỗi Webcam", "Không mở được webcam (đã thử index 0 và 1).")
                         return
+            self._use_clock(WALL_CLOCK)
                         
             if not self.prompt_and_start_session():
                 if self.cap: self.cap.release(); self.cap = None
@@ -467,6 +551,7 @@ class Camera(ttk.Frame):
             self.btn_webcam.config(text="Dừng Webcam") 
             self.btn_video.config(state="disabled", text="Phát Video")
             self.btn_select_video.config(state="disabled")
+            self._reset_frame_channel()
             self.capture_thread_handle = threading.Thread(target=self.capture_thread, daemon=True)
             self.capture_thread_handle.start()
             self.infer_thread_handle = threading.Thread(target=self.infer_thread, daemon=True)
@@ -485,6 +570,43 @@ class Camera(ttk.Frame):
             messagebox.showerror("Lỗi Webcam", f"Lỗi không xác định khi mở webcam:\n{e}")
             if self.cap: self.cap.release(); self.cap = None
 
+    def _reset_frame_channel(self):
+        """Tạo kênh frame mới (đánh số lại từ 1) trước khi chạy các luồng."""
+        self.frame_channel = FrameChannel(FRAME_QUEUE_SIZE, FRAME_QUEUE_POLICY, on_drop=self._release_packet)
+        self.last_shown_seq = 0
+        self._last_det = None
+        self._last_landmarks = None
+        self.tracker.reset()
+        self.voter.reset()
+        with self.id_lock:
+            self.last_track_ids = []
+        if self.tiler is not None:
+            self.tiler.reset()
+        if ADAPTIVE_ENABLED:
+            self.adaptive = AdaptiveController(
+                target_fps=TARGET_FPS, overlapped=INFER_OVERLAP,
+                every={'recog': RECOG_EVERY_N, 'behavior': self.analyzer.behavior_frame_skip})
+
+    def _release_packet(self, pkt):
+        """Trả slot của frame về pool (frame bị bỏ hoặc infer đã xử lý xong)."""
+        slot = pkt.meta.get('slot')
+        if slot is not None:
+            self.frame_pool.release(slot)
+
+    def _copy_packet_frame(self, pkt, dst=None):
+        """Copy frame của packet (không giữ tham chiếu). None nếu slot đã bị ghi đè."""
+        return self.frame_pool.copy_out(pkt.meta['slot'], pkt.meta['gen'], dst)
+
+    def _close_frame_channel(self):
+        """Đóng kênh để đánh thức infer_thread đang chờ và in số liệu của kênh."""
+        if self.frame_channel.closed:
+            return
+        self.frame_channel.close()
+        print(f"Thống kê kênh frame: {self.frame_channel.stats()}")
+        if self.adaptive is not None:
+            print(f"Thống kê điều khiển thích ứng: {self.adaptive.metrics()}")
+        print(f"Thống kê frame pool: {self.frame_pool.stats()}")
+
     # (Hàm stop giữ nguyên)
     def stop(self):
         try:
@@ -495,6 +617,7 @@ class Camera(ttk.Frame):
             traceback.print_exc()
 
         self.running = False 
+        self._close_frame_channel()
         
         # (# === SỬA ĐỔI 4: Reset cờ phân tích ===)
         self.enable_behavior_analysis = False
@@ -540,7 +663,15 @@ class Camera(ttk.Frame):
                     time.sleep(0.05) 
                     continue 
                 t0 = time.time()
-                ok, f = self.cap.read()
+                # Giải mã + scale (+ lật với webcam) thẳng vào buffer cấp phát sẵn;
+                # hết slot thì chỉ grab() để không dồn frame cũ
+                slot = self.frame_pool.acquire()
+                if slot is not None:
+                    ok = self.cap.read_into(slot.array)
+                    if not ok:
+                        self.frame_pool.release(slot)
+                else:
+                    ok = self.cap.grab()
                 if not ok:
                     if self.mode == 'video' and self.cap:
                         self.root.after(0, self._handle_video_end) 
@@ -554,10 +685,12 @@ class Camera(ttk.Frame):
                         print("Capture thread: !ok và không phải video, dừng.")
                         self.running = False 
                         break
-                if self.mode == 'webcam':
-                    f = cv2.flip(f, 1) 
-                f = cv2.resize(f, (VIEW_W, VIEW_H))
-                with self.frame_lock: self.latest_frame = f.copy()
+                if self.mode == 'video' and isinstance(self.clock, MediaClock):
+                    self.clock.update_from_capture(self.cap, fps=self.out_fps)
+                if slot is not None:
+                    seq = self.frame_channel.put(slot.view(), meta={'slot': slot, 'gen': slot.generation})
+                    if seq is None:
+                        self.frame_pool.release(slot)
                 dt = time.time()-t0
                 if dt < self.period: 
                     time.sleep(self.period-dt)
@@ -577,105 +710,234 @@ class Camera(ttk.Frame):
         except tk.TclError:
             pass 
             
+    # ----- Các stage của infer (dùng chung cho chạy tuần tự và chạy gối nhau) -----
+    def _measure(self, stage):
+        return self.adaptive.measure(stage) if self.adaptive is not None else nullcontext()
+
+    def _had_faces(self):
+        """Lần dò mặt gần nhất có thấy mặt không (chưa dò lần nào -> coi như có)."""
+        det = self._last_det
+        return det is None or len(det[0]) > 0
+
+    def _stage_detect(self, ctx):
+        if self.adaptive is not None:
+            # Frame không tới nhịp dò mặt -> dùng lại hộp của lần dò trước
+            if not self.adaptive.should_run('detect') and self._last_det is not None:
+                return self._last_det
+            with self._measure('detect'):
+                if self.tiler is not None:
+                    self._last_det = self.tiler.detect(ctx['frame'])
+                    return self._last_det
+                res = self.model(ctx['frame'], conf=CONF_THRES, imgsz=self.adaptive.imgsz, verbose=False)[0]
+        elif self.tiler is not None:
+            self._last_det = self.tiler.detect(ctx['frame'])
+            return self._last_det
+        else:
+            res = self.model(ctx['frame'], conf=CONF_THRES, verbose=False)[0]
+        boxes  = res.boxes.xyxy.cpu().numpy().astype(int) if res.boxes else np.zeros((0,4), dtype=int)
+        scores = res.boxes.conf.cpu().numpy().tolist()   if res.boxes else []
+        self._last_det = (boxes, scores)
+        return boxes, scores
+
+    def _resolve_identity(self, id_str):
+        """Kết quả FaceNet (chuỗi student_id hoặc UNKNOWN) -> (tên hiển thị, student_id)."""
+        if id_str == UNKNOWN_NAME:
+            return UNKNOWN_NAME, None
+        try:
+            student_id = int(id_str)
+        except ValueError:
+            return id_str, None
+        if student_id not in self.id_to_name_cache:
+            student_info = database.get_student_by_id(student_id)
+            if student_info:
+                self.id_to_name_cache[student_id] = student_info.get('name', f"ID_{id_str}_NO_NAME")
+            else:
+                self.id_to_name_cache[student_id] = f"ID_{id_str}_NOT_FOUND"
+        return self.id_to_name_cache[student_id], student_id
+
+    def _stage_recog(self, ctx):
+        frame = ctx['frame']
+        boxes, scores = ctx['detect']
+        self.frame_count += 1
+        # Track id ổn định cho từng box (face_tracker.py) -> danh tính gắn với track, không với vị trí
+        track_ids = self.tracker.update(boxes, scores)
+        ctx['track_ids'] = track_ids
+        force_now = self.force_recog_frames > 0
+        recog_every = self.adaptive.get_every('recog') if self.adaptive is not None else RECOG_EVERY_N
+        due = force_now or (self.frame_count % recog_every == 0)
+        if RECOG_ENABLED and len(boxes)>0:
+            # Track chưa khóa danh tính: tích lũy embedding (track mới luôn chạy ngay);
+            # track đã khóa (identity_voter.py) chỉ kiểm tra lại theo nhịp verify_every
+            fi = self.tracker.frame_idx
+            need = [i for i, tid in enumerate(track_ids) if tid is not None and (
+                force_now or (self.voter.needs_embedding(tid, fi)
+                              and (due or self.tracker.identity(tid)[0] is None)))]
+            if need:
+                with self._measure('recog'):
+                    embs, idx = self.recog.embed_batch(frame, boxes[need])
+                if embs is not None:
+                    tids = [track_ids[need[j]] for j in idx]
+                    for tid, (label, conf) in zip(tids, self.voter.observe_batch(tids, embs, fi)):
+                        name, student_id = self._resolve_identity(label)
+                        self.tracker.set_identity(tid, name, student_id, conf)
+        self.voter.prune(self.tracker.tracks)
+        names, confs, student_ids = [], [], []
+        for tid in track_ids:
+            name, conf, student_id = self.tracker.identity(tid)
+            names.append(name or UNKNOWN_NAME); confs.append(conf); student_ids.append(student_id)
+        if self.force_recog_frames>0: self.force_recog_frames-=1
+        if self.sticky is not None and len(boxes)>0 and self.sticky.get('ttl',0)>0:
+            sbox=self.sticky['box']
+            sname=self.sticky['name'] 
+            sid = self.sticky.get('id')  
+            ious = iou_matrix(boxes, [sbox])[:, 0]
+            best_i = int(np.argmax(ious)); best_iou = float(ious[best_i])
+            if best_iou>=0.3:
+                names[best_i] = sname 
+                student_ids[best_i] = sid 
+                confs[best_i] = 1.0
+                self.tracker.set_identity(track_ids[best_i], sname, sid, 1.0)
+                self.sticky['ttl']-=1
+        with self.det_lock:
+            self.last_boxes=boxes; self.last_scores=scores
+        with self.id_lock:
+            self.last_names = names
+            self.last_confs = confs
+            self.last_student_ids = student_ids 
+            self.last_track_ids = track_ids
+        return boxes
+
+    def _stage_behavior(self, ctx):
+        # Model hành vi chạy song song với dò mặt nên chưa biết số mặt của frame này:
+        # lần dò gần nhất không thấy mặt (phòng trống) -> bỏ qua, không tốn model trên cả frame
+        if not self.enable_behavior_analysis or not ctx.get('had_faces', True):
+            return None
+        try:
+            if self.adaptive is None:
+                return self.analyzer._detect_behaviors(ctx['frame'])
+            if self.analyzer.behavior_model is not None and self.adaptive.should_run('behavior'):
+                with self._measure('behavior'):
+                    self.analyzer.last_behaviors = self.analyzer.run_behavior_model(
+                        ctx['frame'], imgsz=self.adaptive.imgsz)
+            return self.analyzer.last_behaviors
+        except Exception:
+            return []
+
+    def _stage_mesh(self, ctx):
+        det = ctx.get('detect')
+        if not self.enable_behavior_analysis or det is None or len(det[0]) == 0:
+            return None
+        if self.adaptive is not None:
+            if not self.adaptive.should_run('mesh') and self._last_landmarks is not None:
+                return self._last_landmarks
+            with self._measure('mesh'):
+                self._last_landmarks = self.analyzer.extract_landmarks(ctx['frame'])
+            return self._last_landmarks
+        return self.analyzer.extract_landmarks(ctx['frame'])
+
+    def _stage_analyze(self, ctx):
+        # (# === SỬA ĐỔI 5: Chỉ chạy phân tích nếu cờ được bật ===)
+        boxes = ctx.get('recog')
+        if self.enable_behavior_analysis and boxes is not None and len(boxes) > 0 \
+                and ctx.get('mesh') is not None:
+            fb = [tuple(map(int, b)) for b in boxes]
+            keys = [_face_key(tid, i) for i, tid in enumerate(ctx.get('track_ids') or [None] * len(fb))]
+            self.last_analysis = self.analyzer.build_analysis(fb, ctx.get('behavior') or [], ctx['mesh'],
+                                                              face_keys=keys)
+        else:
+            # Nếu không bật, reset phân tích
+            self.last_analysis = None
+        if self.adaptive is not None:
+            self.adaptive.frame_done()
+        return self.last_analysis
+
+    def _infer_stages(self):
+        """(tên, hàm, phụ thuộc) theo thứ tự chạy tuần tự."""
+        detect, behavior = self._stage_detect, self._stage_behavior
+        if self.detectors is not None:
+            # Mỗi model chạy trên luồng riêng với phần luồng PyTorch riêng
+            detect = lambda ctx: self.detectors.call('detect', self._stage_detect, ctx)
+            behavior = lambda ctx: self.detectors.call('behavior', self._stage_behavior, ctx)
+        return [
+            ('detect',   detect,   ()),
+            ('recog',    self._stage_recog,    ('detect',)),
+            ('behavior', behavior, ()),
+            ('mesh',     self._stage_mesh,     ('detect',)),
+            ('analyze',  self._stage_analyze,  ('recog', 'behavior', 'mesh')),
+        ]
+
     def infer_thread(self):
         print("Infer thread đã bắt đầu.") 
+        if INFER_OVERLAP:
+            self._infer_loop_overlapped()
+        else:
+            self._infer_loop_serial()
+        print("Infer thread đã thoát.")
+
+    def _infer_loop_serial(self):
+        stages = self._infer_stages()
         while self.running:
-            frame = None 
-            if self.paused:
-                time.sleep(0.05)
-                continue
+            pkt = None
             try:
-                with self.frame_lock:
-                    if self.latest_frame is not None:
-                            frame = self.latest_frame.copy()
-                if frame is None:
-                    time.sleep(0.005)
+                # Chờ frame mới (Condition), không hỏi vòng. Frame là view chỉ đọc của slot, không copy.
+                pkt = self.frame_channel.get(timeout=0.1)
+                if pkt is None:
                     continue
                 if self.model is None:
                     time.sleep(0.01); continue
-                self.frame_count += 1
-                res = self.model(frame, conf=CONF_THRES, verbose=False)[0]
-                boxes  = res.boxes.xyxy.cpu().numpy().astype(int) if res.boxes else np.zeros((0,4), dtype=int)
-                scores = res.boxes.conf.cpu().numpy().tolist()   if res.boxes else []
-                names = []
-                confs = []
-                student_ids = []
-                force_now = self.force_recog_frames > 0
-                if RECOG_ENABLED and len(boxes)>0 and (force_now or (self.frame_count % RECOG_EVERY_N == 0)):
-                    embs, idx = self.recog.embed_batch(frame, boxes)
-                    pn, pc = [UNKNOWN_NAME]*len(boxes), [0.0]*len(boxes)
-                    if embs is not None:
-                        pred_names_or_ids, pred_confs = self.recog.predict_batch(embs)
-                        for k,i in enumerate(idx): 
-                            pn[i] = pred_names_or_ids[k]
-                            pc[i] = pred_confs[k]
-                    names = [UNKNOWN_NAME] * len(boxes)
-                    confs = pc
-                    student_ids = [None] * len(boxes)
-                    for i, id_str in enumerate(pn):
-                        if id_str != UNKNOWN_NAME:
-                            try:
-                                student_id = int(id_str) 
-                                student_ids[i] = student_id
-                                if student_id in self.id_to_name_cache:
-                                    names[i] = self.id_to_name_cache[student_id]
-                                else:
-                                    student_info = database.get_student_by_id(student_id)
-                                    if student_info:
-                                        name = student_info.get('name', f"ID_{id_str}_NO_NAME")
-                                        names[i] = name
-                                        self.id_to_name_cache[student_id] = name 
-                                    else:
-                                        names[i] = f"ID_{id_str}_NOT_FOUND" 
-                                        self.id_to_name_cache[student_id] = names[i]
-                            except ValueError:
-                                names[i] = id_str 
-                                student_ids[i] = None 
-                else:
-                    with self.id_lock:
-                        if len(self.last_names) == len(boxes):
-                            names = self.last_names[:]
-                            confs = self.last_confs[:]
-                            student_ids = self.last_student_ids[:]
-                        else:
-                            names = [UNKNOWN_NAME] * len(boxes)
-                            confs = [0.0] * len(boxes)
-                            student_ids = [None] * len(boxes)
-                if self.force_recog_frames>0: self.force_recog_frames-=1
-                if self.sticky is not None and len(boxes)>0 and self.sticky.get('ttl',0)>0:
-                    sbox=self.sticky['box']
-                    sname=self.sticky['name'] 
-                    sid = self.sticky.get('id')  
-                    best_i,best_iou=-1,0.0
-                    for i,b in enumerate(boxes):
-                        iou=iou_xyxy(tuple(b), tuple(sbox))
-                        if iou>best_iou: best_i,best_iou=i,iou
-                    if best_i>=0 and best_iou>=0.3:
-                        names[best_i] = sname 
-                        student_ids[best_i] = sid 
-                        confs[best_i] = 1.0
-                        self.sticky['ttl']-=1
-                with self.det_lock:
-                    self.last_boxes=boxes; self.last_scores=scores
-                with self.id_lock:
-                    self.last_names = names
-                    self.last_confs = confs
-                    self.last_student_ids = student_ids 
-                
-                # (# === SỬA ĐỔI 5: Chỉ chạy phân tích nếu cờ được bật ===)
-                if self.enable_behavior_analysis and len(boxes) > 0:
-                    fb = [tuple(map(int, b)) for b in boxes]
-                    self.last_analysis = self.analyzer.analyze_frame(frame, face_boxes=fb)
-                else:
-                    # Nếu không bật, reset phân tích
-                    self.last_analysis = None
-                # (======================================================)
-                    
+                ctx = {'frame': pkt.frame, 'had_faces': self._had_faces()}
+                fut_behavior = None
+                if self.detectors is not None:
+                    # Model hành vi không phụ thuộc dò mặt -> gửi đi trước, ghép lại trước 'analyze'
+                    fut_behavior = self.detectors.submit('behavior', self._stage_behavior, ctx)
+                for name, fn, _ in stages:
+                    if name == 'behavior' and fut_behavior is not None:
+                        ctx[name] = fut_behavior.result()
+                    else:
+                        ctx[name] = fn(ctx)
             except Exception as e:
                 if self.running:
                     print(f"Lỗi nghiêm trọng trong infer_thread: {e}")
                 self.last_analysis = None
-        print("Infer thread đã thoát.")
+            finally:
+                if pkt is not None:
+                    self._release_packet(pkt)
+
+    def _infer_loop_overlapped(self):
+        """
+        Các stage chạy gối nhau trên thread pool: dò mặt frame N+1 trong lúc
+        FaceMesh / model hành vi xử lý frame N. Tối đa INFER_MAX_IN_FLIGHT frame cùng lúc.
+        """
+        sched = StageScheduler(max_in_flight=INFER_MAX_IN_FLIGHT, name="infer")
+        for name, fn, after in self._infer_stages():
+            sched.add_stage(name, fn, after=after)
+
+        def on_done(fut, pkt):
+            self._release_packet(pkt)
+            errors = fut.result().get('errors')
+            if errors and self.running:
+                print(f"Lỗi nghiêm trọng trong infer_thread: {errors}")
+                self.last_analysis = None
+
+        try:
+            while self.running:
+                pkt = self.frame_channel.get(timeout=0.1)
+                if pkt is None:
+                    continue
+                if self.model is None:
+                    self._release_packet(pkt)
+                    time.sleep(0.01); continue
+                fut = sched.submit({'frame': pkt.frame, 'had_faces': self._had_faces()})
+                if fut is None:
+                    self._release_packet(pkt)
+                    continue
+                fut.add_done_callback(lambda f, p=pkt: on_done(f, p))
+        except Exception as e:
+            if self.running:
+                print(f"Lỗi nghiêm trọng trong infer_thread: {e}")
+        finally:
+            sched.close(wait=True)
+            print(f"Thống kê stage infer: {sched.stats()}")
 
 
     def gui_loop(self):
@@ -684,12 +946,6 @@ class Camera(ttk.Frame):
             is_running = self.running 
             is_paused = self.paused
             
-            frame = None
-            if is_running: 
-                with self.frame_lock:
-                    if self.latest_frame is not None:
-                        frame = self.latest_frame.copy()
-            
             # --- A. KHÔNG CHẠY (Đã bấm Stop) ---
             if not is_running:
                 self.left_panel.config(text="Sẵn sàng. Hãy 'Chọn video' hoặc 'Mở Webcam'.", image=None)
@@ -703,15 +959,24 @@ class Camera(ttk.Frame):
                     self.after_id = None
                 return 
 
-            # --- B. ĐANG CHẠY, NHƯNG BỊ PAUSE (hoặc chưa có frame) ---
-            if frame is None or is_paused:
+            # --- B. ĐANG CHẠY, NHƯNG BỊ PAUSE (hoặc chưa có frame mới) ---
+            pkt = None if is_paused else self.frame_channel.latest(after_seq=self.last_shown_seq)
+            if pkt is None:
                 if is_paused:
                     self.left_panel.config(text="Đã tạm dừng. Bấm 'Phát Video' để tiếp tục.")
-                else: 
+                elif self.last_shown_seq == 0: 
                     self.left_panel.config(text="Đang tải...", image=None)
+                # (Chưa có frame mới -> giữ nguyên ảnh đang hiển thị, không vẽ lại)
                 
                 self.after_id = self.root.after(16, self.gui_loop)
                 return 
+            self.last_shown_seq = pkt.seq
+            # GUI vẽ lên frame nên cần bản sao riêng (copy vào buffer dùng lại)
+            frame = self._copy_packet_frame(pkt, self._display_buf)
+            if frame is None:
+                # Slot đã bị capture ghi đè trong lúc copy -> bỏ qua, chờ frame sau
+                self.after_id = self.root.after(16, self.gui_loop)
+                return
 
             # --- C. ĐANG CHẠY, KHÔNG PAUSE, CÓ FRAME ---
             
@@ -719,6 +984,7 @@ class Camera(ttk.Frame):
                 boxes=list(self.last_boxes); scores=list(self.last_scores)
                 names=list(self.last_names); confs=list(self.last_confs)
                 student_ids = list(self.last_student_ids) 
+                track_ids = list(self.last_track_ids)
             
             # (Phần logic vẽ giữ nguyên)
             img_pil = None
@@ -767,13 +1033,13 @@ class Camera(ttk.Frame):
                 analysis = self.last_analysis if self.last_analysis is not None else {}
                 face_states = analysis.get('face_states', []) if isinstance(analysis, dict) else []
                 
-                current_time = time.time()
+                current_time = self.clock.now()
                 self.focus_logs.clear() 
                 
                 for i, student_id_db in enumerate(student_ids): 
                     manager_id = student_id_db
                     if manager_id is None:
-                        manager_id = f"temp_face_{i}"
+                        manager_id = _face_key(track_ids[i] if i < len(track_ids) else None, i)
                     
                     if self.current_session_id is not None and student_id_db is not None:
                         if student_id_db not in self.session_appeared_students:
@@ -810,7 +1076,8 @@ class Camera(ttk.Frame):
                 for i, name in enumerate(names):
                     student_id = student_ids[i] if i < len(student_ids) else None
                     id_str = str(student_id) if student_id else ''
-                    manager_id_for_display = student_id if student_id else f"temp_face_{i}"
+                    manager_id_for_display = student_id if student_id else \
+                        _face_key(track_ids[i] if i < len(track_ids) else None, i)
                     current_score = self.focus_manager.get_student_score(manager_id_for_display)
                     
                     # (Logic hiển thị timer)
@@ -915,6 +1182,22 @@ class Camera(ttk.Frame):
     # ===================================================================
     # >>> SỬA LỖI: CHẠY ĐỒNG BỘ VÀ KHÔNG DÙNG THREADING CHO DB/AI <<<
     # ===================================================================
+    def _load_class_partition(self, class_name):
+        """Nạp trước phần gallery của lớp học (RecognitionEngine.set_partition)."""
+        if not CLASS_PARTITION:
+            return
+        try:
+            students = database.get_students_by_class(class_name)
+            labels = [str(s['student_id']) for s in students]
+            n = self.recog.set_partition(labels, fallback=CLASS_FALLBACK_FULL)
+            for s in students:
+                self.id_to_name_cache[s['student_id']] = s.get('name', f"ID_{s['student_id']}_NO_NAME")
+            print(f"Gallery lớp {class_name}: {len(labels)} học sinh, {n} mẫu "
+                  f"(cả trường: {len(self.recog.names)})")
+        except Exception as e:
+            print(f"Không nạp được gallery theo lớp {class_name}: {e}")
+            self.recog.clear_partition()
+
     def finalize_session(self):
         """
         Lưu kết quả của session hiện tại vào CSDL MỘT CÁCH ĐỒNG BỘ. 
@@ -927,10 +1210,12 @@ class Camera(ttk.Frame):
         
         session_to_finalize = self.current_session_id
         start_time_to_finalize = self.session_start_time
+        end_time_to_finalize = self.session_clock.now()
         students_to_finalize = self.session_appeared_students.copy()
         
         # RẤT QUAN TRỌNG: Đặt lại ngay lập tức
         self.current_session_id = None 
+        self.recog.clear_partition()
         self.session_start_time = None
         self.session_appeared_students = set()
         
@@ -939,7 +1224,9 @@ class Camera(ttk.Frame):
         # 2. Cập nhật thời gian kết thúc session
         end_time = datetime.now()
         database.end_session(session_to_finalize, end_time)
-        session_duration_sec = time.time() - start_time_to_finalize if start_time_to_finalize else 0
+        # Video: thời lượng theo thời gian video (như điểm), không phụ thuộc tốc độ phát / tạm dừng
+        session_duration_sec = (end_time_to_finalize - start_time_to_finalize
+                                if start_time_to_finalize is not None else 0)
         
         if not students_to_finalize:
             print("Session kết thúc, không có học sinh.")
@@ -1004,22 +1291,7 @@ class Camera(ttk.Frame):
     # (Hàm calculate_rate giữ nguyên)
     def calculate_rate(self, score, duration_sec):
         """Tính toán rate dựa trên điểm và tỉ lệ thời gian chuẩn 45 phút."""
-        
-        STANDARD_DURATION_SEC = 45 * 60 
-        prorated_score = score
-        
-        if duration_sec > 5: 
-            scaling_factor = STANDARD_DURATION_SEC / duration_sec
-            prorated_score = score * scaling_factor
-        
-        if prorated_score >= 12:
-            return 'Cao độ'
-        elif prorated_score >= 9:
-            return 'Tốt'
-        elif prorated_score >= 5: 
-            return 'Trung bình'
-        else:
-            return 'Thấp'
+        return calculate_rate(score, duration_sec)
 
     # (Các hàm khác như enroll_one, on_click_face, toggle_record, on_close... giữ nguyên)
     def enroll_one(self):
@@ -1033,9 +1305,10 @@ class Camera(ttk.Frame):
         # (Hàm này giữ nguyên)
         if not self.enrolling: return
         x,y=int(event.x),int(event.y)
-        with self.det_lock, self.frame_lock:
+        with self.det_lock:
             boxes=list(self.last_boxes)
-            frame=self.latest_frame.copy() if self.latest_frame is not None else None
+        pkt=self.frame_channel.latest()
+        frame=self._copy_packet_frame(pkt) if pkt is not None else None
         if frame is None or len(boxes)==0:
             self.set_status("Chưa có frame/không có mặt."); self.enrolling=False; return
         chosen, area=-1, -1
@@ -1047,6 +1320,10 @@ class Camera(ttk.Frame):
             self.set_status("Không trúng khuôn mặt nào."); return
         self.enrolling = False 
         box = boxes[chosen]
+        # Chụp lại embedding gần nhất của track được chọn trước khi mở hộp thoại (track có thể mất)
+        with self.id_lock:
+            tid = self.last_track_ids[chosen] if chosen < len(self.last_track_ids) else None
+        track_embs = self.voter.track_embeddings(tid) if tid is not None else None
         dialog = EnrollmentDialog(self.root)
         info = dialog.result 
         if info is None: 
@@ -1091,16 +1368,22 @@ class Camera(ttk.Frame):
         if not ok:
            messagebox.showwarning("Lỗi CSDL", f"Lỗi khi liên kết embedding: {msg}")
            
-        self.recog.add_face(embedding_name, face_embedding) 
-        
+        # Mẫu phụ: các góc mặt khác của cùng track mà identity_voter vừa thấy (chỉ giữ mẫu giống
+        # mặt lúc bấm đăng ký, chọn các mẫu khác nhau nhất)
+        templates = face_embedding[None, :]
+        if track_embs is not None and len(track_embs):
+            extra = track_embs[track_embs @ face_embedding >= RECOG_THRES]
+            templates = select_templates(extra, MAX_TEMPLATES, first=face_embedding)
         try:
-            db_path_full = os.path.join(BASE_DIR, DB_PATH_DEFAULT)
-            self.recog.save_db(db_path_full) 
+            # Ghi nối vào kho gallery (gallery_store.py), không ghi lại cả file
+            self.recog.add_templates(embedding_name, templates, in_partition=True)   # HS mới thuộc lớp đang học
+            if self.recog.store is None:
+                self.recog.save_db(os.path.join(BASE_DIR, DB_PATH_DEFAULT))
             self.set_status(f"Đã đăng ký & lưu: {name} (ID: {new_student_id}) (gallery={len(self.recog.names)})")
             self.id_to_name_cache[new_student_id] = name
         except Exception as e:
-            messagebox.showerror("Lỗi Lưu DB", f"Đăng ký thành công, nhưng lỗi khi lưu file .npz:\n{e}")
-            self.set_status(f"Đăng ký: {name} (ID: {new_student_id}) - LỖI LƯU FILE .NPZ")
+            messagebox.showerror("Lỗi Lưu DB", f"Đăng ký thành công, nhưng lỗi khi lưu kho gallery:\n{e}")
+            self.set_status(f"Đăng ký: {name} (ID: {new_student_id}) - LỖI LƯU GALLERY")
             
         self.sticky={'box':box, 'name':name, 'id': new_student_id, 'ttl':30}
         self.force_recog_frames=20
@@ -1161,6 +1444,7 @@ class Camera(ttk.Frame):
                 traceback.print_exc()
 
             self.running = False 
+            self._close_frame_channel()
             
             # (# === SỬA ĐỔI 6: Đảm bảo cờ tắt khi đóng ===)
             self.enable_behavior_analysis = False
@@ -1188,6 +1472,10 @@ class Camera(ttk.Frame):
                 self.cap.release()
                 self.cap = None
                 print("- Đã giải phóng VideoCapture.")
+            if getattr(self, 'detectors', None) is not None:
+                print(f"- Thống kê dò song song: {self.detectors.stats()}")
+                self.detectors.close()
+                self.detectors = None
             self._close_writer()
             print("- Đã đóng VideoWriter (nếu có).")
             print("Camera.on_close() hoàn tất an toàn.")
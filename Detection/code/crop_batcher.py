@@ -0,0 +1,48 @@
+# crop_batcher.py
+"""
+Cắt + resize khuôn mặt của cả batch vào 1 bộ đệm NHWC uint8 cấp phát sẵn cho FaceNet.
+
+Thay cho vòng lặp từng box (cắt, cvtColor, resize, torch.from_numpy, permute, float, chuẩn hóa
+rồi torch.stack): box được nới / cắt trong ảnh bằng box_geometry.expand_boxes (vector),
+cv2.resize ghi thẳng vào hàng của bộ đệm (không cấp phát), đổi BGR -> RGB và chuẩn hóa
+làm 1 lần cho cả batch ở phía torch (recognition_engine.py).
+Bộ đệm tăng gấp đôi khi thiếu chỗ và được dùng lại giữa các frame.
+
+Ví dụ:
+    batcher = CropBatcher(out_size=160)
+    buf, owners = batcher.fill([(bgr, boxes)], margin=0.15)   # buf (B, 160, 160, 3) uint8 BGR
+"""
+import cv2
+import numpy as np
+
+from box_geometry import expand_boxes
+
+
+class CropBatcher:
+    def __init__(self, out_size=160):
+        self.out_size = int(out_size)
+        self._buf = np.zeros((0, self.out_size, self.out_size, 3), dtype=np.uint8)
+
+    def _reserve(self, n):
+        if n > len(self._buf):
+            self._buf = np.zeros((max(n, 2 * len(self._buf), 16), self.out_size, self.out_size, 3), dtype=np.uint8)
+
+    def fill(self, items, margin=0.15):
+        """
+        items: list (bgr, boxes). Trả về (buf[:B] — view của bộ đệm, bị ghi đè ở lần gọi sau;
+        owners [(chỉ số item, chỉ số box)]). Box rỗng sau khi cắt trong ảnh bị bỏ qua.
+        """
+        regions, owners = [], []
+        for k, (bgr, boxes) in enumerate(items):
+            if len(boxes) == 0:
+                continue
+            h, w = bgr.shape[:2]
+            r = expand_boxes(boxes, margin, w, h)
+            for i in np.flatnonzero((r[:, 2] > r[:, 0]) & (r[:, 3] > r[:, 1])).tolist():
+                regions.append((bgr, r[i]))
+                owners.append((k, i))
+        self._reserve(len(regions))
+        size = (self.out_size, self.out_size)
+        for row, (bgr, (x1, y1, x2, y2)) in enumerate(regions):
+            cv2.resize(bgr[y1:y2, x1:x2], size, dst=self._buf[row])
+        return self._buf[:len(regions)], owners
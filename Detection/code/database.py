@@ -143,6 +143,23 @@ def get_all_students():
         if cursor: cursor.close()
         if conn: conn.close()
 
+def get_students_by_class(class_name):
+    """Lấy học sinh của 1 lớp (dùng index idx_student_class)."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if conn is None: return []
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM student WHERE class_name = %s ORDER BY name", (class_name,))
+        return cursor.fetchall()
+    except Error as e:
+        print(f"Lỗi khi lấy học sinh lớp {class_name}: {e}")
+        return []
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
 def get_student_by_id(student_db_id):
     """Lấy một học sinh bằng ID (thay thế Student.objects.get(pk=...))."""
     conn = None
@@ -225,7 +242,7 @@ def update_student_avatar(student_db_id, avartar_url):
 
 def delete_student(student_db_id):
     """Xóa học sinh - CHỈ xóa dữ liệu nhận diện khuôn mặt.
-    - XÓA: face_embedding (database) và faces_db.npz (file)
+    - XÓA: face_embedding (database) và mẫu trong kho gallery faces_db.store (gallery_store.py)
     - GIỮ: student, focus_record, ảnh trong faces_db_images/"""
     conn = None
     cursor = None
@@ -244,46 +261,20 @@ def delete_student(student_db_id):
         
         # 4. KHÔNG xóa ảnh - giữ lại ảnh trong faces_db_images/
         
-        # 5. Xóa face embedding trong file faces_db.npz
-        import numpy as np
+        # 5. Xóa face embedding trong kho gallery (gallery_store.py - cùng kho RecognitionEngine dùng,
+        #    gallery đang chạy trong Camera cũng được báo để bỏ mẫu)
         import os
+        from gallery_store import open_store, store_exists
         npz_path = os.path.join(os.path.dirname(__file__), 'faces_db.npz')
-        if os.path.exists(npz_path):
+        if store_exists(npz_path):
             try:
-                # Load file npz
-                data = np.load(npz_path, allow_pickle=True)
-                
-                # Lấy các mảng hiện tại
-                embeddings = data.get('embeddings', np.array([]))
-                labels = data.get('labels', np.array([]))
-                names = data.get('names', np.array([]))
-                
-                # Tìm index của student_id cần xóa
-                if len(labels) > 0:
-                    # Chuyển labels về list để dễ xử lý
-                    labels_list = labels.tolist()
-                    
-                    # [SỬA] Đảm bảo so sánh chuỗi với chuỗi
-                    student_id_str = str(student_db_id)
-                    indices_to_keep = [i for i, label in enumerate(labels_list) if str(label) != student_id_str]
-                    
-                    if len(indices_to_keep) < len(labels_list):
-                        # Có dữ liệu cần xóa
-                        new_embeddings = embeddings[indices_to_keep]
-                        new_labels = labels[indices_to_keep]
-                        new_names = names[indices_to_keep]
-                        
-                        # Lưu lại file npz
-                        np.savez(npz_path, 
-                                 embeddings=new_embeddings, 
-                                 labels=new_labels, 
-                                 names=new_names)
-                        print(f"Đã xóa {len(labels_list) - len(indices_to_keep)} face embedding(s) của {student_db_id} khỏi faces_db.npz")
-                    else:
-                        print(f"Không tìm thấy face embedding của {student_db_id} trong faces_db.npz")
-                        
+                n = open_store(npz_path).delete(str(student_db_id))
+                if n:
+                    print(f"Đã xóa {n} face embedding(s) của {student_db_id} khỏi gallery")
+                else:
+                    print(f"Không tìm thấy face embedding của {student_db_id} trong gallery")
             except Exception as e:
-                print(f"Lỗi khi xóa face embedding trong npz: {e}")
+                print(f"Lỗi khi xóa face embedding trong gallery: {e}")
         
         return True, "Đã xóa dữ liệu nhận diện khuôn mặt (giữ lại thông tin học sinh)"
         
@@ -0,0 +1,175 @@
+# face_tracker.py
+"""
+Theo dõi khuôn mặt qua các frame (multi-object tracking) để danh tính / điểm / timer gắn với
+1 TRACK ID ổn định thay vì vị trí trong list box của YOLO.
+
+- Mỗi track có bộ lọc Kalman vận tốc không đổi trên (cx, cy, w, h) -> dự đoán vị trí ở frame sau.
+- Ghép kiểu ByteTrack:
+    1. box điểm cao (>= high_thres) ghép với mọi track theo IoU với vị trí dự đoán;
+    2. box điểm thấp ghép với các track CÒN LẠI (giữ track khi mặt bị che / mờ tạm thời);
+    3. box điểm cao chưa ghép -> track mới; track mất quá max_age frame -> xóa.
+- Danh tính (tên, student_id, độ tin cậy) lưu trên track. FaceNet chỉ cần chạy cho track mới,
+  track chưa chắc chắn (conf < uncertain_conf) hoặc đã lâu chưa kiểm tra lại (reembed_every).
+
+Ví dụ:
+    tids = tracker.update(boxes, scores)               # list track id, cùng thứ tự với boxes
+    need = [i for i, t in enumerate(tids) if tracker.needs_embedding(t)]
+    ... embed boxes[need] ... tracker.set_identity(tids[i], name, student_id, conf)
+"""
+import numpy as np
+
+from box_geometry import iou_matrix, assign, ASSIGN_GREEDY
+
+HIGH_THRES     = 0.6    # Điểm YOLO của box "tin cậy cao"
+MATCH_IOU      = 0.3    # IoU tối thiểu khi ghép box điểm cao
+LOW_MATCH_IOU  = 0.5    # IoU tối thiểu khi ghép box điểm thấp (chặt hơn)
+MAX_AGE        = 30     # Số frame giữ track khi không thấy mặt
+REEMBED_EVERY  = 30     # Track đã chắc chắn vẫn được nhận diện lại mỗi N frame
+UNCERTAIN_CONF = 0.60   # Độ tin cậy nhận diện dưới mức này -> nhận diện lại ở frame sau
+ASSIGN_METHOD  = ASSIGN_GREEDY   # hoặc "hungarian" (box_geometry)
+
+
+class KalmanBoxFilter:
+    """Kalman vận tốc không đổi, trạng thái [cx, cy, w, h, vx, vy, vw, vh]."""
+    def __init__(self, box):
+        x1, y1, x2, y2 = [float(v) for v in box]
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=np.float64)
+        self.F = np.eye(8); self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8)
+        size = max(x2 - x1, y2 - y1, 1.0)
+        self.P = np.diag([size, size, size, size, 10 * size, 10 * size, 10 * size, 10 * size]) ** 2 * 0.01
+        self.Q = np.diag([1, 1, 1, 1, 0.5, 0.5, 0.5, 0.5]) * (0.05 * size) ** 2
+        self.R = np.eye(4) * (0.1 * size) ** 2
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return self.box()
+
+    def update(self, box):
+        x1, y1, x2, y2 = [float(v) for v in box]
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+class Track:
+    def __init__(self, track_id, box, score, frame_idx):
+        self.track_id = track_id
+        self.kf = KalmanBoxFilter(box)
+        self.box = np.asarray(box, dtype=np.float64)
+        self.score = float(score)
+        self.hits = 1
+        self.missed = 0
+        self.start_frame = frame_idx
+        # Danh tính
+        self.name = None
+        self.student_id = None
+        self.conf = 0.0
+        self.last_embed_frame = None
+
+
+class FaceTracker:
+    """Gán track id ổn định cho box khuôn mặt qua các frame."""
+    def __init__(self, high_thres=HIGH_THRES, match_iou=MATCH_IOU, low_match_iou=LOW_MATCH_IOU,
+                 max_age=MAX_AGE, reembed_every=REEMBED_EVERY, uncertain_conf=UNCERTAIN_CONF,
+                 assign_method=ASSIGN_METHOD):
+        self.high_thres = high_thres
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.max_age = max_age
+        self.reembed_every = reembed_every
+        self.uncertain_conf = uncertain_conf
+        self.assign_method = assign_method
+        self.reset()
+
+    def reset(self):
+        self.tracks = {}
+        self._next_id = 1
+        self.frame_idx = 0
+        self.n_embed_requests = 0
+
+    def update(self, boxes, scores):
+        """
+        Cập nhật với box của frame hiện tại. Trả về list track id cùng thứ tự boxes
+        (None cho box điểm thấp không ghép được track nào).
+        """
+        self.frame_idx += 1
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        if len(scores) != len(boxes):
+            scores = np.ones(len(boxes))
+        ids = list(self.tracks)
+        predicted = np.array([self.tracks[t].kf.predict() for t in ids]).reshape(-1, 4)
+        result = [None] * len(boxes)
+
+        high = [i for i in range(len(boxes)) if scores[i] >= self.high_thres]
+        low = [i for i in range(len(boxes)) if scores[i] < self.high_thres]
+
+        # 1. Box điểm cao <-> mọi track
+        free_tracks = list(range(len(ids)))
+        for r, c in assign(iou_matrix(predicted, boxes[high]), self.match_iou, self.assign_method):
+            result[high[c]] = ids[r]
+            free_tracks.remove(r)
+        # 2. Box điểm thấp <-> track còn lại
+        if low and free_tracks:
+            for r, c in assign(iou_matrix(predicted[free_tracks], boxes[low]), self.low_match_iou,
+                               self.assign_method):
+                result[low[c]] = ids[free_tracks[r]]
+            free_tracks = [t for k, t in enumerate(free_tracks) if ids[t] not in result]
+
+        for i, tid in enumerate(result):
+            if tid is None:
+                continue
+            tr = self.tracks[tid]
+            tr.kf.update(boxes[i]); tr.box = boxes[i]; tr.score = float(scores[i])
+            tr.hits += 1; tr.missed = 0
+        # 3. Box điểm cao chưa ghép -> track mới
+        for i in high:
+            if result[i] is None:
+                tid = self._next_id; self._next_id += 1
+                self.tracks[tid] = Track(tid, boxes[i], scores[i], self.frame_idx)
+                result[i] = tid
+        # 4. Track không thấy -> tăng tuổi, quá max_age thì xóa
+        for r in free_tracks:
+            tr = self.tracks[ids[r]]
+            tr.missed += 1
+            if tr.missed > self.max_age:
+                del self.tracks[ids[r]]
+        return result
+
+    # ------------------------------------------------------------------
+    def needs_embedding(self, track_id):
+        """Track mới / chưa chắc chắn / lâu chưa nhận diện lại -> cần chạy FaceNet."""
+        if track_id is None or track_id not in self.tracks:
+            return True
+        tr = self.tracks[track_id]
+        if tr.last_embed_frame is None or tr.conf < self.uncertain_conf:
+            return True
+        return self.frame_idx - tr.last_embed_frame >= self.reembed_every
+
+    def set_identity(self, track_id, name, student_id, conf):
+        tr = self.tracks.get(track_id)
+        if tr is None:
+            return
+        tr.name, tr.student_id, tr.conf = name, student_id, float(conf)
+        tr.last_embed_frame = self.frame_idx
+        self.n_embed_requests += 1
+
+    def identity(self, track_id):
+        """(tên, độ tin cậy, student_id) của track; (None, 0.0, None) nếu chưa biết."""
+        tr = self.tracks.get(track_id)
+        if tr is None:
+            return None, 0.0, None
+        return tr.name, tr.conf, tr.student_id
+
+    def stats(self):
+        return {'active_tracks': len(self.tracks), 'next_id': self._next_id,
+                'frames': self.frame_idx, 'embeddings': self.n_embed_requests}
@@ -1,4 +1,4 @@
-import time
+from media_clock import WALL_CLOCK
 
 # =============================================================================
 # 1. CẤU HÌNH HẰNG SỐ (GIỮ NGUYÊN THEO YÊU CẦU)
@@ -54,39 +54,45 @@ class FocusScoreManager:
     """
     Quản lý điểm tập trung, xử lý logic cộng/trừ điểm và timer hành vi.
     """
-    def __init__(self, base_score=10):
+    def __init__(self, base_score=10, clock=None):
+        """clock: đồng hồ cho mọi timer (mặc định thời gian thực, MediaClock khi xử lý video)."""
         self.students = {}
         self.base_score = base_score
+        self.clock = clock or WALL_CLOCK
         
         self.ALL_BEHAVIORS = ALL_BEHAVIOR_NAMES
         self.GOOD_BEHAVIORS = GOOD_BEHAVIORS
         self.BAD_BEHAVIORS_FOR_RESET = BAD_BEHAVIORS_FOR_RESET
 
-    def _get_student_state(self, student_id):
+    def _get_student_state(self, student_id, current_time=None):
         """
         Khởi tạo hoặc lấy trạng thái của học sinh.
+        current_time: mốc thời gian của lần cập nhật đầu tiên (mặc định self.clock.now()).
+        Khi chạy offline, truyền thời gian của video để delta_time không bị âm.
         """
         if student_id not in self.students:
-            current_time = time.time() 
+            if current_time is None:
+                current_time = self.clock.now()
             new_state = {
                 'score': self.base_score,
                 'last_update_time': current_time, 
                 
                 # --- Timer cho Quy tắc CỘNG điểm ---
-                'last_hand_raise_time': 0.0,
+                'last_hand_raise_time': None,
                 'is_currently_raising_hand': False,
                 'good_focus_cumulative_time': 0.0, # Timer cộng dồn 5 phút
                 
                 # --- Timer cho Quy tắc TRỪ điểm ---
-                'phone_start_time': 0.0,
-                'last_phone_penalty_time': 0.0,
+                # None = chưa bắt đầu (không dùng 0 vì 0 là mốc hợp lệ của MediaClock)
+                'phone_start_time': None,
+                'last_phone_penalty_time': None,
                 
-                'head_turn_start_time': 0.0,
-                'last_head_turn_penalty_time': 0.0,
+                'head_turn_start_time': None,
+                'last_head_turn_penalty_time': None,
                 
-                'sleepy_eyes_start_time': 0.0,   # Timer xác định có đang ngủ gật không
-                'sleep_pose_start_time': 0.0,    # Timer tính thời gian phạt ngủ
-                'last_sleep_penalty_time': 0.0,
+                'sleepy_eyes_start_time': None,   # Timer xác định có đang ngủ gật không
+                'sleep_pose_start_time': None,    # Timer tính thời gian phạt ngủ
+                'last_sleep_penalty_time': None,
                 
                 # Logs cho AI summary
                 'session_logs': [] 
@@ -134,9 +140,9 @@ class FocusScoreManager:
     def update_student_score(self, student_id, behaviors_list, head_state, eye_state, current_time=None):
         
         if current_time is None:
-            current_time = time.time()
+            current_time = self.clock.now()
             
-        state = self._get_student_state(student_id)
+        state = self._get_student_state(student_id, current_time)
         new_points = 0
         
         # Danh sách chứa (timestamp, message, point_change)
@@ -169,12 +175,12 @@ class FocusScoreManager:
         is_confirmed_sleepy = False
         
         if is_sleepy_eyes_event:
-            if state['sleepy_eyes_start_time'] == 0:
+            if state['sleepy_eyes_start_time'] is None:
                 state['sleepy_eyes_start_time'] = current_time
             elif current_time - state['sleepy_eyes_start_time'] > SLEEPY_EYES_TRIGGER_TIME:
                 is_confirmed_sleepy = True # Nhắm mắt quá 60s -> Xác nhận ngủ
         else:
-            state['sleepy_eyes_start_time'] = 0 # Mở mắt -> Reset timer nhắm mắt
+            state['sleepy_eyes_start_time'] = None # Mở mắt -> Reset timer nhắm mắt
             
         is_bend_event = any(b in behavior_labels for b in ['sleep', 'bend'])
         is_sleep_pose = is_bend_event or is_confirmed_sleepy
@@ -225,7 +231,8 @@ class FocusScoreManager:
         # --- BƯỚC 5: XỬ LÝ CỘNG ĐIỂM GIƠ TAY ---
         if 'hand-raising' in behavior_labels:
             if not state['is_currently_raising_hand']: # Chỉ tính khi bắt đầu giơ
-                if current_time - state['last_hand_raise_time'] > HAND_RAISE_COOLDOWN:
+                if state['last_hand_raise_time'] is None or \
+                   current_time - state['last_hand_raise_time'] > HAND_RAISE_COOLDOWN:
                     new_points += 1
                     log_tuples.append((current_time, "+1 (Phát biểu)", 1))
                     state['last_hand_raise_time'] = current_time
@@ -241,7 +248,7 @@ class FocusScoreManager:
 
         # 6.1. Dùng điện thoại
         if is_phone:
-            if state['phone_start_time'] == 0:
+            if state['phone_start_time'] is None:
                 # Bắt đầu vi phạm -> Phạt ngay (First Penalty)
                 state['phone_start_time'] = current_time
                 state['last_phone_penalty_time'] = current_time
@@ -255,12 +262,12 @@ class FocusScoreManager:
                     state['last_phone_penalty_time'] = current_time
         else:
             # Ngừng vi phạm -> Reset timer
-            state['phone_start_time'] = 0
-            state['last_phone_penalty_time'] = 0
+            state['phone_start_time'] = None
+            state['last_phone_penalty_time'] = None
 
         # 6.2. Quay đầu (Head Turn)
         if is_head_turn:
-            if state['head_turn_start_time'] == 0:
+            if state['head_turn_start_time'] is None:
                 state['head_turn_start_time'] = current_time
                 state['last_head_turn_penalty_time'] = current_time
             else:
@@ -280,12 +287,12 @@ class FocusScoreManager:
                     log_tuples.append((current_time, f"{HEAD_TURN_POINTS} (Vẫn quay đầu 2p)", HEAD_TURN_POINTS))
                     state['last_head_turn_penalty_time'] = current_time
         else:
-            state['head_turn_start_time'] = 0
-            state['last_head_turn_penalty_time'] = 0
+            state['head_turn_start_time'] = None
+            state['last_head_turn_penalty_time'] = None
 
         # 6.3. Ngủ (Sleep/Bend/Closed Eyes)
         if is_sleep_pose:
-            if state['sleep_pose_start_time'] == 0:
+            if state['sleep_pose_start_time'] is None:
                 state['sleep_pose_start_time'] = current_time
                 state['last_sleep_penalty_time'] = current_time
             else:
@@ -305,8 +312,8 @@ class FocusScoreManager:
                     log_tuples.append((current_time, f"{SLEEP_POINTS} (Vẫn ngủ 3p)", SLEEP_POINTS))
                     state['last_sleep_penalty_time'] = current_time
         else:
-            state['sleep_pose_start_time'] = 0
-            state['last_sleep_penalty_time'] = 0
+            state['sleep_pose_start_time'] = None
+            state['last_sleep_penalty_time'] = None
 
 
         # --- BƯỚC 7: CẬP NHẬT ĐIỂM VÀ TRẢ VỀ KẾT QUẢ ---
@@ -320,4 +327,28 @@ class FocusScoreManager:
         # Chỉ lấy nội dung log để hiển thị UI ngay lập tức
         log_messages = [msg for ts, msg, change in log_tuples]
         
-        return new_points, log_messages
\ No newline at end of file
+        return new_points, log_messages
+
+
+# =============================================================================
+# 3. XẾP LOẠI (Dùng chung cho màn hình Camera và engine offline)
+# =============================================================================
+
+STANDARD_DURATION_SEC = 45 * 60
+
+def calculate_rate(score, duration_sec):
+    """Tính toán rate dựa trên điểm và tỉ lệ thời gian chuẩn 45 phút."""
+    prorated_score = score
+    
+    if duration_sec > 5: 
+        scaling_factor = STANDARD_DURATION_SEC / duration_sec
+        prorated_score = score * scaling_factor
+    
+    if prorated_score >= 12:
+        return 'Cao độ'
+    elif prorated_score >= 9:
+        return 'Tốt'
+    elif prorated_score >= 5: 
+        return 'Trung bình'
+    else:
+        return 'Thấp'
@@ -0,0 +1,166 @@
+# frame_channel.py
+"""
+Kênh truyền frame giữa các luồng (capture -> infer / GUI).
+
+Thay cho việc ghi đè self.latest_frame rồi để các luồng khác hỏi vòng (sleep 5ms):
+- Mỗi frame được đánh số thứ tự tăng dần (seq), không xử lý trùng, không bỏ sót âm thầm.
+- Luồng đọc được đánh thức bằng Condition khi có frame mới.
+- Chính sách khi đầy: 'latest' (chỉ giữ frame mới nhất), 'drop_oldest', 'block'.
+- Đếm số frame produced / consumed / dropped và độ trễ từ lúc put() tới lúc get().
+"""
+import time
+import threading
+from collections import deque
+
+POLICY_LATEST_ONLY = "latest"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_BLOCK       = "block"
+POLICIES = (POLICY_LATEST_ONLY, POLICY_DROP_OLDEST, POLICY_BLOCK)
+
+
+class FramePacket:
+    """Một frame kèm số thứ tự, thời điểm capture và thông tin phụ (meta)."""
+    __slots__ = ('seq', 'frame', 't_capture', 'meta')
+
+    def __init__(self, seq, frame, t_capture, meta=None):
+        self.seq = seq
+        self.frame = frame
+        self.t_capture = t_capture
+        self.meta = meta if meta is not None else {}
+
+    def __repr__(self):
+        return f"FramePacket(seq={self.seq}, t_capture={self.t_capture:.3f})"
+
+
+class FrameChannel:
+    """
+    Hàng đợi frame có giới hạn, an toàn luồng.
+
+    capacity: số frame tối đa đang chờ (với 'latest' luôn là 1).
+    policy:   'latest' | 'drop_oldest' | 'block'.
+    on_drop:  callback(packet) khi 1 frame bị bỏ (ví dụ để trả buffer về pool).
+    """
+    def __init__(self, capacity=1, policy=POLICY_LATEST_ONLY, on_drop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Chính sách không hợp lệ: {policy} (chọn trong {POLICIES})")
+        self.policy = policy
+        self.capacity = 1 if policy == POLICY_LATEST_ONLY else max(1, int(capacity))
+        self.on_drop = on_drop
+
+        self._cond = threading.Condition(threading.Lock())
+        self._queue = deque()
+        self._latest = None     # Frame mới nhất đã put (cho GUI xem, không tiêu thụ)
+        self._next_seq = 1
+        self._closed = False
+
+        # Bộ đếm
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+        self._lat_sum = 0.0
+        self._lat_max = 0.0
+
+    # ------------------------------------------------------------------
+    def put(self, frame, meta=None, t_capture=None, timeout=None):
+        """
+        Đưa 1 frame vào kênh. Trả về seq của frame, hoặc None nếu kênh đã đóng
+        (hay hết timeout với chính sách 'block').
+        """
+        dropped = []
+        with self._cond:
+            if self._closed:
+                return None
+            if self.policy == POLICY_BLOCK:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while len(self._queue) >= self.capacity and not self._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return None
+            else:
+                while len(self._queue) >= self.capacity:
+                    dropped.append(self._queue.popleft())
+                    self.dropped += 1
+
+            pkt = FramePacket(self._next_seq, frame,
+                              t_capture if t_capture is not None else time.monotonic(), meta)
+            self._next_seq += 1
+            self._queue.append(pkt)
+            self._latest = pkt
+            self.produced += 1
+            self._cond.notify_all()
+
+        if self.on_drop is not None:
+            for p in dropped:
+                self.on_drop(p)
+        return pkt.seq
+
+    def get(self, timeout=None):
+        """
+        Lấy (tiêu thụ) frame cũ nhất đang chờ. Chờ trên Condition tới khi có frame,
+        kênh bị đóng hoặc hết timeout -> trả về None.
+        """
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._queue and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if not self._queue:
+                return None
+            pkt = self._queue.popleft()
+            self.consumed += 1
+            lat = time.monotonic() - pkt.t_capture
+            self._lat_sum += lat
+            if lat > self._lat_max:
+                self._lat_max = lat
+            self._cond.notify_all()   # Báo cho put() đang bị 'block'
+            return pkt
+
+    def latest(self, after_seq=0):
+        """
+        Xem frame mới nhất đã put mà KHÔNG tiêu thụ (dùng cho GUI).
+        Trả về None nếu chưa có frame nào mới hơn after_seq.
+        """
+        with self._cond:
+            pkt = self._latest
+        if pkt is None or pkt.seq <= after_seq:
+            return None
+        return pkt
+
+    def close(self):
+        """Đóng kênh, đánh thức mọi luồng đang chờ. Frame còn lại bị bỏ."""
+        with self._cond:
+            self._closed = True
+            left = list(self._queue)
+            self._queue.clear()
+            self.dropped += len(left)
+            self._cond.notify_all()
+        if self.on_drop is not None:
+            for p in left:
+                self.on_drop(p)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """Số liệu của kênh: produced / consumed / dropped / đang chờ / độ trễ (ms)."""
+        with self._cond:
+            avg = (self._lat_sum / self.consumed) if self.consumed else 0.0
+            return {
+                'policy': self.policy,
+                'produced': self.produced,
+                'consumed': self.consumed,
+                'dropped': self.dropped,
+                'queued': len(self._queue),
+                'latency_avg_ms': round(avg * 1000, 2),
+                'latency_max_ms': round(self._lat_max * 1000, 2),
+            }
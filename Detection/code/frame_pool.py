@@ -0,0 +1,108 @@
+# frame_pool.py
+"""
+Bể (pool) frame cấp phát sẵn, dùng chung cho capture, infer và GUI.
+
+- Các slot numpy được cấp phát 1 lần; capture ghi thẳng vào slot
+  (cv2.resize(..., dst=slot.array)) thay vì tạo mảng mới mỗi frame.
+- Người đọc nhận view CHỈ ĐỌC của slot, không copy.
+- Đếm tham chiếu (refs): slot chỉ quay lại danh sách trống khi refs về 0.
+- Tem thế hệ (generation) tăng mỗi lần slot được cấp cho người ghi, để người
+  đọc không giữ tham chiếu (GUI) kiểm tra slot có bị ghi đè trong lúc copy không.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class FrameSlot:
+    """Một vùng nhớ frame cố định trong pool."""
+    __slots__ = ('index', 'array', 'generation', 'refs')
+
+    def __init__(self, index, array):
+        self.index = index
+        self.array = array
+        self.generation = 0
+        self.refs = 0
+
+    def view(self):
+        """View chỉ đọc (không copy) của frame trong slot."""
+        v = self.array.view()
+        v.flags.writeable = False
+        return v
+
+    def __repr__(self):
+        return f"FrameSlot(index={self.index}, generation={self.generation}, refs={self.refs})"
+
+
+class FramePool:
+    """
+    n_slots: số slot cấp phát sẵn (nên > số frame có thể bị giữ cùng lúc).
+    shape, dtype: kích thước frame, ví dụ (480, 640, 3), np.uint8.
+    """
+    def __init__(self, n_slots, shape, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = [FrameSlot(i, np.zeros(self.shape, self.dtype)) for i in range(int(n_slots))]
+        # FIFO: slot vừa trả về được dùng lại SAU CÙNG -> GUI ít bị đọc trượt
+        self._free = deque(self.slots)
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.exhausted = 0   # Số lần hết slot trống (frame bị bỏ ở phía capture)
+
+    def acquire(self):
+        """Lấy 1 slot trống để GHI (refs=1, generation+1). Trả về None nếu hết slot."""
+        with self._lock:
+            if not self._free:
+                self.exhausted += 1
+                return None
+            slot = self._free.popleft()
+            slot.refs = 1
+            slot.generation += 1
+            self.acquired += 1
+            return slot
+
+    def retain(self, slot):
+        with self._lock:
+            if slot.refs <= 0:
+                raise RuntimeError(f"Không thể retain slot đã được trả về pool: {slot}")
+            slot.refs += 1
+
+    def release(self, slot):
+        """Bỏ 1 tham chiếu; slot quay về pool khi không còn ai giữ."""
+        with self._lock:
+            if slot.refs <= 0:
+                raise RuntimeError(f"Release thừa: {slot}")
+            slot.refs -= 1
+            if slot.refs == 0:
+                self._free.append(slot)
+
+    def copy_out(self, slot, generation, dst=None):
+        """
+        Copy frame ra ngoài cho người đọc KHÔNG giữ tham chiếu (ví dụ GUI).
+        Trả về None nếu slot đã bị cấp lại (generation khác) trước/trong khi copy.
+        dst: mảng đích dùng lại (cùng shape/dtype) để tránh cấp phát mới.
+        """
+        if slot.generation != generation:
+            return None
+        if dst is None:
+            dst = np.empty(self.shape, self.dtype)
+        np.copyto(dst, slot.array)
+        if slot.generation != generation:
+            return None
+        return dst
+
+    @property
+    def in_use(self):
+        with self._lock:
+            return len(self.slots) - len(self._free)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'slots': len(self.slots),
+                'in_use': len(self.slots) - len(self._free),
+                'acquired': self.acquired,
+                'exhausted': self.exhausted,
+            }
@@ -0,0 +1,611 @@
+# gallery_index.py
+"""
+Chỉ mục tìm kiếm embedding khuôn mặt cho RecognitionEngine (gallery cỡ trường / quận: hàng
+chục nghìn mẫu thay vì vài mặt trong faces_db.npz).
+
+Cùng 1 giao diện cho mọi loại chỉ mục:
+    idx = make_index(INDEX_IVF, dim=512)
+    ids = idx.add(vecs, labels)          # vecs (N, D) đã chuẩn hóa L2, labels: list[str]
+    idx.remove(ids) / idx.remove_label("12")
+    scores, ids = idx.search(q, k=1)     # (Q, k) độ tương đồng cosine, id (-1 nếu không có)
+    idx.labels_of(ids)
+    idx.save("gallery.idx.npz"); idx = load_index("gallery.idx.npz")
+
+- BruteForceIndex: tích vô hướng với TẤT CẢ mẫu (chính xác tuyệt đối, như predict_batch cũ).
+- IVFIndex: k-means chia gallery thành nlist cụm; truy vấn chỉ quét nprobe cụm gần nhất.
+  Tự huấn luyện khi gallery đủ lớn (>= train_min), tự huấn luyện lại khi gallery tăng gấp 4.
+- HNSWIndex: đồ thị HNSW qua thư viện hnswlib (tùy chọn, pip install hnswlib).
+
+Xóa là xóa mềm (đánh dấu, id không đổi); compact() dồn lại bộ nhớ (id đổi).
+Bộ nhớ vector cấp phát trước và tăng gấp đôi khi đầy -> thêm cả lớp vẫn tuyến tính.
+BruteForceIndex / IVFIndex(precision=PRECISION_INT8 / PRECISION_FP16): quét thô trên bản nén trong RAM
+(int8 + hệ số tỉ lệ mỗi vector, hoặc float16; IVF chỉ quét các cụm được dò, HNSW chỉ hỗ trợ
+fp32), chỉ `rerank` ứng viên tốt nhất được tính lại bằng float32 (đọc từ memmap / tầng RAM) -> thứ hạng top-k gần như y hệt float32.
+int8 giảm 4 lần ma trận phải quét và quét nhanh hơn float32; float16 giảm 1 nửa (NumPy đổi
+float16 -> float32 bằng phần mềm nên quét chậm hơn). Bản float32 vẫn được giữ để tính lại ứng
+viên: RAM chỉ giảm khi float32 là memmap của kho (load_db); mẫu ở tầng RAM thì tốn thêm bản nén
+— xem code_test/benchmark_gallery_precision.py.
+adopt() dùng thẳng mảng memmap của kho (gallery_store) làm tầng gốc chỉ đọc: khởi động O(1),
+mẫu thêm sau nằm ở tầng RAM riêng.
+
+Mỗi danh tính (nhãn) có thể có NHIỀU mẫu (chính diện, nghiêng trái / phải, đeo kính...).
+match_identities() lấy top-k mẫu gần nhất rồi gộp theo danh tính: điểm danh tính là max của
+mẫu gần nhất và tâm (trung bình chuẩn hóa) các mẫu của danh tính đó.
+"""
+import json
+import os
+
+import numpy as np
+
+try:
+    import hnswlib
+except Exception:
+    hnswlib = None
+
+INDEX_BRUTE = "brute"
+INDEX_IVF   = "ivf"
+INDEX_HNSW  = "hnsw"
+
+EMB_DIM        = 512
+IVF_NPROBE     = 8        # Số cụm quét mỗi truy vấn
+IVF_TRAIN_MIN  = 2048     # Gallery nhỏ hơn -> quét toàn bộ (brute force đã đủ nhanh)
+IVF_KMEANS_ITERS = 10
+IVF_SAMPLE_PER_LIST = 32  # Số mẫu huấn luyện k-means cho mỗi cụm
+HNSW_M         = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+TOPK_TEMPLATES = 5        # Số mẫu gần nhất lấy ra trước khi gộp theo danh tính
+MAX_TEMPLATES  = 4        # Số mẫu tối đa mỗi học sinh khi đăng ký
+LABEL_BYTES    = 64       # Nhãn tầng _base: bytes UTF-8 độ dài cố định (như gallery_store)
+
+PRECISION_FP32 = "fp32"
+PRECISION_FP16 = "fp16"
+PRECISION_INT8 = "int8"
+RERANK_CANDIDATES = 32    # Số ứng viên từ bản nén được tính lại bằng float32
+CODE_CHUNK     = 128      # Số hàng giải nén mỗi lần (vừa cache L2) khi quét bản nén
+
+
+class BruteForceIndex:
+    """Quét toàn bộ: chính xác, O(N) mỗi truy vấn."""
+    kind = INDEX_BRUTE
+
+    def __init__(self, dim=EMB_DIM, precision=PRECISION_FP32, rerank=RERANK_CANDIDATES):
+        if precision not in (PRECISION_FP32, PRECISION_FP16, PRECISION_INT8):
+            raise ValueError(f"Độ chính xác không hỗ trợ: {precision}")
+        self.dim = int(dim)
+        self.precision = precision
+        self.rerank = int(rerank)
+        self.reset()
+
+    def reset(self):
+        # 2 tầng: _base (chỉ đọc, có thể là memmap của kho -> mở tức thì, nhiều process dùng chung
+        # trang nhớ) + _vecs (RAM, tăng gấp đôi khi đầy) cho mẫu thêm sau. id < _nb thuộc _base.
+        self._base = np.zeros((0, self.dim), dtype=np.float32)
+        self._base_labels = np.zeros(0, dtype=f"S{LABEL_BYTES}")
+        self._nb = 0
+        self._vecs = np.zeros((0, self.dim), dtype=np.float32)
+        self._labels = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._n = 0
+        self._rows_by_label = None     # Dựng lười ở lần cần đầu tiên
+        self._centroids = {}
+        # Bản nén cùng chỉ số id với _alive (chỉ khi precision != fp32); int8 kèm hệ số tỉ lệ
+        self._codes = None if self.precision == PRECISION_FP32 else \
+            np.zeros((0, self.dim), dtype=np.int8 if self.precision == PRECISION_INT8 else np.float16)
+        self._scales = np.zeros(0, dtype=np.float32)
+
+    def adopt(self, vecs, labels, alive=None, state=None):
+        """
+        Dùng thẳng mảng vecs (N, D) + nhãn dạng bytes cố định (N,) làm tầng _base, KHÔNG sao chép
+        (vd. np.load(mmap_mode='r') của kho gallery). alive: cờ còn sống (mặc định tất cả).
+        state: trạng thái riêng của chỉ mục đã lưu (npz của save()), nếu có.
+        """
+        self.reset()
+        self._base, self._base_labels = vecs, labels
+        self._nb = self._n = len(vecs)
+        self._alive = np.ones(self._n, dtype=bool) if alive is None else np.array(alive, dtype=bool)
+        if self._codes is not None:
+            self._codes = np.zeros((self._n, self.dim), dtype=self._codes.dtype)
+            self._scales = np.zeros(self._n, dtype=np.float32)
+            for s in range(0, self._n, 16384):     # Đọc memmap 1 lượt theo khối
+                self._encode_into(s, np.asarray(vecs[s:s + 16384], dtype=np.float32))
+        self._on_adopt(state)
+
+    def _on_adopt(self, state):
+        pass
+
+    def label(self, i):
+        i = int(i)
+        if i < self._nb:
+            return self._base_labels[i].decode("utf-8")
+        return self._labels[i - self._nb]
+
+    def _rows(self, ids):
+        """Vector của các id (gộp 2 tầng)."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if self._nb == 0:
+            return self._vecs[ids]
+        if len(ids) and ids.min() >= self._nb:
+            return self._vecs[ids - self._nb]
+        out = np.empty((len(ids), self.dim), dtype=np.float32)
+        in_base = ids < self._nb
+        out[in_base] = self._base[ids[in_base]]
+        out[~in_base] = self._vecs[ids[~in_base] - self._nb]
+        return out
+
+    def _label_rows(self):
+        if self._rows_by_label is None:
+            rows = {}
+            ids = self.ids()
+            base_ids = ids[ids < self._nb]
+            if len(base_ids):
+                keys, inv = np.unique(self._base_labels[base_ids], return_inverse=True)
+                order = np.argsort(inv, kind="stable")
+                bounds = np.searchsorted(inv[order], np.arange(len(keys) + 1))
+                for k, key in enumerate(keys):
+                    rows[key.decode("utf-8")] = base_ids[order[bounds[k]:bounds[k + 1]]].tolist()
+            for i in ids[ids >= self._nb].tolist():
+                rows.setdefault(self._labels[i - self._nb], []).append(i)
+            self._rows_by_label = rows
+        return self._rows_by_label
+
+    # ----- lưu trữ -----
+    def _reserve(self, n):
+        """Đủ chỗ cho n mẫu ở tầng RAM."""
+        if n <= len(self._vecs):
+            return
+        nd = self._n - self._nb
+        cap = max(n, 2 * len(self._vecs), 64)
+        vecs = np.zeros((cap, self.dim), dtype=np.float32); vecs[:nd] = self._vecs[:nd]
+        alive = np.zeros(self._nb + cap, dtype=bool); alive[:self._n] = self._alive[:self._n]
+        self._vecs, self._alive = vecs, alive
+        if self._codes is not None:
+            codes = np.zeros((self._nb + cap, self.dim), dtype=self._codes.dtype); codes[:self._n] = self._codes[:self._n]
+            scales = np.zeros(self._nb + cap, dtype=np.float32); scales[:self._n] = self._scales[:self._n]
+            self._codes, self._scales = codes, scales
+
+    def _encode_into(self, start, vecs):
+        """Ghi bản nén của vecs vào id start..start+len(vecs)."""
+        end = start + len(vecs)
+        if self.precision == PRECISION_INT8:
+            scale = np.abs(vecs).max(axis=1) / 127.0 + 1e-12      # Lượng tử đối xứng theo từng vector
+            self._codes[start:end] = np.round(vecs / scale[:, None])
+            self._scales[start:end] = scale
+        else:
+            self._codes[start:end] = vecs
+
+    def add(self, vecs, labels):
+        """Thêm mẫu. Trả về mảng id (chỉ số hàng, ổn định đến khi compact())."""
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(-1, self.dim)
+        labels = [str(l) for l in labels]
+        if len(labels) != len(vecs):
+            raise ValueError("Số nhãn khác số vector")
+        start, nd = self._n, self._n - self._nb
+        self._reserve(nd + len(vecs))
+        self._vecs[nd:nd + len(vecs)] = vecs
+        self._alive[start:start + len(vecs)] = True
+        if self._codes is not None:
+            self._encode_into(start, vecs)
+        self._labels.extend(labels)
+        self._n += len(vecs)
+        ids = np.arange(start, self._n)
+        for i, label in zip(ids.tolist(), labels):
+            if self._rows_by_label is not None:
+                self._rows_by_label.setdefault(label, []).append(i)
+            self._centroids.pop(label, None)
+        self._on_add(ids)
+        return ids
+
+    def _on_add(self, ids):
+        pass
+
+    def remove(self, ids):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        ids = ids[(ids >= 0) & (ids < self._n)]
+        ids = ids[self._alive[ids]]
+        self._alive[ids] = False
+        by_label = self._rows_by_label
+        for i in ids.tolist():
+            label = self.label(i)
+            if by_label is not None:
+                rows = by_label.get(label, [])
+                if i in rows:
+                    rows.remove(i)
+                if not rows:
+                    by_label.pop(label, None)
+            self._centroids.pop(label, None)
+        self._on_remove(ids)
+        return len(ids)
+
+    def _on_remove(self, ids):
+        pass
+
+    def remove_label(self, label):
+        return self.remove(list(self._label_rows().get(str(label), [])))
+
+    def __len__(self):
+        return int(self._alive[:self._n].sum())
+
+    def ids(self):
+        return np.flatnonzero(self._alive[:self._n])
+
+    def vectors(self):
+        return self._rows(self.ids())
+
+    def labels(self):
+        return [self.label(i) for i in self.ids()]
+
+    def identities(self):
+        """Các nhãn đang có ít nhất 1 mẫu."""
+        return list(self._label_rows())
+
+    def templates(self, label):
+        """id các mẫu của 1 danh tính."""
+        return list(self._label_rows().get(str(label), []))
+
+    def template_count(self, label):
+        return len(self._label_rows().get(str(label), ()))
+
+    def centroid(self, label):
+        """Tâm (trung bình chuẩn hóa L2) các mẫu của danh tính; None nếu không có mẫu."""
+        label = str(label)
+        if label not in self._centroids:
+            rows = self._label_rows().get(label)
+            if not rows:
+                return None
+            m = self._rows(rows).mean(axis=0)
+            self._centroids[label] = (m / (np.linalg.norm(m) + 1e-9)).astype(np.float32)
+        return self._centroids[label]
+
+    def labels_of(self, ids):
+        return [self.label(i) if i >= 0 else None for i in np.asarray(ids).reshape(-1)]
+
+    def compact(self):
+        """Bỏ hẳn mẫu đã xóa, chuyển hết về tầng RAM (id của các mẫu còn lại thay đổi)."""
+        vecs, labels = self.vectors().copy(), self.labels()
+        self.reset()
+        if len(labels):
+            self.add(vecs, labels)
+
+    # ----- tìm kiếm -----
+    @staticmethod
+    def _topk(sims, k):
+        """(Q, N) -> (scores, cột) top-k giảm dần; thiếu ứng viên thì -inf / -1."""
+        q, n = sims.shape
+        kk = min(k, n)
+        scores = np.full((q, k), -np.inf, dtype=np.float32)
+        cols = np.full((q, k), -1, dtype=np.int64)
+        if kk == 0:
+            return scores, cols
+        part = np.argpartition(-sims, kk - 1, axis=1)[:, :kk] if kk < n else np.tile(np.arange(n), (q, 1))
+        ps = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-ps, axis=1, kind="stable")
+        scores[:, :kk] = np.take_along_axis(ps, order, axis=1)
+        cols[:, :kk] = np.take_along_axis(part, order, axis=1)
+        cols[~np.isfinite(scores)] = -1
+        return scores, cols
+
+    def _similarities(self, q):
+        """q (Q, D) -> độ tương đồng với mọi id (Q, _n), mẫu đã xóa = -inf."""
+        sims = np.empty((len(q), self._n), dtype=np.float32)
+        if self._nb:
+            sims[:, :self._nb] = q @ self._base.T
+        sims[:, self._nb:] = q @ self._vecs[:self._n - self._nb].T
+        sims[:, ~self._alive[:self._n]] = -np.inf
+        return sims
+
+    def _coarse_similarities(self, q):
+        """Như _similarities nhưng trên bản nén: giải nén từng khối CODE_CHUNK hàng vào bộ đệm."""
+        out = np.empty((self._n, len(q)), dtype=np.float32)
+        buf = np.empty((CODE_CHUNK, self.dim), dtype=np.float32)
+        qt = np.ascontiguousarray(q.T)
+        for s in range(0, self._n, CODE_CHUNK):
+            e = min(s + CODE_CHUNK, self._n)
+            np.copyto(buf[:e - s], self._codes[s:e])
+            np.dot(buf[:e - s], qt, out=out[s:e])
+        if self.precision == PRECISION_INT8:
+            out *= self._scales[:self._n, None]
+        out[~self._alive[:self._n]] = -np.inf
+        return out.T
+
+    def search(self, queries, k=1):
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self._codes is None:
+            return self._topk(self._similarities(q), k)
+        # Quét thô trên bản nén -> tính lại float32 cho ứng viên tốt nhất
+        _, cand = self._topk(self._coarse_similarities(q), max(k, self.rerank))
+        valid = cand >= 0
+        vecs = self._rows(np.where(valid, cand, 0).reshape(-1)).reshape(cand.shape + (self.dim,))
+        exact = np.einsum('qcd,qd->qc', vecs, q)
+        exact[~valid] = -np.inf
+        scores, cols = self._topk(exact, k)
+        ids = np.where(cols >= 0, np.take_along_axis(cand, np.maximum(cols, 0), axis=1), -1)
+        return scores, ids
+
+    # ----- lưu / tải -----
+    def _extra_state(self):
+        return {}
+
+    def save(self, path):
+        """Lưu npz (không dùng pickle): vector, nhãn, cờ còn sống + trạng thái riêng của chỉ mục."""
+        meta = {'kind': self.kind, 'dim': self.dim, 'params': self.params()}
+        all_ids = np.arange(self._n)
+        np.savez(path, vecs=self._rows(all_ids), alive=self._alive[:self._n],
+                 labels=np.array([self.label(i) for i in all_ids], dtype=str), meta=np.array(json.dumps(meta)),
+                 **self._extra_state())
+
+    def params(self):
+        return {'precision': self.precision, 'rerank': self.rerank}
+
+    def scan_bytes(self):
+        """Byte của ma trận được quét mỗi truy vấn (bản nén nếu có, nếu không là float32)."""
+        if self.precision == PRECISION_INT8:
+            return int(self._codes[:self._n].nbytes + self._scales[:self._n].nbytes)
+        if self._codes is not None:
+            return int(self._codes[:self._n].nbytes)
+        return int(self._n * self.dim * 4)
+
+    def memory_bytes(self):
+        """
+        Byte vector nằm trong RAM: bản nén (+ hệ số) + float32 tầng RAM + tầng _base. Tầng _base
+        memmap chỉ không tính khi có bản nén (float32 chỉ được đọc vài hàng để tính lại); fp32 quét
+        hết mọi trang mỗi truy vấn nên memmap vẫn nằm cả trong page cache. Chế độ nén giữ float32
+        để tính lại ứng viên, nên chỉ tiết kiệm RAM khi float32 nằm ở memmap của kho
+        (load_db -> adopt); gallery toàn ở tầng RAM thì tốn THÊM.
+        """
+        mapped = isinstance(self._base, np.memmap) and self._codes is not None
+        base = 0 if mapped else self._nb * self.dim * 4
+        codes = self.scan_bytes() if self._codes is not None else 0
+        return int(base + (self._n - self._nb) * self.dim * 4 + codes)
+
+    def stats(self):
+        return {'kind': self.kind, 'size': len(self), 'deleted': self._n - len(self), 'mapped': self._nb,
+                'precision': self.precision, 'scan_bytes': self.scan_bytes(), 'ram_bytes': self.memory_bytes()}
+
+
+class IVFIndex(BruteForceIndex):
+    """Inverted file: k-means chia cụm, truy vấn quét nprobe cụm gần nhất."""
+    kind = INDEX_IVF
+
+    def __init__(self, dim=EMB_DIM, nlist=None, nprobe=IVF_NPROBE, train_min=IVF_TRAIN_MIN, seed=0,
+                 precision=PRECISION_FP32, rerank=RERANK_CANDIDATES):
+        self.nlist_cfg = nlist
+        self.nprobe = int(nprobe)
+        self.train_min = int(train_min)
+        self.seed = int(seed)
+        super().__init__(dim, precision=precision, rerank=rerank)
+
+    def reset(self):
+        super().reset()
+        self.centroids = None
+        self._lists = []
+        self._trained_n = 0
+
+    def params(self):
+        out = super().params()
+        out.update({'nlist': self.nlist_cfg, 'nprobe': self.nprobe, 'train_min': self.train_min, 'seed': self.seed})
+        return out
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _assign(self, vecs, chunk=16384):
+        out = np.empty(len(vecs), dtype=np.int64)
+        for s in range(0, len(vecs), chunk):
+            out[s:s + chunk] = np.argmax(vecs[s:s + chunk] @ self.centroids.T, axis=1)
+        return out
+
+    def train(self, nlist=None):
+        """k-means cầu (cosine) trên mẫu còn sống rồi chia lại toàn bộ vào các cụm."""
+        ids = self.ids()
+        if len(ids) == 0:
+            return
+        nlist = int(nlist or self.nlist_cfg or max(1, int(np.sqrt(len(ids)))))
+        nlist = min(nlist, len(ids))
+        rng = np.random.default_rng(self.seed)
+        sample = self._rows(np.sort(rng.choice(ids, size=min(len(ids), nlist * IVF_SAMPLE_PER_LIST), replace=False)))
+        c = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(IVF_KMEANS_ITERS):
+            a = np.argmax(sample @ c.T, axis=1)
+            sums = np.zeros_like(c)
+            np.add.at(sums, a, sample)
+            counts = np.bincount(a, minlength=nlist)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]   # cụm rỗng -> lấy mẫu mới
+            c = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-9)
+        self.centroids = c.astype(np.float32)
+        self._rebuild_lists(ids)
+        self._trained_n = len(ids)
+
+    def _rebuild_lists(self, ids):
+        a = self._assign(self._rows(ids))
+        order = np.argsort(a, kind="stable")
+        bounds = np.searchsorted(a[order], np.arange(len(self.centroids) + 1))
+        self._lists = [ids[order[bounds[i]:bounds[i + 1]]] for i in range(len(self.centroids))]
+
+    def _on_add(self, ids):
+        if self.is_trained:
+            a = self._assign(self._rows(ids))
+            for li in np.unique(a):
+                self._lists[li] = np.concatenate([self._lists[li], ids[a == li]])
+            if len(self) >= 4 * self._trained_n:
+                self.train()
+        elif len(self) >= self.train_min:
+            self.train()
+
+    def search(self, queries, k=1):
+        if not self.is_trained:
+            return super().search(queries, k)
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        nprobe = min(self.nprobe, len(self.centroids))
+        coarse = q @ self.centroids.T
+        probe = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(q), k), -1, dtype=np.int64)
+        for i in range(len(q)):
+            rows = np.concatenate([self._lists[li] for li in probe[i]])
+            if len(rows) == 0:
+                continue
+            rows = rows[self._alive[rows]]
+            if self._codes is not None and len(rows) > max(k, self.rerank):
+                # Quét thô các cụm được dò trên bản nén -> chỉ tính lại float32 cho ứng viên tốt nhất
+                coarse = self._codes[rows].astype(np.float32) @ q[i]
+                if self.precision == PRECISION_INT8:
+                    coarse *= self._scales[rows]
+                _, c = self._topk(coarse[None, :], max(k, self.rerank))
+                rows = rows[c[0][c[0] >= 0]]
+            s, c = self._topk((self._rows(rows) @ q[i])[None, :], k)
+            scores[i] = s[0]
+            ids[i] = np.where(c[0] >= 0, rows[np.maximum(c[0], 0)], -1)
+        return scores, ids
+
+    def _extra_state(self):
+        if not self.is_trained:
+            return {}
+        return {'centroids': self.centroids}
+
+    def _on_adopt(self, state):
+        if state is not None and 'centroids' in state.files:
+            self.centroids = state['centroids'].astype(np.float32)
+            self._rebuild_lists(self.ids())
+            self._trained_n = len(self)
+        elif len(self) >= self.train_min:
+            self.train()
+
+    def stats(self):
+        out = super().stats()
+        out.update({'nlist': len(self.centroids) if self.is_trained else 0, 'nprobe': self.nprobe})
+        return out
+
+
+class HNSWIndex(BruteForceIndex):
+    """Đồ thị HNSW (hnswlib, không gian inner product). Vector vẫn giữ lại để lưu / compact."""
+    kind = INDEX_HNSW
+
+    def __init__(self, dim=EMB_DIM, M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH,
+                 precision=PRECISION_FP32, rerank=RERANK_CANDIDATES):
+        if precision != PRECISION_FP32:
+            # Đồ thị hnswlib tự giữ vector float32 và tự tìm kiếm -> bản nén không có tác dụng
+            raise ValueError(f"Chỉ mục HNSW chỉ hỗ trợ precision={PRECISION_FP32!r} (nhận {precision!r}); "
+                             f"dùng {INDEX_BRUTE!r} hoặc {INDEX_IVF!r} cho bản nén")
+        if hnswlib is None:
+            raise ImportError("Chỉ mục HNSW cần thư viện hnswlib (pip install hnswlib)")
+        self.M = int(M)
+        self.ef_construction = int(ef_construction)
+        self.ef_search = int(ef_search)
+        super().__init__(dim)
+
+    def reset(self):
+        super().reset()
+        self._graph = hnswlib.Index(space='ip', dim=self.dim)
+        self._graph.init_index(max_elements=1024, ef_construction=self.ef_construction, M=self.M)
+        self._graph.set_ef(self.ef_search)
+
+    def params(self):
+        return {'M': self.M, 'ef_construction': self.ef_construction, 'ef_search': self.ef_search}
+
+    def _on_add(self, ids):
+        if self._n > self._graph.get_max_elements():
+            self._graph.resize_index(max(self._n, 2 * self._graph.get_max_elements()))
+        self._graph.add_items(self._rows(ids), ids)
+
+    def _on_remove(self, ids):
+        for i in ids:
+            try:
+                self._graph.mark_deleted(int(i))
+            except RuntimeError:
+                pass
+
+    def search(self, queries, k=1):
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        kk = min(k, len(self))
+        scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(q), k), -1, dtype=np.int64)
+        if kk == 0 or len(q) == 0:
+            return scores, ids
+        self._graph.set_ef(max(self.ef_search, kk))
+        labels, dist = self._graph.knn_query(q, k=kk)
+        scores[:, :kk] = 1.0 - dist          # khoảng cách 'ip' của hnswlib = 1 - tích vô hướng
+        ids[:, :kk] = labels
+        return scores, ids
+
+    def _on_adopt(self, state):
+        # Dựng lại đồ thị từ vector (không phụ thuộc định dạng file nhị phân của hnswlib)
+        self._graph.resize_index(max(self._n, 1024))
+        if self._n:
+            self._graph.add_items(self._rows(np.arange(self._n)), np.arange(self._n))
+            for i in np.flatnonzero(~self._alive[:self._n]):
+                self._graph.mark_deleted(int(i))
+
+
+INDEX_CLASSES = {INDEX_BRUTE: BruteForceIndex, INDEX_IVF: IVFIndex, INDEX_HNSW: HNSWIndex}
+
+
+def make_index(kind=INDEX_BRUTE, dim=EMB_DIM, **params):
+    if kind not in INDEX_CLASSES:
+        raise ValueError(f"Loại chỉ mục không hỗ trợ: {kind} (chọn {list(INDEX_CLASSES)})")
+    return INDEX_CLASSES[kind](dim=dim, **params)
+
+
+def match_identities(index, queries, k=TOPK_TEMPLATES):
+    """
+    Danh tính khớp nhất cho mỗi truy vấn: top-k mẫu -> gộp theo nhãn.
+    Điểm nhãn = max(mẫu gần nhất của nhãn, độ tương đồng với tâm các mẫu của nhãn).
+    Trả về (list nhãn hoặc None, mảng điểm).
+    """
+    q = np.asarray(queries, dtype=np.float32).reshape(-1, index.dim)
+    scores, ids = index.search(q, k=k)
+    labels, best = [None] * len(q), np.zeros(len(q), dtype=np.float32)
+    for qi in range(len(q)):
+        cand = {}
+        for s, i in zip(scores[qi].tolist(), ids[qi].tolist()):
+            if i >= 0:
+                lab = index.label(i)
+                cand[lab] = max(cand.get(lab, -np.inf), s)
+        for lab, s in cand.items():
+            c = index.centroid(lab)
+            if c is not None and index.template_count(lab) > 1:
+                s = max(s, float(c @ q[qi]))
+            if labels[qi] is None or s > best[qi]:
+                labels[qi], best[qi] = lab, s
+    return labels, best
+
+
+def select_templates(candidates, n=MAX_TEMPLATES, first=None):
+    """
+    Chọn tối đa n mẫu ĐA DẠNG từ candidates (N, D) (farthest point theo cosine) để đăng ký
+    nhiều góc mặt. first: mẫu bắt buộc (vd. embedding lúc bấm đăng ký).
+    """
+    pool = [np.asarray(c, dtype=np.float32) for c in candidates]
+    chosen = [np.asarray(first, dtype=np.float32)] if first is not None else pool[:1]
+    pool = pool if first is not None else pool[1:]
+    while pool and len(chosen) < n:
+        sims = np.max(np.stack(pool) @ np.stack(chosen).T, axis=1)
+        chosen.append(pool.pop(int(np.argmin(sims))))
+    return np.stack(chosen) if chosen else np.zeros((0, EMB_DIM), dtype=np.float32)
+
+
+def subset_index(index, labels, kind=INDEX_BRUTE):
+    """
+    Chỉ mục con chỉ gồm mẫu có nhãn thuộc labels (vd. học sinh của 1 lớp).
+    Mặc định brute force: 1 lớp chỉ vài chục mẫu, quét toàn bộ là nhanh nhất.
+    """
+    ids = sorted(i for l in {str(l) for l in labels} for i in index.templates(l))
+    sub = make_index(kind, dim=index.dim)
+    if ids:
+        sub.add(index._rows(ids), index.labels_of(ids))
+    return sub
+
+
+def load_index(path):
+    """Tải chỉ mục đã save(); loại chỉ mục và tham số đọc từ file."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        idx = make_index(meta['kind'], dim=meta['dim'], **meta.get('params', {}))
+        vecs = data['vecs'].astype(np.float32)
+        labels = np.char.encode(data['labels'].astype(str), "utf-8").astype(f"S{LABEL_BYTES}")
+        idx.adopt(vecs, labels, alive=data['alive'], state=data)
+    return idx
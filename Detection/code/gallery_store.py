@@ -0,0 +1,436 @@
+# gallery_store.py
+"""
+Kho gallery khuôn mặt GHI NỐI TIẾP (append-only) thay cho việc ghi lại toàn bộ faces_db.npz
+mỗi lần đăng ký / xóa. Là đường đọc-ghi DUY NHẤT cho recognition_engine.py và database.py.
+
+Thư mục <tên db>.store/ (vd. faces_db.store/ cạnh faces_db.npz):
+    MANIFEST.json       danh sách segment + số bản ghi đã commit, tombstone, seq tiếp theo
+    seg_000001.bin ...  bản ghi cố định độ dài: (seq int64, nhãn 64 byte utf-8, embedding float32[dim])
+    snap_000007/        ảnh chụp sau compaction: embs.npy (N, dim) float32, labels.npy (N,) S64,
+                        seq.npy (N,) int64 — .npy không nén, không pickle, mở bằng memmap
+
+- Thêm: ghi nối bản ghi vào segment cuối -> fsync -> ghi MANIFEST mới (file tạm + os.replace).
+  Mất điện giữa chừng: phần đuôi chưa có trong MANIFEST bị bỏ qua và ghi đè ở lần sau.
+- Xóa: tombstone {nhãn: seq} -> mọi bản ghi của nhãn có seq nhỏ hơn coi như đã xóa
+  (đăng ký lại sau khi xóa vẫn hợp lệ vì seq mới lớn hơn).
+- Compaction (luồng nền): khi bản ghi chết > COMPACT_DEAD_RATIO, đuôi journal > COMPACT_TAIL_RECORDS
+  hoặc quá nhiều segment, ghi
+  ảnh chụp + segment cũ (bản ghi còn sống) sang ảnh chụp mới rồi đổi MANIFEST 1 lần (nguyên tử),
+  xóa segment / ảnh chụp cũ.
+- load_arrays(): ảnh chụp mở bằng np.load(mmap_mode='r') -> tải O(1) bất kể cỡ gallery, các
+  process (nhiều luồng camera) dùng chung trang nhớ của OS; chỉ đuôi journal được đọc vào RAM.
+- Lần mở đầu tiên: tự nhập faces_db.npz cũ (khóa embs/names, hoặc embeddings/labels) thẳng
+  thành ảnh chụp -> ngay lần khởi động sau đã memmap được.
+
+Ví dụ:
+    store = open_store("faces_db.npz")
+    store.append(["12"], emb[None])
+    store.delete("12")
+    embs, labels = store.load()
+    base_embs, base_labels, base_alive, tail_embs, tail_labels = store.load_arrays()
+"""
+import os
+import json
+import glob
+import threading
+
+import numpy as np
+
+EMB_DIM            = 512
+LABEL_BYTES        = 64
+SEGMENT_RECORDS    = 4096    # Số bản ghi tối đa mỗi segment
+COMPACT_DEAD_RATIO = 0.3     # Tỉ lệ bản ghi chết để tự compaction
+COMPACT_MAX_SEGMENTS = 16
+COMPACT_TAIL_RECORDS = 1024  # Đuôi journal (đọc hẳn vào RAM khi tải) dài hơn -> gộp vào ảnh chụp
+MANIFEST           = "MANIFEST.json"
+SNAPSHOT_FILES     = {'emb': "embs.npy", 'label': "labels.npy", 'seq': "seq.npy"}
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def store_dir_for(db_path):
+    """faces_db.npz -> faces_db.store (thư mục kho)."""
+    if db_path.endswith(".store"):
+        return db_path
+    return os.path.splitext(db_path)[0] + ".store"
+
+
+def store_exists(db_path):
+    """Có gallery để tải không (kho đã có hoặc còn file npz cũ để nhập)."""
+    return os.path.exists(os.path.join(store_dir_for(db_path), MANIFEST)) or \
+        (db_path.endswith(".npz") and os.path.exists(db_path))
+
+
+def open_store(db_path, dim=EMB_DIM):
+    """1 đối tượng GalleryStore cho mỗi thư mục trong cả process (mọi nơi ghi qua cùng 1 khóa)."""
+    root = os.path.abspath(store_dir_for(db_path))
+    with _STORES_LOCK:
+        if root not in _STORES:
+            legacy = db_path if db_path.endswith(".npz") else None
+            _STORES[root] = GalleryStore(root, dim=dim, legacy_npz=legacy)
+        return _STORES[root]
+
+
+def read_legacy_npz(path):
+    """(embs, labels) từ faces_db.npz kiểu cũ."""
+    data = np.load(path, allow_pickle=True)
+    keys = set(data.files)
+    emb_key = "embs" if "embs" in keys else "embeddings"
+    lab_key = "names" if "names" in keys else "labels"
+    if emb_key not in keys or lab_key not in keys:
+        return np.zeros((0, EMB_DIM), np.float32), []
+    return data[emb_key].astype(np.float32), [str(x) for x in data[lab_key].tolist()]
+
+
+def read_gallery(path):
+    """(embs, labels) để xem / kiểm tra: đọc kho nếu đã có, nếu không đọc file npz cũ."""
+    if os.path.exists(os.path.join(store_dir_for(path), MANIFEST)):
+        return open_store(path).load()
+    return read_legacy_npz(path)
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass    # Windows không fsync được thư mục
+
+
+class GalleryStore:
+    def __init__(self, root, dim=EMB_DIM, legacy_npz=None):
+        self.root = root
+        self.dim = int(dim)
+        self.dtype = np.dtype([('seq', '<i8'), ('label', f'S{LABEL_BYTES}'), ('emb', '<f4', (self.dim,))])
+        self._lock = threading.RLock()
+        self._compact_thread = None
+        self._sealed = False          # True: lần ghi sau mở segment mới (đang compaction)
+        self._listeners = []          # fn(event, label, ...) khi kho thay đổi (vd. RecognitionEngine)
+        self._snap_cache = (None, None)   # (tên thư mục, dict memmap) của ảnh chụp đang dùng
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            self._remove_orphans()
+        else:
+            self.manifest = {'version': 1, 'dim': self.dim, 'next_seq': 0, 'next_segment': 1,
+                             'segments': [], 'snapshot': None, 'tombstones': {}, 'dead': 0}
+            if legacy_npz and os.path.exists(legacy_npz):
+                embs, labels = read_legacy_npz(legacy_npz)
+                if labels:
+                    name = f"snap_{self.manifest['next_segment']:06d}"
+                    self._write_snapshot(name, self._records(labels, embs, np.arange(len(labels))))
+                    self.manifest.update({'snapshot': {'dir': name, 'count': len(labels)},
+                                          'next_seq': len(labels), 'next_segment': self.manifest['next_segment'] + 1})
+                    print(f"[gallery] Đã nhập {len(labels)} mẫu từ {os.path.basename(legacy_npz)}")
+            self._commit()
+
+    # ------------------------------------------------------------------
+    def _seg_path(self, name):
+        return os.path.join(self.root, name)
+
+    def _commit(self):
+        """Ghi MANIFEST nguyên tử: file tạm -> fsync -> os.replace."""
+        tmp = os.path.join(self.root, MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.root, MANIFEST))
+        _fsync_dir(self.root)
+
+    def _remove_orphans(self):
+        """
+        Xóa segment / ảnh chụp đã bị thay thế nhưng chưa xóa được (compaction bị ngắt, Windows
+        còn memmap). Ảnh chụp đang ghi dở được giữ chỗ trong MANIFEST ('pending_snapshot') trước
+        khi ghi nên không bị coi là mồ côi. Segment số >= next_segment có thể đang được ghi (chưa
+        commit) -> bỏ qua; nếu là rác của lần chạy hỏng thì sẽ bị ghi đè khi dùng lại số đó.
+        """
+        live = {s['file'] for s in self.manifest['segments']}
+        snap = self.manifest.get('snapshot')
+        if snap:
+            live.add(snap['dir'])
+        if self.manifest.get('pending_snapshot'):
+            live.add(self.manifest['pending_snapshot'])
+        for p in glob.glob(os.path.join(self.root, "seg_*.bin")) + glob.glob(os.path.join(self.root, "snap_*")):
+            name = os.path.basename(p)
+            try:
+                num = int(os.path.splitext(name)[0].split("_")[1])
+            except ValueError:
+                continue
+            if name in live or num >= self.manifest['next_segment']:
+                continue
+            if name.startswith("snap_"):
+                self._remove_snapshot_dir(name)
+            else:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def _remove_snapshot_dir(self, name):
+        path = self._seg_path(name)
+        for f in glob.glob(os.path.join(path, "*")):
+            try:
+                os.remove(f)
+            except OSError:
+                pass    # Windows: còn process đang memmap -> lần mở sau dọn tiếp
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+    def _new_segment(self):
+        name = f"seg_{self.manifest['next_segment']:06d}.bin"
+        self.manifest['next_segment'] += 1
+        self.manifest['segments'].append({'file': name, 'count': 0})
+        return self.manifest['segments'][-1]
+
+    def _records(self, labels, embs, seqs):
+        recs = np.zeros(len(labels), dtype=self.dtype)
+        recs['seq'] = seqs
+        recs['label'] = [str(l).encode("utf-8")[:LABEL_BYTES] for l in labels]
+        recs['emb'] = embs
+        return recs
+
+    def _write_records(self, seg, recs):
+        path = self._seg_path(seg['file'])
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(seg['count'] * self.dtype.itemsize)     # Ghi đè phần đuôi chưa commit (nếu có)
+            f.write(recs.tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        seg['count'] += len(recs)
+
+    def _read_segment(self, seg):
+        if seg['count'] == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.fromfile(self._seg_path(seg['file']), dtype=self.dtype, count=seg['count'])
+
+    def _snapshot(self, snap):
+        """dict memmap {'emb', 'label', 'seq'} của ảnh chụp (None nếu chưa có)."""
+        if not snap:
+            return None
+        name, arrays = self._snap_cache
+        if name != snap['dir']:
+            path = self._seg_path(snap['dir'])
+            arrays = {k: np.load(os.path.join(path, f), mmap_mode='r', allow_pickle=False)
+                      for k, f in SNAPSHOT_FILES.items()}
+            self._snap_cache = (snap['dir'], arrays)
+        return arrays
+
+    def _write_snapshot(self, name, recs):
+        path = self._seg_path(name)
+        os.makedirs(path, exist_ok=True)
+        for k, fname in SNAPSHOT_FILES.items():
+            with open(os.path.join(path, fname), "wb") as f:
+                np.save(f, np.ascontiguousarray(recs[k]), allow_pickle=False)
+                f.flush()
+                os.fsync(f.fileno())
+        _fsync_dir(path)
+
+    def _alive_mask(self, recs, tombstones):
+        if not tombstones or len(recs['seq']) == 0:
+            return np.ones(len(recs['seq']), dtype=bool)
+        limit = np.array([tombstones.get(l.decode("utf-8"), -1) for l in recs['label']], dtype=np.int64)
+        return recs['seq'] >= limit
+
+    def add_listener(self, fn):
+        with self._lock:
+            if fn not in self._listeners:
+                self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    def _notify(self, event, label, source=None):
+        for fn in list(self._listeners):
+            if fn == source:
+                continue
+            try:
+                fn(event, label)
+            except Exception as e:
+                print(f"[gallery] Lỗi listener: {e}")
+
+    # ------------------------------------------------------------------
+    def append(self, labels, embs):
+        """Ghi thêm mẫu (đã commit khi hàm trả về). Trả về mảng seq."""
+        embs = np.asarray(embs, dtype=np.float32).reshape(-1, self.dim)
+        labels = [str(l) for l in labels]
+        if len(labels) != len(embs):
+            raise ValueError("Số nhãn khác số embedding")
+        with self._lock:
+            start = self.manifest['next_seq']
+            seqs = np.arange(start, start + len(labels))
+            recs = self._records(labels, embs, seqs)
+            pos = 0
+            while pos < len(recs):
+                segs = self.manifest['segments']
+                if not segs or self._sealed or segs[-1]['count'] >= SEGMENT_RECORDS:
+                    self._sealed = False
+                    seg = self._new_segment()
+                else:
+                    seg = segs[-1]
+                n = min(len(recs) - pos, SEGMENT_RECORDS - seg['count'])
+                self._write_records(seg, recs[pos:pos + n])
+                pos += n
+            self.manifest['next_seq'] = int(start + len(labels))
+            self._commit()
+        self._maybe_compact()
+        return seqs
+
+    def delete(self, label, source=None):
+        """Tombstone cho mọi mẫu hiện có của label. Trả về số mẫu bị xóa.
+        Listener (trừ source) được báo để bỏ mẫu khỏi gallery đang chạy trong bộ nhớ."""
+        label = str(label)
+        with self._lock:
+            tomb = self.manifest['tombstones']
+            n = 0
+            parts = [self._read_segment(seg) for seg in self.manifest['segments']]
+            snap = self._snapshot(self.manifest.get('snapshot'))
+            for recs in parts + ([snap] if snap is not None else []):
+                hit = recs['label'] == label.encode("utf-8")[:LABEL_BYTES]
+                n += int((hit & self._alive_mask(recs, tomb)).sum())
+            if n == 0:
+                return 0
+            tomb[label] = int(self.manifest['next_seq'])
+            self.manifest['dead'] += n
+            self._commit()
+        self._notify('delete', label, source)
+        self._maybe_compact()
+        return n
+
+    def load_arrays(self):
+        """
+        Gallery dạng mảng, không sao chép ảnh chụp:
+        (base_embs (M, dim) memmap, base_labels (M,) S64 memmap, base_alive (M,) bool,
+         tail_embs (K, dim) float32, tail_labels list) — tail là các bản ghi journal còn sống.
+        """
+        with self._lock:
+            segs = [dict(s) for s in self.manifest['segments']]
+            tomb = dict(self.manifest['tombstones'])
+            snap = self._snapshot(self.manifest.get('snapshot'))
+        if snap is None:
+            base_embs = np.zeros((0, self.dim), dtype=np.float32)
+            base_labels = np.zeros(0, dtype=f'S{LABEL_BYTES}')
+            base_alive = np.zeros(0, dtype=bool)
+        else:
+            base_embs, base_labels, base_alive = snap['emb'], snap['label'], self._alive_mask(snap, tomb)
+        parts = [self._read_segment(s) for s in segs]
+        recs = np.concatenate(parts) if parts else np.zeros(0, dtype=self.dtype)
+        recs = recs[self._alive_mask(recs, tomb)]
+        return base_embs, base_labels, base_alive, \
+            recs['emb'].astype(np.float32), [l.decode("utf-8") for l in recs['label']]
+
+    def load(self):
+        """(embs (N, dim) float32, labels) của các mẫu còn sống, theo thứ tự ghi."""
+        base_embs, base_labels, base_alive, tail_embs, tail_labels = self.load_arrays()
+        embs = np.concatenate([np.asarray(base_embs[base_alive], dtype=np.float32), tail_embs])
+        return embs, [l.decode("utf-8") for l in base_labels[base_alive]] + tail_labels
+
+    def _total(self):
+        snap = self.manifest.get('snapshot')
+        return sum(s['count'] for s in self.manifest['segments']) + (snap['count'] if snap else 0)
+
+    def __len__(self):
+        with self._lock:
+            return self._total() - self.manifest['dead']
+
+    def stats(self):
+        with self._lock:
+            total = self._total()
+            snap = self.manifest.get('snapshot')
+            return {'records': total, 'dead': self.manifest['dead'], 'live': total - self.manifest['dead'],
+                    'segments': len(self.manifest['segments']), 'snapshot': snap['count'] if snap else 0,
+                    'tombstones': len(self.manifest['tombstones'])}
+
+    # ------------------------------------------------------------------
+    def _needs_compaction(self):
+        total = self._total()
+        return (total > 0 and self.manifest['dead'] / total > COMPACT_DEAD_RATIO) or \
+            len(self.manifest['segments']) > COMPACT_MAX_SEGMENTS or \
+            sum(s['count'] for s in self.manifest['segments']) > COMPACT_TAIL_RECORDS
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._needs_compaction():
+                self.compact_async()
+
+    def compact_async(self):
+        """Compaction ở luồng nền (daemon). Đang chạy thì không tạo thêm."""
+        with self._lock:
+            if self._compact_thread is not None and self._compact_thread.is_alive():
+                return self._compact_thread
+            self._compact_thread = threading.Thread(target=self.compact, name="gallery-compact", daemon=True)
+            self._compact_thread.start()
+            return self._compact_thread
+
+    def compact(self):
+        """Gộp ảnh chụp + segment hiện có (bản ghi còn sống) thành ảnh chụp .npy mới;
+        bản ghi thêm trong lúc chạy nằm ở segment mới, giữ nguyên."""
+        with self._lock:
+            old = [dict(s) for s in self.manifest['segments']]
+            old_snap = self.manifest.get('snapshot')
+            snap_tomb = dict(self.manifest['tombstones'])
+            self._sealed = True                 # Ghi mới đi vào segment mới, không đụng segment cũ
+            base = self._snapshot(old_snap)
+        if not old and not old_snap:
+            return
+        # Đọc + ghi ảnh chụp mới ngoài khóa: append / load vẫn chạy bình thường
+        parts = [self._read_segment(s) for s in old]
+        recs = np.concatenate(parts) if parts else np.zeros(0, dtype=self.dtype)
+        recs = recs[self._alive_mask(recs, snap_tomb)]
+        if base is not None:
+            keep = self._alive_mask(base, snap_tomb)
+            recs = {k: np.concatenate([np.asarray(base[k][keep]), recs[k]]) for k in SNAPSHOT_FILES}
+        with self._lock:
+            name = f"snap_{self.manifest['next_segment']:06d}"
+            self.manifest['next_segment'] += 1
+            self.manifest['pending_snapshot'] = name      # Giữ chỗ trên đĩa trước khi ghi
+            self._commit()
+        self._write_snapshot(name, recs)
+        with self._lock:
+            old_files = {s['file'] for s in old}
+            self.manifest['segments'] = [s for s in self.manifest['segments'] if s['file'] not in old_files]
+            self.manifest['snapshot'] = {'dir': name, 'count': int(len(recs['seq']))}
+            self.manifest.pop('pending_snapshot', None)
+            # Tombstone đã áp dụng hết vào ảnh chụp thì bỏ (segment thêm sau có seq lớn hơn)
+            tomb = self.manifest['tombstones']
+            for label, seq in snap_tomb.items():
+                if tomb.get(label) == seq:
+                    del tomb[label]
+            self.manifest['dead'] = self._count_dead()
+            self._commit()
+        for fname in old_files:
+            try:
+                os.remove(self._seg_path(fname))
+            except OSError:
+                pass
+        if old_snap:
+            self._remove_snapshot_dir(old_snap['dir'])   # Process khác đang memmap vẫn đọc được (POSIX)
+
+    def _count_dead(self):
+        tomb = self.manifest['tombstones']
+        if not tomb:
+            return 0
+        parts = [self._read_segment(s) for s in self.manifest['segments']]
+        snap = self._snapshot(self.manifest.get('snapshot'))
+        return sum(int((~self._alive_mask(r, tomb)).sum()) for r in parts + ([snap] if snap is not None else []))
+
+    def wait_compaction(self, timeout=None):
+        t = self._compact_thread
+        if t is not None:
+            t.join(timeout)
+
+    def export_npz(self, path):
+        """Xuất toàn bộ gallery còn sống ra 1 file npz (sao lưu / công cụ cũ)."""
+        embs, labels = self.load()
+        np.savez_compressed(path, embs=embs, names=np.array(labels, dtype=str))
@@ -0,0 +1,127 @@
+# identity_voter.py
+"""
+Bỏ phiếu danh tính theo TRACK (face_tracker.py) thay vì quyết định độc lập từng frame.
+
+- Mỗi track giữ cửa sổ `window` embedding gần nhất. Danh tính = kết quả so khớp embedding
+  TRUNG BÌNH của cửa sổ với gallery (ổn định hơn 1 frame lẻ: mờ, nghiêng, che 1 phần),
+  kèm phiếu bầu nhãn của từng frame.
+- KHÓA danh tính khi: đủ `lock_votes` mẫu, độ tương đồng của embedding trung bình
+  >= lock_conf và nhãn đó chiếm đa số phiếu. Track đã khóa chỉ cần FaceNet
+  mỗi `verify_every` frame để kiểm tra lại.
+- Khi kiểm tra lại mà embedding mới lệch xa trung bình cửa sổ (cos < drift_thres: đổi người
+  trong cùng track, tracker ghép nhầm) -> mở khóa và xóa cửa sổ, tích lũy lại từ đầu.
+
+Ví dụ:
+    voter = IdentityVoter(recog.predict_batch)
+    need = [i for i, t in enumerate(tids) if voter.needs_embedding(t, frame_idx)]
+    results = voter.observe_batch([tids[i] for i in need], embs, frame_idx)  # [(nhãn, conf)]
+"""
+from collections import Counter, deque
+
+import numpy as np
+
+UNKNOWN_NAME = "Unknown"
+
+WINDOW       = 10     # Số embedding gần nhất giữ cho mỗi track
+LOCK_VOTES   = 3      # Số mẫu tối thiểu trước khi khóa danh tính
+LOCK_CONF    = 0.70   # Độ tương đồng (embedding trung bình) tối thiểu để khóa
+VERIFY_EVERY = 30     # Track đã khóa: kiểm tra lại mỗi N frame
+DRIFT_THRES  = 0.50   # cos(embedding mới, trung bình) dưới mức này -> mở khóa
+
+
+class TrackVotes:
+    def __init__(self, window):
+        self.embs = deque(maxlen=window)
+        self.labels = deque(maxlen=window)
+        self.locked = None          # Nhãn đã khóa (None = chưa khóa)
+        self.label = UNKNOWN_NAME
+        self.conf = 0.0
+        self.last_frame = None
+
+    def mean_emb(self):
+        m = np.mean(np.stack(self.embs), axis=0)
+        return m / (np.linalg.norm(m) + 1e-9)
+
+    def clear(self):
+        self.embs.clear(); self.labels.clear()
+        self.locked = None
+
+
+class IdentityVoter:
+    """Tích lũy embedding theo track, khóa danh tính khi đủ tin cậy."""
+    def __init__(self, predict_fn, window=WINDOW, lock_votes=LOCK_VOTES, lock_conf=LOCK_CONF,
+                 verify_every=VERIFY_EVERY, drift_thres=DRIFT_THRES):
+        self.predict_fn = predict_fn        # embs (N, D) -> (list nhãn, list conf), vd. recog.predict_batch
+        self.window = int(window)
+        self.lock_votes = int(lock_votes)
+        self.lock_conf = float(lock_conf)
+        self.verify_every = int(verify_every)
+        self.drift_thres = float(drift_thres)
+        self.reset()
+
+    def reset(self):
+        self.tracks = {}
+        self.n_embeddings = 0
+        self.n_unlocks = 0
+
+    def _get(self, track_id):
+        if track_id not in self.tracks:
+            self.tracks[track_id] = TrackVotes(self.window)
+        return self.tracks[track_id]
+
+    def needs_embedding(self, track_id, frame_idx):
+        """Track chưa khóa -> luôn cần; đã khóa -> chỉ khi tới lượt kiểm tra lại."""
+        tv = self.tracks.get(track_id)
+        if tv is None or tv.locked is None or tv.last_frame is None:
+            return True
+        return frame_idx - tv.last_frame >= self.verify_every
+
+    def is_locked(self, track_id):
+        tv = self.tracks.get(track_id)
+        return tv is not None and tv.locked is not None
+
+    def observe_batch(self, track_ids, embs, frame_idx):
+        """Thêm embedding (đã chuẩn hóa L2) cho các track. Trả về [(nhãn, conf)] cùng thứ tự."""
+        if len(track_ids) == 0:
+            return []
+        embs = np.asarray(embs, dtype=np.float32)
+        labels, _ = self.predict_fn(embs)
+        self.n_embeddings += len(track_ids)
+        for tid, e, lab in zip(track_ids, embs, labels):
+            tv = self._get(tid)
+            if tv.locked is not None and float(e @ tv.mean_emb()) < self.drift_thres:
+                tv.clear()
+                self.n_unlocks += 1
+            tv.embs.append(e); tv.labels.append(lab)
+            tv.last_frame = frame_idx
+        means = np.stack([self.tracks[t].mean_emb() for t in track_ids])
+        mean_labels, mean_confs = self.predict_fn(means)
+        out = []
+        for tid, lab, conf in zip(track_ids, mean_labels, mean_confs):
+            tv = self.tracks[tid]
+            tv.label, tv.conf = lab, float(conf)
+            if tv.locked is None and lab != UNKNOWN_NAME and len(tv.embs) >= self.lock_votes \
+                    and tv.conf >= self.lock_conf:
+                top, n = Counter(tv.labels).most_common(1)[0]
+                if top == lab and n * 2 > len(tv.labels):
+                    tv.locked = lab
+            out.append((tv.label, tv.conf))
+        return out
+
+    def track_embeddings(self, track_id):
+        """Các embedding gần nhất của track (N, D) — dùng làm mẫu khi đăng ký khuôn mặt."""
+        tv = self.tracks.get(track_id)
+        if tv is None or not tv.embs:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(tv.embs)
+
+    def prune(self, active_ids):
+        """Bỏ trạng thái của track đã bị tracker xóa."""
+        active = set(active_ids)
+        for tid in [t for t in self.tracks if t not in active]:
+            del self.tracks[tid]
+
+    def stats(self):
+        return {'tracks': len(self.tracks),
+                'locked': sum(1 for tv in self.tracks.values() if tv.locked is not None),
+                'embeddings': self.n_embeddings, 'unlocks': self.n_unlocks}
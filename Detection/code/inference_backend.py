@@ -0,0 +1,307 @@
+# inference_backend.py
+"""
+Chọn backend suy luận cho model YOLO dò khuôn mặt (yolov8s-face-lindevs.pt).
+
+- torch:    PyTorch (.pt) như trước, dùng khi có GPU.
+- onnx:     ONNX Runtime (CPU).
+- openvino: OpenVINO IR (CPU Intel).
+
+Bản export được tạo 1 lần và cache cạnh file .pt, tên gắn mã hash nội dung file:
+    yolov8s-face-lindevs.<hash>.onnx
+    yolov8s-face-lindevs.<hash>_openvino_model/
+    yolov8s-face-lindevs.<hash>.backend.json   (backend nhanh nhất đã đo)
+Đổi file .pt -> hash đổi -> tự export lại.
+
+Bản INT8 (quantize_models.py, chỉ được ghi khi qua ngưỡng độ chính xác) cũng nằm cạnh .pt:
+    yolov8s-face-lindevs.<hash>.int8.onnx / yolov8s-face-lindevs.<hash>_int8_openvino_model/
+Khi chạy trên CPU, nếu có bản INT8 thì nó được ưu tiên.
+
+Mọi backend đều trả về đối tượng ultralytics.YOLO nên code gọi model(frame, conf=...)
+không cần sửa.
+
+Ví dụ:
+    model = load_detector(MODEL_PATH)                  # auto: CPU -> backend nhanh nhất
+    model = load_detector(MODEL_PATH, backend="onnx")
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import importlib.util
+
+import numpy as np
+
+BACKEND_AUTO     = "auto"
+BACKEND_TORCH    = "torch"
+BACKEND_ONNX     = "onnx"
+BACKEND_OPENVINO = "openvino"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_OPENVINO)
+
+EXPORT_IMGSZ   = 640   # Kích thước ảnh khi export (model export dạng dynamic)
+PROBE_RUNS     = 10    # Số lần suy luận khi đo backend lúc khởi động
+PROBE_SHAPE    = (480, 640, 3)
+
+
+def file_hash(path, n_chars=12):
+    """sha256 nội dung file (rút gọn) dùng làm khóa cache."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:n_chars]
+
+
+def backend_available(backend):
+    """Backend có dùng được trên máy này không (đã cài thư viện runtime)."""
+    if backend == BACKEND_TORCH:
+        return importlib.util.find_spec("torch") is not None
+    if backend == BACKEND_ONNX:
+        return importlib.util.find_spec("onnxruntime") is not None
+    if backend == BACKEND_OPENVINO:
+        return importlib.util.find_spec("openvino") is not None
+    return False
+
+
+def available_backends():
+    return [b for b in BACKENDS if backend_available(b)]
+
+
+def _default_device():
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def _cache_prefix(pt_path):
+    stem = os.path.splitext(os.path.abspath(pt_path))[0]
+    return f"{stem}.{file_hash(pt_path)}"
+
+
+def cached_export_path(pt_path, backend):
+    """Đường dẫn bản export trong cache (có thể chưa tồn tại)."""
+    prefix = _cache_prefix(pt_path)
+    if backend == BACKEND_ONNX:
+        return prefix + ".onnx"
+    if backend == BACKEND_OPENVINO:
+        return prefix + "_openvino_model"
+    return pt_path
+
+
+def quantized_export_path(pt_path, backend):
+    """Đường dẫn bản INT8 đã công bố (có thể chưa tồn tại)."""
+    prefix = _cache_prefix(pt_path)
+    if backend == BACKEND_ONNX:
+        return prefix + ".int8.onnx"
+    if backend == BACKEND_OPENVINO:
+        return prefix + "_int8_openvino_model"
+    return None
+
+
+def find_quantized(pt_path):
+    """(backend, đường dẫn) của bản INT8 dùng được trên máy này, hoặc (None, None)."""
+    for b in (BACKEND_OPENVINO, BACKEND_ONNX):
+        q = quantized_export_path(pt_path, b)
+        if os.path.exists(q) and backend_available(b):
+            return b, q
+    return None, None
+
+
+def load_yolo(pt_path, device=None, prefer_int8=True, task="detect"):
+    """
+    Tải model YOLO bất kỳ (vd. model hành vi): trên CPU dùng bản INT8 nếu đã công bố,
+    ngược lại tải .pt bằng PyTorch.
+    """
+    from ultralytics import YOLO
+    device = device or _default_device()
+    if prefer_int8 and device != "cuda":
+        b, q = find_quantized(pt_path)
+        if q is not None:
+            try:
+                m = YOLO(q, task=task)
+                m.backend_name = f"{b}-int8"
+                print(f"Dùng bản INT8: {q}")
+                return m
+            except Exception as e:
+                print(f"Không tải được bản INT8 {q} ({e}), dùng FP32.")
+    m = YOLO(pt_path)
+    m.backend_name = BACKEND_TORCH
+    return m
+
+
+def export_cached(pt_path, backend, imgsz=EXPORT_IMGSZ):
+    """Export .pt sang ONNX / OpenVINO nếu chưa có trong cache. Trả về đường dẫn bản export."""
+    if backend == BACKEND_TORCH:
+        return pt_path
+    target = cached_export_path(pt_path, backend)
+    if os.path.exists(target):
+        return target
+    from ultralytics import YOLO
+    print(f"Đang export {os.path.basename(pt_path)} -> {backend} (chỉ làm 1 lần)...")
+    fmt = "onnx" if backend == BACKEND_ONNX else "openvino"
+    # dynamic=True: giữ được batch (offline) và imgsz thay đổi (adaptive_scheduler)
+    out = YOLO(pt_path).export(format=fmt, imgsz=imgsz, dynamic=True, verbose=False)
+    out = str(out)
+    if os.path.abspath(out) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        shutil.move(out, target)
+    print(f"Đã lưu bản export: {target}")
+    return target
+
+
+def _load(pt_path, backend, device=None):
+    from ultralytics import YOLO
+    if backend == BACKEND_TORCH:
+        m = YOLO(pt_path)
+        if device == "cuda":
+            m.to("cuda")
+        try: m.fuse()
+        except Exception: pass
+        return m
+    return YOLO(export_cached(pt_path, backend), task="detect")
+
+
+def probe_latency_ms(model, runs=PROBE_RUNS, shape=PROBE_SHAPE):
+    """Thời gian suy luận trung bình (ms/ảnh) trên ảnh giả, sau 1 lần khởi động."""
+    img = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    model(img, verbose=False)
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        model(img, verbose=False)
+    return (time.perf_counter() - t0) * 1000.0 / runs
+
+
+def _choice_path(pt_path):
+    return _cache_prefix(pt_path) + ".backend.json"
+
+
+def _read_choice(pt_path):
+    try:
+        with open(_choice_path(pt_path), 'r', encoding='utf-8') as f:
+            return json.load(f).get('backend')
+    except Exception:
+        return None
+
+
+def _write_choice(pt_path, backend, timings):
+    try:
+        with open(_choice_path(pt_path), 'w', encoding='utf-8') as f:
+            json.dump({'backend': backend, 'ms_per_image': timings}, f, indent=2)
+    except Exception as e:
+        print(f"Không ghi được lựa chọn backend: {e}")
+
+
+def select_fastest(pt_path, candidates=None):
+    """
+    Export + đo từng backend CPU, trả về (backend nhanh nhất, model đã tải, {backend: ms}).
+    Kết quả được ghi vào cache để lần sau không phải đo lại.
+    """
+    candidates = candidates or available_backends()
+    best, best_model, timings = None, None, {}
+    for b in candidates:
+        try:
+            m = _load(pt_path, b, device="cpu")
+            timings[b] = round(probe_latency_ms(m), 2)
+        except Exception as e:
+            print(f"Bỏ qua backend {b}: {e}")
+            continue
+        print(f"  backend {b}: {timings[b]:.1f} ms/ảnh")
+        if best is None or timings[b] < timings[best]:
+            best, best_model = b, m
+    if best is not None:
+        _write_choice(pt_path, best, timings)
+    return best, best_model, timings
+
+
+def load_detector(pt_path, backend=BACKEND_AUTO, device=None, prefer_int8=True):
+    """
+    Tải model dò mặt với backend chỉ định.
+    auto: có GPU -> torch; CPU -> bản INT8 nếu có, nếu không thì backend đã đo nhanh nhất
+    (đo ở lần chạy đầu rồi cache). Backend lỗi / chưa cài -> quay về torch.
+    """
+    if not os.path.exists(pt_path):
+        raise FileNotFoundError(f"Không tìm thấy model: {pt_path}")
+    device = device or _default_device()
+
+    if prefer_int8 and device != "cuda" and backend != BACKEND_TORCH:
+        b, q = find_quantized(pt_path)
+        if q is not None and backend in (BACKEND_AUTO, b):
+            try:
+                from ultralytics import YOLO
+                model = YOLO(q, task="detect")
+                model.backend_name = f"{b}-int8"
+                print(f"Dùng bản INT8: {q}")
+                return model
+            except Exception as e:
+                print(f"Không tải được bản INT8 {q} ({e}), dùng FP32.")
+
+    if backend == BACKEND_AUTO:
+        if device == "cuda":
+            backend = BACKEND_TORCH
+        else:
+            cached = _read_choice(pt_path)
+            if cached and backend_available(cached):
+                backend = cached
+            else:
+                print("Đang đo các backend suy luận (chỉ làm 1 lần)...")
+                best, model, _ = select_fastest(pt_path)
+                if model is not None:
+                    print(f"Dùng backend: {best}")
+                    model.backend_name = best
+                    return model
+                backend = BACKEND_TORCH
+
+    if backend != BACKEND_TORCH and not backend_available(backend):
+        print(f"Chưa cài runtime cho backend {backend}, dùng torch.")
+        backend = BACKEND_TORCH
+    try:
+        model = _load(pt_path, backend, device=device)
+    except Exception as e:
+        if backend == BACKEND_TORCH:
+            raise
+        print(f"Không tải được backend {backend} ({e}), dùng torch.")
+        backend = BACKEND_TORCH
+        model = _load(pt_path, backend, device=device)
+    model.backend_name = backend
+    return model
+
+
+def limit_threads(model, n):
+    """
+    Giới hạn số luồng intra-op của 1 model YOLO đã tải, theo PHIÊN của backend:
+      onnx:     tạo lại onnxruntime.InferenceSession với intra_op_num_threads=n
+      openvino: compile lại model với INFERENCE_NUM_THREADS=n
+    torch: không chia được trong cùng process (torch.set_num_threads là thiết lập TOÀN process,
+    luồng nào gọi sau cùng thì thắng) -> trả về False; muốn chia cứng thì dùng backend trên
+    hoặc mỗi model 1 process (mp_pipeline.py).
+    Trả về True nếu đã áp dụng.
+    """
+    backend = str(getattr(model, 'backend_name', BACKEND_TORCH)).split("-")[0]
+    if backend not in (BACKEND_ONNX, BACKEND_OPENVINO):
+        return False
+    try:
+        if getattr(model, 'predictor', None) is None:
+            model(np.zeros(PROBE_SHAPE, dtype=np.uint8), verbose=False)   # ultralytics tạo AutoBackend lúc gọi đầu
+        be = model.predictor.model
+        path = str(getattr(model, 'model_name', None) or model.ckpt_path)
+        n = max(1, int(n))
+        if backend == BACKEND_ONNX:
+            import onnxruntime as ort
+            so = ort.SessionOptions()
+            so.intra_op_num_threads = n
+            so.inter_op_num_threads = 1
+            be.session = ort.InferenceSession(path, sess_options=so, providers=be.session.get_providers())
+        else:
+            import openvino as ov
+            from pathlib import Path
+            xml = next(Path(path).glob("*.xml")) if os.path.isdir(path) else Path(path)
+            core = ov.Core()
+            be.ov_compiled_model = core.compile_model(core.read_model(str(xml)), "CPU",
+                                                      config={"INFERENCE_NUM_THREADS": n, "PERFORMANCE_HINT": "LATENCY"})
+        return True
+    except Exception as e:
+        print(f"Không giới hạn được số luồng của backend {backend}: {e}")
+        return False
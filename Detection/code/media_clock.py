@@ -0,0 +1,89 @@
+# media_clock.py
+"""
+Đồng hồ dùng chung cho mọi logic theo thời gian (timer ngủ gật, phạt dùng điện thoại,
+MAX_FRAME_INTERVAL...).
+
+- WallClock:  thời gian thực (time.time()) - dùng cho webcam / camera trực tiếp.
+- MediaClock: thời gian của VIDEO, lấy từ CAP_PROP_POS_MSEC (hoặc số frame / fps).
+  Xử lý video nhanh hơn thời gian thực (offline) vẫn cho timer và điểm giống như
+  khi phát video ở tốc độ bình thường; tạm dừng video thì đồng hồ cũng dừng.
+
+FocusScoreManager và BieuCamAnalyzer nhận đồng hồ qua tham số clock=...
+"""
+import time
+
+import cv2
+
+
+class WallClock:
+    """Đồng hồ thời gian thực."""
+    def now(self):
+        return time.time()
+
+    def __repr__(self):
+        return "WallClock()"
+
+
+WALL_CLOCK = WallClock()
+
+
+class MediaClock:
+    """
+    Đồng hồ theo timestamp của video (giây).
+
+    monotonic=True: nếu thời gian video lùi lại (tua về đầu, phát lặp) thì đồng hồ
+    vẫn tiếp tục tăng từ giá trị cũ, để các timer không bị âm.
+    """
+    def __init__(self, origin=0.0, monotonic=True, default_fps=30.0):
+        self.monotonic = monotonic
+        self.default_fps = float(default_fps)
+        self._media_t = float(origin)
+        self._offset = 0.0
+        self._last = float(origin)
+
+    def now(self):
+        return self._last
+
+    def set(self, media_t):
+        """Đặt thời gian video hiện tại (giây)."""
+        media_t = float(media_t)
+        if self.monotonic and media_t + self._offset < self._last:
+            # Video lùi lại -> dời offset để đồng hồ nối tiếp (cộng thêm 1 frame)
+            self._offset = self._last - media_t + 1.0 / self.default_fps
+        self._media_t = media_t
+        self._last = media_t + self._offset
+        return self._last
+
+    def advance(self, dt):
+        return self.set(self._media_t + float(dt))
+
+    def set_frame(self, frame_index, fps=None):
+        """Đặt thời gian theo số thứ tự frame (bắt đầu từ 0)."""
+        fps = fps if (fps and fps > 1e-3) else self.default_fps
+        return self.set(frame_index / fps)
+
+    def update_from_capture(self, cap, frame_index=None, fps=None):
+        """
+        Cập nhật từ cv2.VideoCapture sau khi read(): ưu tiên CAP_PROP_POS_MSEC,
+        nếu backend không hỗ trợ (trả về 0 / âm) thì dùng frame_index / fps.
+        """
+        try:
+            msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+        except Exception:
+            msec = 0.0
+        if msec and msec > 0:
+            return self.set(msec / 1000.0)
+        if frame_index is None:
+            try:
+                frame_index = max(0.0, cap.get(cv2.CAP_PROP_POS_FRAMES) - 1)
+            except Exception:
+                frame_index = 0
+        if fps is None:
+            try:
+                fps = cap.get(cv2.CAP_PROP_FPS)
+            except Exception:
+                fps = None
+        return self.set_frame(frame_index, fps)
+
+    def __repr__(self):
+        return f"MediaClock(now={self._last:.3f})"
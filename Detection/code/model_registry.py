@@ -0,0 +1,182 @@
+# model_registry.py
+"""
+Kho model dùng chung cho CẢ process (singleton): mỗi model chỉ tải 1 lần, mọi màn hình
+(Camera tạo lại mỗi lần vào trang) và test đều nhận cùng 1 đối tượng.
+
+    MODELS.get(FACE_DETECTOR)   -> YOLO dò mặt (inference_backend.load_detector)
+    MODELS.get(RECOGNIZER)      -> RecognitionEngine (FaceNet vggface2)
+    MODELS.get(BEHAVIOR)        -> (model YOLO hành vi hoặc None, names)
+    MODELS.get(FACE_MESH)       -> MediaPipe FaceMesh
+
+- Tải lười: model chỉ được tải ở lần get() đầu tiên. Mỗi model có khóa riêng nên 2 luồng
+  cùng get() thì luồng sau chờ luồng đầu tải xong, không tải 2 lần.
+- warm_up_async(): tải + chạy thử 1 frame giả ở luồng nền (gọi sau khi đăng nhập), để lần
+  đầu mở Camera không phải chờ tải model / khởi tạo CUDA.
+
+Lưu ý: RecognitionEngine chứa cả gallery (embs, names) -> Camera nạp lại kho faces_db.store mỗi lần
+mở như trước. FaceMesh có trạng thái tracking nên chỉ 1 màn hình dùng tại 1 thời điểm;
+chế độ nhiều luồng video (multi_stream.py) vẫn tạo FaceMesh riêng cho từng luồng.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+
+FACE_DETECTOR = "face_detector"
+RECOGNIZER    = "recognizer"
+BEHAVIOR      = "behavior"
+FACE_MESH     = "face_mesh"
+
+# ===== CẤU HÌNH =====
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH    = os.path.join(BASE_DIR, "..", "yolov8s-face-lindevs.pt")
+INFER_BACKEND = "auto"
+WARMUP_SHAPE  = (480, 640, 3)
+# =====================
+
+
+def _default_device():
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def _load_face_detector(registry):
+    from inference_backend import load_detector
+    return load_detector(registry.model_path, backend=registry.backend, device=registry.device)
+
+
+def _load_recognizer(registry):
+    from recognition_engine import RecognitionEngine
+    return RecognitionEngine(registry.device)
+
+
+def _load_behavior(registry):
+    from behavior_analyzer import load_behavior_model
+    return load_behavior_model()
+
+
+def _load_face_mesh(registry):
+    from behavior_analyzer import create_face_mesh
+    return create_face_mesh()
+
+
+def _warm_face_detector(model, frame):
+    model(frame, verbose=False)
+
+
+def _warm_recognizer(recog, frame):
+    recog.embed_batch(frame, np.array([[200, 120, 360, 320]]))
+
+
+def _warm_behavior(loaded, frame):
+    model, _ = loaded
+    if model is not None:
+        model(frame, verbose=False)
+
+
+def _warm_face_mesh(face_mesh, frame):
+    face_mesh.process(frame[:, :, ::-1].copy())
+
+
+class ModelRegistry:
+    """Kho model tải lười, an toàn luồng. Dùng instance chung MODELS."""
+    def __init__(self, model_path=MODEL_PATH, device=None, backend=INFER_BACKEND):
+        self.model_path = model_path
+        self.device = device or _default_device()
+        self.backend = backend
+        self._loaders = {FACE_DETECTOR: _load_face_detector, RECOGNIZER: _load_recognizer,
+                         BEHAVIOR: _load_behavior, FACE_MESH: _load_face_mesh}
+        self._warmers = {FACE_DETECTOR: _warm_face_detector, RECOGNIZER: _warm_recognizer,
+                         BEHAVIOR: _warm_behavior, FACE_MESH: _warm_face_mesh}
+        self._models = {}
+        self._errors = {}
+        self._load_ms = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._warm_thread = None
+        self._warmed = set()
+
+    def register(self, name, loader, warmer=None):
+        """Thêm / thay loader (loader(registry) -> model). Model đã tải của tên đó bị bỏ."""
+        with self._lock:
+            self._loaders[name] = loader
+            if warmer is not None:
+                self._warmers[name] = warmer
+            self._models.pop(name, None)
+            self._errors.pop(name, None)
+            self._warmed.discard(name)
+
+    def _key_lock(self, name):
+        with self._lock:
+            if name not in self._key_locks:
+                self._key_locks[name] = threading.Lock()
+            return self._key_locks[name]
+
+    def get(self, name):
+        """Model theo tên; tải ở lần gọi đầu. Lỗi tải được ném lại ở mọi lần gọi sau."""
+        if name in self._models:
+            return self._models[name]
+        if name not in self._loaders:
+            raise KeyError(f"Model không có trong registry: {name}")
+        with self._key_lock(name):
+            if name in self._models:
+                return self._models[name]
+            if name in self._errors:
+                raise self._errors[name]
+            t0 = time.perf_counter()
+            try:
+                model = self._loaders[name](self)
+            except Exception as e:
+                self._errors[name] = e
+                raise
+            self._load_ms[name] = round((time.perf_counter() - t0) * 1000, 1)
+            print(f"[registry] Đã tải {name} ({self._load_ms[name]:.0f} ms)")
+            self._models[name] = model
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warm_up(self, names=None):
+        """Tải + chạy thử 1 frame giả cho từng model (bỏ qua model lỗi)."""
+        frame = np.zeros(WARMUP_SHAPE, np.uint8)
+        for name in (names or list(self._loaders)):
+            if name in self._warmed:
+                continue
+            try:
+                model = self.get(name)
+                warmer = self._warmers.get(name)
+                if warmer is not None:
+                    warmer(model, frame)
+                self._warmed.add(name)
+            except Exception as e:
+                print(f"[registry] Bỏ qua warm-up {name}: {e}")
+
+    def warm_up_async(self, names=None):
+        """Warm-up ở luồng nền (daemon). Gọi nhiều lần chỉ chạy 1 luồng."""
+        with self._lock:
+            if self._warm_thread is not None and self._warm_thread.is_alive():
+                return self._warm_thread
+            self._warm_thread = threading.Thread(target=self.warm_up, args=(names,),
+                                                 name="model-warmup", daemon=True)
+            self._warm_thread.start()
+            return self._warm_thread
+
+    def clear(self, name=None):
+        """Bỏ model đã tải (tất cả nếu name=None) để lần get() sau tải lại."""
+        with self._lock:
+            for k in ([name] if name else list(self._models)):
+                self._models.pop(k, None)
+                self._errors.pop(k, None)
+                self._warmed.discard(k)
+
+    def stats(self):
+        return {'loaded': sorted(self._models), 'warmed': sorted(self._warmed),
+                'load_ms': dict(self._load_ms), 'errors': {k: str(e) for k, e in self._errors.items()}}
+
+
+MODELS = ModelRegistry()
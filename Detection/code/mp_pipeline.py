@@ -0,0 +1,386 @@
+# mp_pipeline.py
+"""
+Pipeline nhiều process: mỗi bước AI chạy trong 1 process riêng để dùng hết các nhân CPU
+(thay vì 1 infer_thread chạy tuần tự dưới GIL).
+
+    frame (shared memory) --+--> [face]     YOLO dò mặt --> [embed] FaceNet + so khớp gallery
+                            +--> [behavior] YOLO hành vi
+                            +--> [mesh]     MediaPipe FaceMesh
+
+- Frame chỉ được ghi 1 lần vào vùng nhớ dùng chung (multiprocessing.shared_memory);
+  các worker đọc trực tiếp theo chỉ số slot, không pickle ảnh qua Queue.
+- Kết quả của các worker được ghép lại theo số thứ tự frame (seq) và trả ra đúng thứ tự.
+- Phần gán hành vi / chấm điểm (nhẹ) vẫn chạy ở process chính.
+"""
+import os
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from collections import deque
+
+import numpy as np
+
+STAGE_FACE     = "face"
+STAGE_EMBED    = "embed"
+STAGE_BEHAVIOR = "behavior"
+STAGE_MESH     = "mesh"
+
+WORKER_START_TIMEOUT = 300.0   # Giây chờ worker tải model
+RESULT_POLL_INTERVAL = 0.5
+RESET_TASK = "reset"           # Lệnh cho worker: video mới, xóa trạng thái theo video
+
+
+class SharedFrameRing:
+    """n_slots frame (cùng shape, uint8) nằm liên tiếp trong 1 khối shared memory."""
+    def __init__(self, n_slots, frame_shape, name=None):
+        self.n_slots = int(n_slots)
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=self.frame_bytes * self.n_slots if create else 0)
+        self._owner = create
+        self._frames = np.ndarray((self.n_slots,) + self.frame_shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    @classmethod
+    def attach(cls, name, n_slots, frame_shape):
+        return cls(n_slots, frame_shape, name=name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def frame(self, slot):
+        return self._frames[slot]
+
+    def close(self):
+        self._frames = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if self._owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# =============================================================================
+# PHẦN CHẠY TRONG WORKER PROCESS
+# =============================================================================
+
+def _make_stage_handler(stage, options):
+    """Tải model của stage (trong worker) và trả về hàm handler(seq, frame, payload)."""
+    if stage == STAGE_FACE:
+        from offline_engine import load_face_model
+        model = load_face_model(options['model_path'], options['device'], options.get('backend', 'auto'))
+        conf = options['conf_thres']
+
+        def handle(seq, frame, payload):
+            res = model(frame, conf=conf, verbose=False)[0]
+            boxes  = res.boxes.xyxy.cpu().numpy().astype(int) if res.boxes else np.zeros((0,4), dtype=int)
+            scores = res.boxes.conf.cpu().numpy().tolist()   if res.boxes else []
+            return {'boxes': boxes, 'scores': scores}
+        return handle
+
+    if stage == STAGE_EMBED:
+        from recognition_engine import RecognitionEngine
+        recog = RecognitionEngine(options['device'], recog_thres=options['recog_thres'],
+                                  face_margin=options['face_margin'])
+        from gallery_store import store_exists
+        if options.get('db_path') and store_exists(options['db_path']):
+            recog.load_db(options['db_path'])
+
+        def handle(seq, frame, payload):
+            embs, idx = recog.embed_batch(frame, payload)
+            if embs is None:
+                return {'idx': [], 'names': [], 'confs': []}
+            names, confs = recog.predict_batch(embs)
+            return {'idx': list(idx), 'names': names, 'confs': confs}
+        return handle
+
+    if stage == STAGE_BEHAVIOR:
+        from behavior_analyzer import load_behavior_model, parse_behavior_result, BEHAVIOR_CONF_THRES
+        model, names = load_behavior_model()
+        skip = max(1, int(options.get('behavior_frame_skip', 1)))
+        state = {'count': 0, 'last': []}
+
+        def handle(seq, frame, payload):
+            # Giữ nhịp bỏ frame giống BieuCamAnalyzer._detect_behaviors
+            if model is None:
+                return []
+            state['count'] = (state['count'] + 1) % skip
+            if state['count'] == 0:
+                bres = model(frame, conf=BEHAVIOR_CONF_THRES, verbose=False)[0]
+                state['last'] = parse_behavior_result(bres, names)
+            return state['last']
+
+        def reset():
+            state['count'], state['last'] = 0, []
+        handle.reset = reset
+        return handle
+
+    if stage == STAGE_MESH:
+        from behavior_analyzer import create_face_mesh
+        import cv2
+        face_mesh = create_face_mesh()
+
+        def handle(seq, frame, payload):
+            h, w = frame.shape[:2]
+            results = face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if not results.multi_face_landmarks:
+                return np.zeros((0, 0, 2), dtype=np.int32)
+            return np.array([[(int(lm.x * w), int(lm.y * h)) for lm in fl.landmark]
+                             for fl in results.multi_face_landmarks], dtype=np.int32)
+        return handle
+
+    raise ValueError(f"Stage không hợp lệ: {stage}")
+
+
+def _worker_main(stage, shm_name, n_slots, frame_shape, task_q, result_q, options):
+    try:
+        import torch
+        torch.set_num_threads(max(1, int(options.get('threads', 1))))
+    except Exception:
+        pass
+    ring = None
+    try:
+        ring = SharedFrameRing.attach(shm_name, n_slots, frame_shape)
+        handle = _make_stage_handler(stage, options)
+    except Exception as e:
+        result_q.put((stage, -1, None, 0.0, f"Lỗi khởi tạo worker {stage}: {e}"))
+        if ring is not None:
+            ring.close()
+        return
+    result_q.put((stage, -1, 'ready', 0.0, None))
+
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        if task == RESET_TASK:
+            if hasattr(handle, 'reset'):
+                handle.reset()
+            continue
+        seq, slot, payload = task
+        t0 = time.perf_counter()
+        err = None
+        try:
+            res = handle(seq, ring.frame(slot), payload)
+        except Exception as e:
+            res, err = None, str(e)
+        result_q.put((stage, seq, res, (time.perf_counter() - t0) * 1000, err))
+    ring.close()
+
+
+# =============================================================================
+# PHẦN ĐIỀU PHỐI Ở PROCESS CHÍNH
+# =============================================================================
+
+class ProcessStagePipeline:
+    """
+    Điều phối các worker process. Cách dùng:
+
+        pipe = ProcessStagePipeline(options, frame_shape=(480, 640, 3))
+        pipe.start()
+        slot = pipe.acquire_slot()                 # chờ nếu mọi slot đang bận
+        cv2.resize(f, (640, 480), dst=pipe.frame(slot))
+        pipe.submit(slot, meta={'t': 0.0})
+        for joined in pipe.pop_ready(): ...        # kết quả theo đúng thứ tự seq
+        for joined in pipe.flush(): ...            # cuối video
+        pipe.close()
+
+    options: model_path, db_path, device, backend, conf_thres, recog_thres, face_margin,
+             enable_recognition, enable_behavior, behavior_frame_skip, recog_every_n.
+    """
+    def __init__(self, options, frame_shape, n_slots=8, threads_per_worker=None):
+        self.options = dict(options)
+        self.frame_shape = tuple(frame_shape)
+        self.n_slots = int(n_slots)
+
+        self.stages = [STAGE_FACE]
+        if self.options.get('enable_recognition', True):
+            self.stages.append(STAGE_EMBED)
+        if self.options.get('enable_behavior', True):
+            self.stages += [STAGE_BEHAVIOR, STAGE_MESH]
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // len(self.stages))
+        self.options['threads'] = threads_per_worker
+
+        self.ring = None
+        self.result_q = None
+        self.task_qs = {}
+        self.procs = {}
+        self._free_slots = deque(range(self.n_slots))
+        self._next_seq = 1
+        self._next_emit = 1
+        self._frames_before = 0   # Số frame của các video trước (reset)
+        self._pending = {}   # seq -> dict trạng thái ghép
+        self._done = {}      # seq -> kết quả đã ghép đủ, chờ trả theo thứ tự
+        self.stage_ms = {s: 0.0 for s in self.stages}
+        self.stage_calls = {s: 0 for s in self.stages}
+        self.errors = 0
+
+    # ------------------------------------------------------------------
+    def start(self):
+        ctx = mp.get_context("spawn")   # An toàn với torch / Windows
+        self.ring = SharedFrameRing(self.n_slots, self.frame_shape)
+        self.result_q = ctx.Queue()
+        for stage in self.stages:
+            q = ctx.Queue()
+            p = ctx.Process(target=_worker_main, name=f"stage-{stage}",
+                            args=(stage, self.ring.name, self.n_slots, self.frame_shape,
+                                  q, self.result_q, self.options), daemon=True)
+            p.start()
+            self.task_qs[stage] = q
+            self.procs[stage] = p
+
+        ready = set()
+        deadline = time.time() + WORKER_START_TIMEOUT
+        try:
+            while len(ready) < len(self.stages):
+                try:
+                    stage, seq, res, _, err = self.result_q.get(timeout=RESULT_POLL_INTERVAL)
+                except queue.Empty:
+                    self._check_workers()
+                    if time.time() > deadline:
+                        raise TimeoutError("Worker khởi động quá lâu.")
+                    continue
+                if err:
+                    raise RuntimeError(err)
+                if res == 'ready':
+                    ready.add(stage)
+        except Exception:
+            self.close()     # Không để lại shared memory / worker còn sống
+            raise
+        print(f"Pipeline đa process sẵn sàng: {self.stages} "
+              f"({self.options['threads']} luồng torch/worker, {self.n_slots} slot)")
+        return self
+
+    def reset(self):
+        """
+        Bắt đầu video mới: bỏ frame còn dở, seq đếm lại từ 1 và worker xóa trạng thái theo video
+        (nhịp bỏ frame + hành vi cũ của stage behavior). Lệnh reset đi cùng hàng đợi với frame
+        nên được xử lý trước mọi frame của video mới.
+        """
+        for _ in self.flush():
+            pass
+        self._frames_before += self._next_seq - 1
+        self._next_seq = self._next_emit = 1
+        self._done.clear()
+        for q in self.task_qs.values():
+            q.put(RESET_TASK)
+
+    def close(self):
+        for q in self.task_qs.values():
+            try: q.put(None)
+            except Exception: pass
+        for p in self.procs.values():
+            p.join(timeout=5.0)
+            if p.is_alive():
+                p.terminate()
+        self.task_qs, self.procs = {}, {}
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _check_workers(self):
+        for stage, p in self.procs.items():
+            if not p.is_alive():
+                raise RuntimeError(f"Worker '{stage}' đã dừng bất thường (exitcode={p.exitcode}).")
+
+    # ------------------------------------------------------------------
+    def frame(self, slot):
+        """Mảng numpy (ghi được) của slot trong shared memory."""
+        return self.ring.frame(slot)
+
+    def acquire_slot(self):
+        """Lấy slot trống để ghi frame; nếu tất cả đang được xử lý thì chờ kết quả trả về."""
+        while not self._free_slots:
+            self._collect(block=True)
+        return self._free_slots.popleft()
+
+    def release_slot(self, slot):
+        """Trả lại slot chưa submit (vd: đọc frame thất bại)."""
+        self._free_slots.appendleft(slot)
+
+    def submit(self, slot, meta=None):
+        """Giao frame trong slot cho các worker. Trả về seq của frame."""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._pending[seq] = {'seq': seq, 'slot': slot, 'meta': meta or {},
+                              'waiting': set(self.stages), 'stage_ms': {}}
+        for stage in (STAGE_FACE, STAGE_BEHAVIOR, STAGE_MESH):
+            if stage in self.task_qs:
+                self.task_qs[stage].put((seq, slot, None))
+        return seq
+
+    def _collect(self, block):
+        """Nhận 1 kết quả từ worker (chờ nếu block=True). Trả về False nếu không có gì."""
+        while True:
+            try:
+                stage, seq, res, ms, err = self.result_q.get(timeout=RESULT_POLL_INTERVAL if block else 0.0)
+                break
+            except queue.Empty:
+                if not block:
+                    return False
+                self._check_workers()
+        item = self._pending.get(seq)
+        if item is None:
+            return True
+        if err:
+            self.errors += 1
+            print(f"Lỗi stage '{stage}' frame {seq}: {err}")
+        self.stage_ms[stage] += ms
+        self.stage_calls[stage] += 1
+        item[stage] = res
+        item['stage_ms'][stage] = round(ms, 2)
+        item['waiting'].discard(stage)
+
+        if stage == STAGE_FACE and STAGE_EMBED in self.stages:
+            boxes = res['boxes'] if res else np.zeros((0, 4), dtype=int)
+            every_n = max(1, int(self.options.get('recog_every_n', 1)))
+            if len(boxes) > 0 and seq % every_n == 0:
+                self.task_qs[STAGE_EMBED].put((seq, item['slot'], boxes))
+            else:
+                item[STAGE_EMBED] = None   # Không cần nhận diện ở frame này
+                item['waiting'].discard(STAGE_EMBED)
+
+        if not item['waiting']:
+            del self._pending[seq]
+            self._free_slots.append(item.pop('slot'))
+            del item['waiting']
+            self._done[seq] = item
+        return True
+
+    def pop_ready(self):
+        """Trả về (không chờ) các frame đã ghép đủ, theo đúng thứ tự seq."""
+        while self._collect(block=False):
+            pass
+        while self._next_emit in self._done:
+            yield self._done.pop(self._next_emit)
+            self._next_emit += 1
+
+    def flush(self):
+        """Chờ toàn bộ frame đã submit xử lý xong và trả về theo thứ tự."""
+        while self._pending:
+            self._collect(block=True)
+        yield from self.pop_ready()
+
+    def stats(self):
+        return {
+            'stages': list(self.stages),
+            'frames_submitted': self._frames_before + self._next_seq - 1,
+            'frames_emitted': self._frames_before + self._next_emit - 1,
+            'errors': self.errors,
+            'stage_avg_ms': {s: round(self.stage_ms[s] / self.stage_calls[s], 2) if self.stage_calls[s] else 0.0
+                             for s in self.stages},
+        }
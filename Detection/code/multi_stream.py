@@ -0,0 +1,258 @@
+# multi_stream.py
+"""
+Chế độ NHIỀU LỚP HỌC: 1 process phục vụ nhiều luồng video cùng lúc.
+
+- Model nặng (YOLO dò mặt, FaceNet, YOLO hành vi) chỉ tải 1 lần và dùng chung
+  (SharedModels) thay vì mỗi Camera tải 1 bản -> RAM không tăng theo số lớp.
+- Mỗi vòng lặp đọc 1 frame từ mỗi luồng và chạy suy luận THEO LÔ qua các luồng:
+  1 lần YOLO dò mặt cho cả lô, 1 lần FaceNet cho mọi khuôn mặt, 1 lần YOLO hành vi.
+- Trạng thái của từng lớp (FocusScoreManager, bộ đếm, FaceMesh tracking, phiên,
+  file kết quả) nằm riêng trong 1 OfflineVideoEngine cho mỗi luồng.
+
+Ví dụ:
+    python multi_stream.py lop_A.mp4 lop_B.mp4 rtsp://cam-lop-C 0 --out-dir ketqua/
+"""
+import os
+import json
+import time
+import argparse
+import traceback
+
+import cv2
+
+from behavior_analyzer import BEHAVIOR_CONF_THRES, parse_behavior_result
+from offline_engine import (OfflineVideoEngine, SharedModels, boxes_from_result, _to_builtin,
+                            MODEL_PATH, DB_PATH_DEFAULT, CONF_THRES, RECOG_EVERY_N,
+                            VIEW_W, VIEW_H, DEFAULT_FPS)
+from video_decoder import open_capture
+
+
+class StreamContext:
+    """1 luồng video (1 lớp học) và engine giữ trạng thái riêng của nó."""
+    def __init__(self, index, source, engine, out_path=None):
+        self.index = index
+        self.source = source
+        self.name = _stream_name(source, index)
+        self.engine = engine
+        self.out_path = out_path
+        self.cap = None
+        self.fout = None
+        self.fps = DEFAULT_FPS
+        self.n = 0
+        self.done = False
+        self.t_start = None
+
+    def open(self):
+        # Mỗi luồng 1 bộ giải mã (PyAV giải mã trước trong luồng nền), frame đã scale sẵn
+        self.cap = open_capture(self.source, size=self.engine.resize)
+        if not self.cap.isOpened():
+            raise IOError(f"Không mở được nguồn video: {self.source}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if (fps and fps > 1e-3) else DEFAULT_FPS
+        self.engine.reset()
+        if self.out_path:
+            self.fout = open(self.out_path, 'w', encoding='utf-8')
+        self.t_start = time.time()
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+        self.done = True
+
+
+def _stream_name(source, index):
+    if str(source).isdigit():
+        return f"cam{source}"
+    stem = os.path.splitext(os.path.basename(str(source).rstrip('/')))[0]
+    return f"{index:02d}_{stem or 'stream'}"
+
+
+class MultiStreamEngine:
+    """
+    sources: list đường dẫn video / URL / chỉ số webcam.
+    Mỗi luồng có 1 OfflineVideoEngine dùng chung SharedModels.
+    """
+    def __init__(self, sources, out_dir=".", model_path=MODEL_PATH, db_path=DB_PATH_DEFAULT,
+                 device=None, resolve_names=False, enable_behavior_analysis=True,
+                 recog_every_n=RECOG_EVERY_N, resize=(VIEW_W, VIEW_H)):
+        self.models = SharedModels(model_path, db_path, device, load_behavior=enable_behavior_analysis)
+        self.enable_behavior_analysis = enable_behavior_analysis
+        self.resize = resize
+        self.out_dir = out_dir
+        self.streams = []
+        for i, src in enumerate(sources):
+            eng = OfflineVideoEngine(device=self.models.device, resolve_names=resolve_names,
+                                     enable_behavior_analysis=enable_behavior_analysis,
+                                     recog_every_n=recog_every_n, resize=resize,
+                                     shared_models=self.models)
+            st = StreamContext(i, src, eng)
+            st.out_path = os.path.join(out_dir, f"{st.name}_frames.jsonl") if out_dir else None
+            self.streams.append(st)
+        self.rounds = 0
+        self.batch_ms = {'detect': 0.0, 'embed': 0.0, 'behavior': 0.0, 'per_stream': 0.0}
+
+    # ------------------------------------------------------------------
+    def step(self, max_frames=None):
+        """
+        Đọc 1 frame từ mỗi luồng còn chạy và xử lý cả lô.
+        Trả về list (StreamContext, record); list rỗng khi mọi luồng đã hết.
+        """
+        batch = []
+        for st in self.streams:
+            if st.done:
+                continue
+            if max_frames is not None and st.n >= max_frames:
+                st.close(); continue
+            ok, frame = st.cap.read()
+            if not ok:
+                st.close(); continue
+            batch.append((st, frame, st.engine.clock.update_from_capture(st.cap, st.n, st.fps)))
+            st.n += 1
+        if not batch:
+            return []
+        self.rounds += 1
+        frames = [f for _, f, _ in batch]
+        m = self.models
+
+        # 1. Dò mặt theo lô (1 lần gọi YOLO cho mọi luồng)
+        t0 = time.perf_counter()
+        dets = [boxes_from_result(r) for r in m.face_model(frames, conf=CONF_THRES, verbose=False)]
+        t1 = time.perf_counter()
+
+        # 2. Nhận diện: gom khuôn mặt của mọi luồng cần nhận diện ở frame này vào 1 lô FaceNet
+        recog_items, recog_owner = [], []
+        idents = [None] * len(batch)
+        for k, (st, frame, _) in enumerate(batch):
+            eng = st.engine
+            eng.frame_count += 1
+            boxes = dets[k][0]
+            n = len(boxes)
+            if n == 0:
+                idents[k] = ([], [], [])
+            elif eng.frame_count % eng.recog_every_n != 0 and len(eng.last_names) == n:
+                idents[k] = (eng.last_names[:], eng.last_confs[:], eng.last_student_ids[:])
+            else:
+                recog_items.append((frame, boxes)); recog_owner.append(k)
+        if recog_items:
+            for k, (embs, idx) in zip(recog_owner, m.recog.embed_multi(recog_items)):
+                eng = batch[k][0].engine
+                n = len(dets[k][0])
+                if embs is None:
+                    idents[k] = eng._map_predictions(n, [], [], [])
+                else:
+                    pred, conf = m.recog.predict_batch(embs)
+                    idents[k] = eng._map_predictions(n, idx, pred, conf)
+        t2 = time.perf_counter()
+
+        # 3. Hành vi theo lô (chỉ các luồng có mặt và tới nhịp chạy model)
+        if self.enable_behavior_analysis and m.behavior_model is not None:
+            due = [k for k, (st, _, _) in enumerate(batch)
+                   if len(dets[k][0]) > 0 and st.engine.analyzer.behavior_due()]
+            if due:
+                try:
+                    bres = m.behavior_model([frames[k] for k in due], conf=BEHAVIOR_CONF_THRES, verbose=False)
+                    for k, r in zip(due, bres):
+                        batch[k][0].engine.analyzer.last_behaviors = parse_behavior_result(r, m.behavior_names)
+                except Exception as e:
+                    print(f"Lỗi model hành vi (lô {len(due)} frame): {e}")
+        t3 = time.perf_counter()
+
+        # 4. FaceMesh + gán hành vi + chấm điểm: riêng từng luồng
+        out = []
+        for k, (st, frame, video_t) in enumerate(batch):
+            eng = st.engine
+            boxes, det_scores = dets[k]
+            try:
+                analysis = None
+                if self.enable_behavior_analysis and len(boxes) > 0:
+                    analysis = eng.analyzer.build_analysis(
+                        [tuple(map(int, b)) for b in boxes], eng.analyzer.last_behaviors,
+                        eng.analyzer.extract_landmarks(frame), t=video_t)
+                names, confs, student_ids = idents[k]
+                rec = eng.assemble_frame(boxes, det_scores, names, confs, student_ids, analysis, video_t)
+            except Exception as e:
+                print(f"[{st.name}] Lỗi xử lý frame {st.n}: {e}")
+                traceback.print_exc()
+                rec = {'frame': st.n, 't': round(video_t, 3), 'faces': [], 'error': str(e)}
+            rec['stream'] = st.name
+            if st.fout is not None:
+                st.fout.write(json.dumps(rec, ensure_ascii=False, default=_to_builtin) + "\n")
+            out.append((st, rec))
+        t4 = time.perf_counter()
+
+        for key, dt in (('detect', t1 - t0), ('embed', t2 - t1), ('behavior', t3 - t2), ('per_stream', t4 - t3)):
+            self.batch_ms[key] += dt * 1000
+        return out
+
+    def run(self, max_frames=None, progress_every=300):
+        """Xử lý mọi luồng tới khi hết. Trả về dict {tên luồng: tổng kết}."""
+        if self.out_dir:
+            os.makedirs(self.out_dir, exist_ok=True)
+        for st in self.streams:
+            try:
+                st.open()
+            except Exception as e:
+                print(f"Bỏ qua luồng {st.source}: {e}")
+                st.close()
+
+        t_start = time.time()
+        try:
+            while True:
+                if not self.step(max_frames=max_frames):
+                    break
+                if progress_every and self.rounds % progress_every == 0:
+                    el = time.time() - t_start
+                    total = sum(st.n for st in self.streams)
+                    print(f"[multi] {self.rounds} vòng, {total} frame ({total / max(el, 1e-6):.1f} FPS tổng)")
+        finally:
+            for st in self.streams:
+                st.close()
+
+        summaries = {}
+        for st in self.streams:
+            if st.t_start is None:
+                continue
+            summary = st.engine.build_summary(st.source, st.n, st.fps, time.time() - st.t_start)
+            summary['stream'] = st.name
+            summaries[st.name] = summary
+        print(f"Hoàn tất {len(summaries)} luồng trong {time.time() - t_start:.1f}s. {self.stats()}")
+        return summaries
+
+    def stats(self):
+        """Thời gian trung bình (ms) mỗi vòng của từng bước theo lô."""
+        r = max(self.rounds, 1)
+        return {'rounds': self.rounds, 'streams': len(self.streams),
+                'avg_ms_per_round': {k: round(v / r, 2) for k, v in self.batch_ms.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phân tích nhiều lớp học cùng lúc với model dùng chung")
+    parser.add_argument("sources", nargs="+", help="File video / URL / chỉ số webcam (0, 1, ...)")
+    parser.add_argument("--out-dir", default=".", help="Thư mục ghi kết quả")
+    parser.add_argument("--model", default=MODEL_PATH, help="Model YOLO dò khuôn mặt")
+    parser.add_argument("--db", default=DB_PATH_DEFAULT, help="File faces_db.npz")
+    parser.add_argument("--device", default=None, help="cpu / cuda (mặc định: tự chọn)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Chỉ xử lý N frame đầu mỗi luồng")
+    parser.add_argument("--recog-every", type=int, default=RECOG_EVERY_N, help="Nhận diện mỗi N frame")
+    parser.add_argument("--no-behavior", action="store_true", help="Tắt phân tích mắt/đầu/hành vi")
+    parser.add_argument("--resolve-names", action="store_true", help="Tra tên học sinh trong MySQL")
+    args = parser.parse_args()
+
+    engine = MultiStreamEngine(args.sources, out_dir=args.out_dir, model_path=args.model, db_path=args.db,
+                               device=args.device, resolve_names=args.resolve_names,
+                               enable_behavior_analysis=not args.no_behavior,
+                               recog_every_n=args.recog_every)
+    summaries = engine.run(max_frames=args.max_frames)
+    for name, summary in summaries.items():
+        path = os.path.join(args.out_dir, f"{name}_summary.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=_to_builtin)
+        print(f"-> [{name}] {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,783 @@
+# offline_engine.py
+"""
+Engine phân tích video OFFLINE (không cần giao diện Tkinter, không cần đăng nhập).
+
+Chạy cùng các bước như màn hình Camera:
+    dò mặt (YOLO) -> nhận diện (FaceNet) -> phân tích (FaceMesh + hành vi) -> chấm điểm
+nhưng đọc video nhanh nhất CPU cho phép (không chờ TARGET_FPS / SLOW_FACTOR) và ghi
+kết quả từng frame ra file JSON Lines.
+
+Ví dụ:
+    python offline_engine.py lop_A_tiet1.mp4 lop_A_tiet2.mp4 --out-dir ketqua/
+    python offline_engine.py lop_A_tiet1.mp4 --pipeline mp     # mỗi bước AI 1 process
+    python offline_engine.py lop_A_tiet1.mp4 --overlap         # các bước chạy gối nhau (thread)
+    python offline_engine.py lop_A_tiet1.mp4 --batch-size auto # YOLO chạy theo lô K frame
+    python offline_engine.py lop_4k.mp4 --full-res --detect-mode roi  # mặt nhỏ ở bàn cuối
+"""
+import os
+import json
+import time
+import argparse
+import traceback
+from collections import deque
+
+import cv2
+import numpy as np
+import torch
+
+from recognition_engine import RecognitionEngine, UNKNOWN_NAME
+from behavior_analyzer import (BieuCamAnalyzer, load_behavior_model, parse_behavior_result,
+                               create_face_mesh, BEHAVIOR_CONF_THRES)
+from focus_manager import FocusScoreManager, calculate_rate
+from stage_scheduler import StageScheduler
+from adaptive_scheduler import AdaptiveController
+from media_clock import MediaClock
+from video_decoder import open_capture, BACKEND_AUTO, BACKEND_OPENCV, BACKEND_PYAV
+from inference_backend import load_detector, BACKENDS as INFER_BACKENDS
+from tiled_detector import TiledFaceDetector, DETECT_FULL, DETECT_MODES, TILE_SIZE
+from gallery_store import store_exists
+
+# ===== CẤU HÌNH (giống camera.py) =====
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH      = os.path.join(BASE_DIR, "..", "yolov8s-face-lindevs.pt")
+DB_PATH_DEFAULT = os.path.join(BASE_DIR, "faces_db.npz")
+
+VIEW_W, VIEW_H  = 640, 480
+CONF_THRES      = 0.45
+RECOG_THRES     = 0.60
+RECOG_EVERY_N   = 1
+FACE_MARGIN     = 0.15
+DEFAULT_FPS     = 30.0
+INFER_BACKEND   = "auto"     # Backend YOLO dò mặt: auto / torch / onnx / openvino (inference_backend.py)
+
+PIPELINE_SERIAL = "serial"   # Mọi bước chạy tuần tự trong process hiện tại
+PIPELINE_MP     = "mp"       # Mỗi bước AI chạy trong 1 process riêng (mp_pipeline.py)
+MP_SLOTS        = 8          # Số frame tối đa đang xử lý cùng lúc ở chế độ mp
+OVERLAP_IN_FLIGHT = 3        # Số frame xử lý cùng lúc khi chạy gối nhau (--overlap)
+BATCH_SIZE      = 1          # Số frame mỗi lần gọi YOLO (1 = từng frame)
+BATCH_SWEEP_SIZES  = (1, 2, 4, 8, 16)   # Các kích thước lô thử khi --batch-size auto
+BATCH_SWEEP_FRAMES = 64                 # Số frame đầu video dùng để đo
+# =====================
+
+
+def load_face_model(path, device, backend=INFER_BACKEND):
+    """Tải model YOLO dò khuôn mặt (không hiển thị hộp thoại lỗi). CPU: có thể dùng ONNX/OpenVINO."""
+    return load_detector(path, backend=backend, device=device)
+
+
+def boxes_from_result(res):
+    """Kết quả YOLO (1 ảnh) -> (boxes int (N,4), scores list)."""
+    boxes  = res.boxes.xyxy.cpu().numpy().astype(int) if res.boxes else np.zeros((0,4), dtype=int)
+    scores = res.boxes.conf.cpu().numpy().tolist()   if res.boxes else []
+    return boxes, scores
+
+
+class SharedModels:
+    """
+    Các model nặng tải 1 lần, dùng chung cho nhiều engine / nhiều luồng video:
+    YOLO dò mặt, FaceNet + gallery, YOLO hành vi. (FaceMesh có trạng thái tracking
+    theo từng luồng video nên mỗi engine giữ 1 cái riêng.)
+    """
+    def __init__(self, model_path=MODEL_PATH, db_path=DB_PATH_DEFAULT, device=None,
+                 load_behavior=True, backend=INFER_BACKEND):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.face_model = load_face_model(model_path, self.device, backend)
+        self.recog = RecognitionEngine(self.device, recog_thres=RECOG_THRES, face_margin=FACE_MARGIN)
+        if db_path and store_exists(db_path):
+            self.recog.load_db(db_path)
+            print(f"Đã tải DB: {db_path} (N={len(self.recog.names)})")
+        else:
+            print(f"Không tìm thấy DB khuôn mặt: {db_path}. Mọi khuôn mặt sẽ là {UNKNOWN_NAME}.")
+        self.behavior_model, self.behavior_names = (load_behavior_model() if load_behavior
+                                                    else (None, {}))
+
+
+def _to_builtin(v):
+    """Chuyển kiểu numpy sang kiểu Python để ghi JSON."""
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, np.ndarray):
+        return v.tolist()
+    return v
+
+
+class OfflineVideoEngine:
+    """
+    Pipeline dò -> nhận diện -> phân tích -> chấm điểm chạy không cần GUI.
+    Model được tải 1 lần, có thể xử lý nhiều video liên tiếp (gọi run() nhiều lần).
+    """
+    def __init__(self, model_path=MODEL_PATH, db_path=DB_PATH_DEFAULT, device=None,
+                 resolve_names=False, enable_behavior_analysis=True,
+                 recog_every_n=RECOG_EVERY_N, resize=(VIEW_W, VIEW_H),
+                 pipeline=PIPELINE_SERIAL, mp_slots=MP_SLOTS, overlap=False, shared_models=None,
+                 batch_size=BATCH_SIZE, target_fps=None, decoder=BACKEND_AUTO,
+                 backend=INFER_BACKEND, detect_mode=DETECT_FULL, tile_size=TILE_SIZE):
+        """shared_models: SharedModels đã tải sẵn (nhiều engine dùng chung, chỉ chế độ serial)."""
+        self.device = device or (shared_models.device if shared_models is not None else None) \
+            or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.pipeline_mode = pipeline
+        self.pipeline = None
+        if pipeline == PIPELINE_MP:
+            # Model được tải trong các worker process, process chính chỉ ghép kết quả
+            if not resize:
+                raise ValueError("Chế độ mp cần kích thước frame cố định (resize).")
+            if not (db_path and store_exists(db_path)):
+                print(f"Không tìm thấy DB khuôn mặt: {db_path}. Mọi khuôn mặt sẽ là {UNKNOWN_NAME}.")
+            from mp_pipeline import ProcessStagePipeline
+            self.model, self.recog = None, None
+            self.analyzer = BieuCamAnalyzer(load_models=False)
+            self.pipeline = ProcessStagePipeline({
+                'model_path': model_path, 'db_path': db_path, 'device': self.device, 'backend': backend,
+                'conf_thres': CONF_THRES, 'recog_thres': RECOG_THRES, 'face_margin': FACE_MARGIN,
+                'enable_recognition': True, 'enable_behavior': enable_behavior_analysis,
+                'behavior_frame_skip': self.analyzer.behavior_frame_skip,
+                'recog_every_n': recog_every_n,
+            }, frame_shape=(resize[1], resize[0], 3), n_slots=mp_slots).start()
+        elif pipeline == PIPELINE_SERIAL and shared_models is not None:
+            self.model = shared_models.face_model
+            self.recog = shared_models.recog
+            # Không tự tải gì thêm: thiếu model hành vi dùng chung thì engine cũng không có.
+            # FaceMesh có trạng thái theo luồng video -> mỗi engine 1 cái riêng.
+            self.analyzer = BieuCamAnalyzer(load_models=False,
+                                            behavior_model=shared_models.behavior_model,
+                                            behavior_names=shared_models.behavior_names,
+                                            face_mesh=create_face_mesh() if enable_behavior_analysis else None)
+        elif pipeline == PIPELINE_SERIAL:
+            self.model = load_face_model(model_path, self.device, backend)
+            self.recog = RecognitionEngine(self.device, recog_thres=RECOG_THRES, face_margin=FACE_MARGIN)
+            if db_path and store_exists(db_path):
+                self.recog.load_db(db_path)
+                print(f"Đã tải DB: {db_path} (N={len(self.recog.names)})")
+            else:
+                print(f"Không tìm thấy DB khuôn mặt: {db_path}. Mọi khuôn mặt sẽ là {UNKNOWN_NAME}.")
+            self.analyzer = BieuCamAnalyzer()
+        else:
+            raise ValueError(f"Pipeline không hợp lệ: {pipeline}")
+        self.clock = MediaClock()   # Thời gian của video, không phải thời gian thực
+        self.focus_manager = FocusScoreManager(base_score=0, clock=self.clock)
+
+        self.resolve_names = resolve_names   # Tra tên học sinh trong MySQL (tùy chọn)
+        self.enable_behavior_analysis = enable_behavior_analysis
+        self.recog_every_n = max(1, int(recog_every_n))
+        self.resize = resize
+        self.decoder = decoder       # auto / opencv / pyav (video_decoder.py)
+        self.overlap = overlap and pipeline == PIPELINE_SERIAL
+        self.batch_size = max(1, int(batch_size))
+        # Điều khiển thích ứng (chỉ ở chế độ tuần tự từng frame): giữ tốc độ xử lý >= target_fps
+        self.target_fps = target_fps
+        self.adaptive = None
+        self._last_det = None
+        self._last_landmarks = None
+        self.last_stage_stats = None
+        # Dò theo ô / ROI cho video độ phân giải cao (tiled_detector.py), không dùng ở chế độ mp
+        self.tiler = None
+        if detect_mode != DETECT_FULL and self.model is not None:
+            self.tiler = TiledFaceDetector(self.model, conf=CONF_THRES, mode=detect_mode, tile_size=tile_size)
+
+        self.id_to_name_cache = {}
+        self.frame_count = 0
+        self.last_names, self.last_confs, self.last_student_ids = [], [], []
+        self.appeared_students = set()
+
+    def reset(self):
+        """Đặt lại trạng thái cho video mới (giữ nguyên model đã tải)."""
+        self._last_det = None
+        self._last_landmarks = None
+        if self.tiler is not None:
+            self.tiler.reset()
+        if self.pipeline is not None:
+            self.pipeline.reset()    # seq (= số frame trong JSONL) đếm lại từ 1 cho mỗi video
+        if (self.target_fps and self.pipeline is None and not self.overlap and self.batch_size == 1):
+            self.adaptive = AdaptiveController(
+                target_fps=self.target_fps,
+                every={'recog': self.recog_every_n, 'behavior': self.analyzer.behavior_frame_skip})
+        self.clock = MediaClock()   # Thời gian của video, không phải thời gian thực
+        self.focus_manager = FocusScoreManager(base_score=0, clock=self.clock)
+        self.analyzer.clock = self.clock
+        self.analyzer.reset_session()
+        self.frame_count = 0
+        self.last_names, self.last_confs, self.last_student_ids = [], [], []
+        self.appeared_students = set()
+
+    def close(self):
+        """Dừng các worker process (chế độ mp)."""
+        if self.pipeline is not None:
+            print(f"Thống kê pipeline: {self.pipeline.stats()}")
+            self.pipeline.close()
+            self.pipeline = None
+
+    # ------------------------------------------------------------------
+    # CÁC BƯỚC CỦA PIPELINE
+    # ------------------------------------------------------------------
+    def detect_faces(self, frame):
+        if self.adaptive is None:
+            if self.tiler is not None:
+                return self.tiler.detect(frame)
+            return boxes_from_result(self.model(frame, conf=CONF_THRES, verbose=False)[0])
+        if not self.adaptive.should_run('detect') and self._last_det is not None:
+            return self._last_det
+        with self.adaptive.measure('detect'):
+            if self.tiler is not None:
+                self._last_det = self.tiler.detect(frame)   # imgsz do từng ô quyết định
+            else:
+                self._last_det = boxes_from_result(
+                    self.model(frame, conf=CONF_THRES, imgsz=self.adaptive.imgsz, verbose=False)[0])
+        return self._last_det
+
+    def detect_faces_batch(self, frames):
+        """YOLO dò mặt trên cả list frame trong 1 lần gọi. Trả về list (boxes, scores)."""
+        if not frames:
+            return []
+        if self.tiler is not None:
+            return [self.tiler.detect(f) for f in frames]   # Các ô của 1 frame đã chạy chung 1 lô
+        return [boxes_from_result(r) for r in self.model(frames, conf=CONF_THRES, verbose=False)]
+
+    def detect_behaviors_batch(self, frames):
+        """YOLO hành vi trên cả list frame trong 1 lần gọi (không bỏ frame). Trả về list hành vi."""
+        model = self.analyzer.behavior_model
+        if model is None or not frames:
+            return [[] for _ in frames]
+        res = model(frames, conf=BEHAVIOR_CONF_THRES, verbose=False)
+        return [parse_behavior_result(r, self.analyzer.behavior_names) for r in res]
+
+    def _lookup_name(self, student_id, id_str):
+        if student_id in self.id_to_name_cache:
+            return self.id_to_name_cache[student_id]
+        name = id_str
+        if self.resolve_names:
+            try:
+                import database
+                student_info = database.get_student_by_id(student_id)
+                if student_info:
+                    name = student_info.get('name', f"ID_{id_str}_NO_NAME")
+                else:
+                    name = f"ID_{id_str}_NOT_FOUND"
+            except Exception as e:
+                print(f"Lỗi tra tên học sinh {student_id}: {e}")
+        self.id_to_name_cache[student_id] = name
+        return name
+
+    def recognize(self, frame, boxes):
+        """Trả về (names, confs, student_ids) theo thứ tự boxes."""
+        n = len(boxes)
+        if n == 0:
+            return [], [], []
+        every = self.adaptive.get_every('recog') if self.adaptive is not None else self.recog_every_n
+        if self.frame_count % every != 0 and len(self.last_names) == n:
+            return self.last_names[:], self.last_confs[:], self.last_student_ids[:]
+
+        if self.adaptive is not None:
+            with self.adaptive.measure('recog'):
+                embs, idx = self.recog.embed_batch(frame, boxes)
+        else:
+            embs, idx = self.recog.embed_batch(frame, boxes)
+        if embs is None:
+            return self._map_predictions(n, [], [], [])
+        pred_names_or_ids, pred_confs = self.recog.predict_batch(embs)
+        return self._map_predictions(n, idx, pred_names_or_ids, pred_confs)
+
+    def _map_predictions(self, n, idx, pred_names_or_ids, pred_confs):
+        """Đổi kết quả so khớp gallery (theo chỉ số mặt idx) sang (names, confs, student_ids)."""
+        names = [UNKNOWN_NAME] * n
+        confs = [0.0] * n
+        student_ids = [None] * n
+        for k, i in enumerate(idx):
+            confs[i] = pred_confs[k]
+            id_str = pred_names_or_ids[k]
+            if id_str == UNKNOWN_NAME:
+                continue
+            try:
+                student_id = int(id_str)
+                student_ids[i] = student_id
+                names[i] = self._lookup_name(student_id, id_str)
+            except ValueError:
+                names[i] = id_str
+        self.last_names, self.last_confs, self.last_student_ids = names, confs, student_ids
+        return names, confs, student_ids
+
+    def analyze(self, frame, boxes):
+        if not self.enable_behavior_analysis or len(boxes) == 0:
+            return None
+        fb = [tuple(map(int, b)) for b in boxes]
+        if self.adaptive is None:
+            return self.analyzer.analyze_frame(frame, face_boxes=fb)
+        ctl, an = self.adaptive, self.analyzer
+        if an.behavior_model is not None and ctl.should_run('behavior'):
+            try:
+                with ctl.measure('behavior'):
+                    an.last_behaviors = an.run_behavior_model(frame, imgsz=ctl.imgsz)
+            except Exception:
+                pass
+        if self._last_landmarks is None or ctl.should_run('mesh'):
+            with ctl.measure('mesh'):
+                self._last_landmarks = an.extract_landmarks(frame)
+        return an.analyze_frame(frame, face_boxes=fb, behaviors=an.last_behaviors,
+                                landmarks=self._last_landmarks)
+
+    def score(self, student_ids, analysis, current_time):
+        """Cập nhật FocusScoreManager giống gui_loop. Trả về list dict kết quả cho từng mặt."""
+        face_states = analysis.get('face_states', []) if isinstance(analysis, dict) else []
+        out = []
+        for i, student_id in enumerate(student_ids):
+            manager_id = student_id if student_id is not None else f"temp_face_{i}"
+            if student_id is not None:
+                self.appeared_students.add(student_id)
+            fs = face_states[i] if i < len(face_states) else {}
+            head_states = fs.get('head_orientation', {}).get('states', []) if fs else []
+            head_state = head_states[0] if head_states else 'HEAD_STRAIGHT'
+            eye_state = fs.get('eye_state', ("NO_FACE", 0))[0] if fs else "NO_FACE"
+            behaviors = fs.get('behaviors', []) if fs else []
+            logs = []
+            try:
+                _, logs = self.focus_manager.update_student_score(
+                    manager_id, [b.get('label', 'unknown') for b in behaviors],
+                    head_state, eye_state, current_time
+                )
+            except Exception as e:
+                print(f"Lỗi khi cập nhật điểm cho {manager_id}: {e}")
+            out.append({
+                'eye_state': eye_state,
+                'head_states': head_states,
+                'behaviors': [{'label': b.get('label', ''), 'conf': round(float(b.get('conf', 0.0)), 4),
+                               'xy': [int(v) for v in b.get('xy', (0, 0, 0, 0))]} for b in behaviors],
+                'score': self.focus_manager.get_student_score(manager_id),
+                'logs': logs,
+            })
+        return out
+
+    def process_frame(self, frame, current_time):
+        """Chạy toàn bộ pipeline trên 1 frame (BGR). Trả về dict kết quả của frame."""
+        self.frame_count += 1
+        boxes, det_scores = self.detect_faces(frame)
+        names, confs, student_ids = self.recognize(frame, boxes)
+        analysis = self.analyze(frame, boxes)
+        if self.adaptive is not None:
+            self.adaptive.frame_done()
+        return self.assemble_frame(boxes, det_scores, names, confs, student_ids, analysis, current_time)
+
+    def assemble_frame(self, boxes, det_scores, names, confs, student_ids, analysis, current_time,
+                       frame_no=None):
+        """Chấm điểm và đóng gói kết quả 1 frame (dùng chung cho mọi chế độ chạy)."""
+        per_face = self.score(student_ids, analysis, current_time)
+        faces = []
+        for i, b in enumerate(boxes):
+            face = {
+                'box': [int(v) for v in b],
+                'det_conf': round(float(det_scores[i]), 4) if i < len(det_scores) else 0.0,
+                'student_id': student_ids[i],
+                'name': names[i],
+                'sim': round(float(confs[i]), 4),
+            }
+            face.update(per_face[i])
+            faces.append(face)
+        return {'frame': frame_no or self.frame_count, 't': round(float(current_time), 3), 'faces': faces}
+
+    def process_batch(self, frames, times):
+        """
+        Xử lý K frame liên tiếp: YOLO dò mặt và YOLO hành vi chạy 1 lần cho cả lô,
+        FaceNet 1 lần cho mọi khuôn mặt cần nhận diện. Kết quả giống gọi process_frame
+        lần lượt từng frame (cùng nhịp nhận diện / bỏ frame hành vi).
+        """
+        dets = self.detect_faces_batch(frames)
+        base = self.frame_count
+
+        # Frame nào cần chạy nhận diện (giống recognize(): dùng lại kết quả trước nếu cùng số mặt)
+        need = [False] * len(frames)
+        prev_n = len(self.last_names)
+        for k, (boxes, _) in enumerate(dets):
+            n = len(boxes)
+            if n == 0:
+                continue
+            need[k] = not ((base + k + 1) % self.recog_every_n != 0 and prev_n == n)
+            prev_n = n
+        ks = [k for k in range(len(frames)) if need[k]]
+        embedded = dict(zip(ks, self.recog.embed_multi([(frames[k], dets[k][0]) for k in ks]))) if ks else {}
+
+        behaviors = {}
+        if self.enable_behavior_analysis and self.analyzer.behavior_model is not None:
+            due = [k for k in range(len(frames)) if len(dets[k][0]) > 0 and self.analyzer.behavior_due()]
+            try:
+                behaviors = dict(zip(due, self.detect_behaviors_batch([frames[k] for k in due])))
+            except Exception as e:
+                print(f"Lỗi model hành vi (lô {len(due)} frame): {e}")
+
+        records = []
+        for k, frame in enumerate(frames):
+            self.frame_count = base + k + 1
+            boxes, det_scores = dets[k]
+            n = len(boxes)
+            try:
+                if n == 0:
+                    names, confs, student_ids = [], [], []
+                elif need[k]:
+                    embs, idx = embedded[k]
+                    if embs is None:
+                        names, confs, student_ids = self._map_predictions(n, [], [], [])
+                    else:
+                        pred, conf = self.recog.predict_batch(embs)
+                        names, confs, student_ids = self._map_predictions(n, idx, pred, conf)
+                else:
+                    names, confs, student_ids = self.last_names[:], self.last_confs[:], self.last_student_ids[:]
+                analysis = None
+                if self.enable_behavior_analysis and n > 0:
+                    if k in behaviors:
+                        self.analyzer.last_behaviors = behaviors[k]
+                    analysis = self.analyzer.build_analysis([tuple(map(int, b)) for b in boxes],
+                                                            self.analyzer.last_behaviors,
+                                                            self.analyzer.extract_landmarks(frame), t=times[k])
+                rec = self.assemble_frame(boxes, det_scores, names, confs, student_ids, analysis, times[k])
+            except Exception as e:
+                print(f"Lỗi xử lý frame {self.frame_count - 1}: {e}")
+                traceback.print_exc()
+                rec = {'frame': self.frame_count, 't': round(times[k], 3), 'faces': [], 'error': str(e)}
+            records.append(rec)
+        return records
+
+    def process_joined(self, joined, current_time):
+        """Ghép kết quả các worker (mp_pipeline) của 1 frame thành bản ghi giống process_frame."""
+        self.frame_count = joined['seq']
+        face = joined.get('face') or {}
+        boxes = face.get('boxes', np.zeros((0,4), dtype=int))
+        det_scores = face.get('scores', [])
+        n = len(boxes)
+
+        emb = joined.get('embed')
+        if n == 0:
+            names, confs, student_ids = [], [], []
+        elif emb is None and len(self.last_names) == n:
+            # Frame không chạy nhận diện (recog_every_n) -> dùng lại kết quả trước
+            names, confs, student_ids = self.last_names[:], self.last_confs[:], self.last_student_ids[:]
+        else:
+            emb = emb or {}
+            names, confs, student_ids = self._map_predictions(
+                n, emb.get('idx', []), emb.get('names', []), emb.get('confs', []))
+
+        analysis = None
+        if self.enable_behavior_analysis and n > 0:
+            mesh = joined.get('mesh')
+            landmarks = mesh.tolist() if mesh is not None else []
+            analysis = self.analyzer.build_analysis([tuple(map(int, b)) for b in boxes],
+                                                    joined.get('behavior') or [], landmarks, t=current_time)
+        rec = self.assemble_frame(boxes, det_scores, names, confs, student_ids, analysis, current_time)
+        rec['stage_ms'] = joined.get('stage_ms', {})
+        return rec
+
+    # ------------------------------------------------------------------
+    # CHẠY TRÊN 1 FILE VIDEO
+    # ------------------------------------------------------------------
+    def _iter_records_serial(self, cap, fps, max_frames):
+        n = 0
+        while max_frames is None or n < max_frames:
+            ok, frame = cap.read()   # Bộ giải mã đã scale về self.resize
+            if not ok:
+                break
+            video_t = self.clock.update_from_capture(cap, n, fps)
+            try:
+                rec = self.process_frame(frame, video_t)
+            except Exception as e:
+                print(f"Lỗi xử lý frame {n}: {e}")
+                traceback.print_exc()
+                rec = {'frame': n + 1, 't': round(video_t, 3), 'faces': [], 'error': str(e)}
+            n += 1
+            yield rec
+
+    def _iter_records_batched(self, cap, fps, max_frames):
+        n = 0
+        while max_frames is None or n < max_frames:
+            frames, times = [], []
+            while len(frames) < self.batch_size and (max_frames is None or n < max_frames):
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frames.append(frame); times.append(self.clock.update_from_capture(cap, n, fps))
+                n += 1
+            if not frames:
+                break
+            try:
+                records = self.process_batch(frames, times)
+            except Exception as e:
+                print(f"Lỗi xử lý lô {len(frames)} frame: {e}")
+                traceback.print_exc()
+                first = self.frame_count
+                self.frame_count += len(frames)
+                records = [{'frame': first + k + 1, 't': round(t, 3), 'faces': [], 'error': str(e)}
+                           for k, t in enumerate(times)]
+            yield from records
+
+    def sweep_batch_sizes(self, video_path, sizes=BATCH_SWEEP_SIZES, n_frames=BATCH_SWEEP_FRAMES):
+        """
+        Đo thông lượng YOLO (dò mặt + hành vi) với từng kích thước lô trên n_frames
+        frame đầu của video. Trả về (kích thước tốt nhất, {kích thước: FPS}).
+        """
+        cap = open_capture(video_path, size=self.resize, backend=self.decoder)
+        frames = []
+        try:
+            while len(frames) < n_frames:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frames.append(frame)
+        finally:
+            cap.release()
+        if not frames:
+            return self.batch_size, {}
+
+        results = {}
+        for bs in sizes:
+            chunks = [frames[i:i + bs] for i in range(0, len(frames), bs)]
+            self.detect_faces_batch(chunks[0])          # Khởi động (warm-up)
+            t0 = time.perf_counter()
+            for chunk in chunks:
+                self.detect_faces_batch(chunk)
+                if self.enable_behavior_analysis:
+                    self.detect_behaviors_batch(chunk)
+            el = time.perf_counter() - t0
+            results[bs] = round(len(frames) / el, 2) if el > 0 else 0.0
+            print(f"  batch={bs:>3}: {results[bs]} FPS")
+        best = max(results, key=results.get)
+        print(f"Kích thước lô tốt nhất trên máy này: {best}")
+        return best, results
+
+    def _iter_records_overlap(self, cap, fps, max_frames):
+        """
+        Các bước chạy gối nhau trên thread pool (stage_scheduler): dò mặt frame N+1
+        trong lúc FaceMesh / model hành vi xử lý frame N. Kết quả vẫn theo đúng thứ tự.
+        """
+        def detect(ctx):
+            return self.detect_faces(ctx['frame'])
+
+        def recog(ctx):
+            boxes, _ = ctx['detect']
+            self.frame_count += 1
+            return self.recognize(ctx['frame'], boxes)
+
+        def behavior(ctx):
+            if not self.enable_behavior_analysis:
+                return None
+            try:
+                return self.analyzer._detect_behaviors(ctx['frame'])
+            except Exception:
+                return []
+
+        def mesh(ctx):
+            det = ctx.get('detect')
+            if not self.enable_behavior_analysis or det is None or len(det[0]) == 0:
+                return None
+            return self.analyzer.extract_landmarks(ctx['frame'])
+
+        def assemble(ctx):
+            if ctx['errors']:
+                raise RuntimeError(f"Lỗi stage: {ctx['errors']}")
+            boxes, det_scores = ctx['detect']
+            names, confs, student_ids = ctx['recog']
+            analysis = None
+            if ctx.get('mesh') is not None and len(boxes) > 0:
+                analysis = self.analyzer.build_analysis([tuple(map(int, b)) for b in boxes],
+                                                        ctx.get('behavior') or [], ctx['mesh'], t=ctx['t'])
+            return self.assemble_frame(boxes, det_scores, names, confs, student_ids, analysis,
+                                       ctx['t'], frame_no=ctx['seq'])
+
+        sched = StageScheduler(max_in_flight=OVERLAP_IN_FLIGHT, name="offline")
+        sched.add_stage('detect', detect)
+        sched.add_stage('recog', recog, after=('detect',))
+        sched.add_stage('behavior', behavior)
+        sched.add_stage('mesh', mesh, after=('detect',))
+        sched.add_stage('assemble', assemble, after=('recog', 'behavior', 'mesh'))
+
+        def emit(fut):
+            ctx = fut.result()
+            rec = ctx.get('assemble')
+            if rec is None:
+                err = ctx['errors'].get('assemble')
+                print(f"Lỗi xử lý frame {ctx['seq'] - 1}: {err}")
+                rec = {'frame': ctx['seq'], 't': round(ctx['t'], 3), 'faces': [], 'error': str(err)}
+            return rec
+
+        pending = deque()
+        n = 0
+        try:
+            while max_frames is None or n < max_frames:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                pending.append(sched.submit({'frame': frame, 't': self.clock.update_from_capture(cap, n, fps)}))
+                n += 1
+                while pending and pending[0].done():
+                    yield emit(pending.popleft())
+            while pending:
+                yield emit(pending.popleft())
+        finally:
+            sched.close(wait=True)
+            self.last_stage_stats = sched.stats()
+            print(f"Thống kê stage: {self.last_stage_stats}")
+
+    def _iter_records_mp(self, cap, fps, max_frames):
+        """Giải mã + resize thẳng vào shared memory, các worker xử lý song song, ghép theo thứ tự."""
+        pipe = self.pipeline
+        n = 0
+
+        def emit(joined):
+            video_t = joined['meta']['t']
+            try:
+                return self.process_joined(joined, video_t)
+            except Exception as e:
+                print(f"Lỗi ghép kết quả frame {joined['seq']}: {e}")
+                traceback.print_exc()
+                return {'frame': joined['seq'], 't': round(video_t, 3), 'faces': [], 'error': str(e)}
+
+        while max_frames is None or n < max_frames:
+            slot = pipe.acquire_slot()
+            if not cap.read_into(pipe.frame(slot)):
+                pipe.release_slot(slot)
+                break
+            pipe.submit(slot, meta={'t': self.clock.update_from_capture(cap, n, fps)})
+            n += 1
+            for joined in pipe.pop_ready():
+                yield emit(joined)
+        for joined in pipe.flush():
+            yield emit(joined)
+
+    def run(self, video_path, out_path, max_frames=None, progress_every=300):
+        """
+        Xử lý toàn bộ video, ghi mỗi frame 1 dòng JSON vào out_path.
+        Trả về dict tổng kết (điểm và xếp loại của từng học sinh).
+        """
+        cap = open_capture(video_path, size=self.resize, backend=self.decoder)
+        if not cap.isOpened():
+            raise IOError(f"Không mở được video: {video_path}")
+        self.reset()
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if (fps and fps > 1e-3) else DEFAULT_FPS
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+
+        t_start = time.time()
+        n = 0
+        if self.pipeline is not None:
+            records = self._iter_records_mp(cap, fps, max_frames)
+        elif self.overlap:
+            records = self._iter_records_overlap(cap, fps, max_frames)
+        elif self.batch_size > 1:
+            records = self._iter_records_batched(cap, fps, max_frames)
+        else:
+            records = self._iter_records_serial(cap, fps, max_frames)
+        try:
+            with open(out_path, 'w', encoding='utf-8') as fout:
+                for rec in records:
+                    fout.write(json.dumps(rec, ensure_ascii=False, default=_to_builtin) + "\n")
+                    n += 1
+                    if progress_every and n % progress_every == 0:
+                        el = time.time() - t_start
+                        print(f"[{os.path.basename(video_path)}] {n}/{total or '?'} frame "
+                              f"({n / max(el, 1e-6):.1f} FPS xử lý)")
+        finally:
+            cap.release()
+
+        elapsed = time.time() - t_start
+        summary = self.build_summary(video_path, n, fps, elapsed)
+        if self.overlap and self.last_stage_stats:
+            summary['stage_stats'] = self.last_stage_stats
+        if self.adaptive is not None:
+            summary['adaptive'] = self.adaptive.metrics()
+        if self.tiler is not None:
+            summary['tiled_detection'] = self.tiler.stats()
+        print(f"Hoàn tất {os.path.basename(video_path)}: {n} frame trong {elapsed:.1f}s "
+              f"({summary['processing_fps']} FPS, video dài {summary['video_duration_sec']:.1f}s)")
+        return summary
+
+    def build_summary(self, video_path, n, fps, elapsed):
+        """Tổng kết điểm và xếp loại của từng học sinh đã xuất hiện (n frame, fps của video)."""
+        duration_sec = n / fps
+        students = []
+        for student_id in sorted(self.appeared_students):
+            focus_point = self.focus_manager.get_student_score(student_id)
+            students.append({
+                'student_id': student_id,
+                'name': self.id_to_name_cache.get(student_id, str(student_id)),
+                'focus_point': focus_point,
+                'rate': calculate_rate(focus_point, duration_sec),
+                'logs': [[round(ts, 3), msg, change] for ts, msg, change
+                         in self.focus_manager.get_student_full_logs(student_id)],
+            })
+        summary = {
+            'video': os.path.abspath(video_path) if isinstance(video_path, str) else video_path,
+            'frames': n,
+            'video_fps': fps,
+            'video_duration_sec': round(duration_sec, 3),
+            'processing_sec': round(elapsed, 3),
+            'processing_fps': round(n / elapsed, 2) if elapsed > 0 else 0.0,
+            'students': students,
+        }
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phân tích video bài học offline (không cần GUI)")
+    parser.add_argument("videos", nargs="+", help="Một hoặc nhiều file video cần xử lý")
+    parser.add_argument("--out-dir", default=".", help="Thư mục ghi kết quả (mặc định: thư mục hiện tại)")
+    parser.add_argument("--model", default=MODEL_PATH, help="Model YOLO dò khuôn mặt")
+    parser.add_argument("--db", default=DB_PATH_DEFAULT, help="File faces_db.npz")
+    parser.add_argument("--device", default=None, help="cpu / cuda (mặc định: tự chọn)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Chỉ xử lý N frame đầu (để thử)")
+    parser.add_argument("--recog-every", type=int, default=RECOG_EVERY_N, help="Nhận diện mỗi N frame")
+    parser.add_argument("--no-behavior", action="store_true", help="Tắt phân tích mắt/đầu/hành vi")
+    parser.add_argument("--resolve-names", action="store_true", help="Tra tên học sinh trong MySQL")
+    parser.add_argument("--pipeline", choices=[PIPELINE_SERIAL, PIPELINE_MP], default=PIPELINE_SERIAL,
+                        help="serial: tuần tự 1 process; mp: mỗi bước AI 1 process, frame qua shared memory")
+    parser.add_argument("--overlap", action="store_true",
+                        help="Chạy gối nhau các bước trên thread pool (chế độ serial)")
+    parser.add_argument("--batch-size", default=str(BATCH_SIZE),
+                        help="Số frame mỗi lần gọi YOLO, hoặc 'auto' để đo và chọn trên video đầu tiên")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="Tự giảm nhịp các bước / độ phân giải YOLO để xử lý >= N FPS (chế độ tuần tự)")
+    parser.add_argument("--decoder", choices=[BACKEND_AUTO, BACKEND_OPENCV, BACKEND_PYAV], default=BACKEND_AUTO,
+                        help="Bộ giải mã video: pyav (đa luồng, scale trong decoder) / opencv / auto")
+    parser.add_argument("--backend", choices=("auto",) + INFER_BACKENDS, default=INFER_BACKEND,
+                        help="Backend YOLO dò mặt (auto: CPU -> backend nhanh nhất đã đo)")
+    parser.add_argument("--detect-mode", choices=DETECT_MODES, default=DETECT_FULL,
+                        help="full: 1 lần YOLO/frame; tiled: chia ô chồng lấn; roi: quét toàn bộ định kỳ, "
+                             "giữa các lần chỉ dò quanh mặt đã biết")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="Cạnh ô khi dò theo ô (pixel)")
+    parser.add_argument("--full-res", action="store_true",
+                        help=f"Xử lý ở độ phân giải gốc thay vì thu về {VIEW_W}x{VIEW_H} (dùng với tiled/roi)")
+    parser.add_argument("--mp-slots", type=int, default=MP_SLOTS, help="Số frame xử lý cùng lúc (chế độ mp)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    engine = OfflineVideoEngine(model_path=args.model, db_path=args.db, device=args.device,
+                                resolve_names=args.resolve_names,
+                                enable_behavior_analysis=not args.no_behavior,
+                                recog_every_n=args.recog_every,
+                                pipeline=args.pipeline, mp_slots=args.mp_slots,
+                                overlap=args.overlap,
+                                batch_size=1 if args.batch_size == "auto" else int(args.batch_size),
+                                target_fps=args.target_fps, decoder=args.decoder,
+                                backend=args.backend, detect_mode=args.detect_mode,
+                                tile_size=args.tile_size,
+                                resize=None if args.full_res else (VIEW_W, VIEW_H))
+    if args.batch_size == "auto" and engine.model is not None:
+        print("Đang đo kích thước lô YOLO...")
+        engine.batch_size, _ = engine.sweep_batch_sizes(args.videos[0])
+    try:
+        _run_videos(engine, args)
+    finally:
+        engine.close()
+
+
+def _run_videos(engine, args):
+    for video in args.videos:
+        stem = os.path.splitext(os.path.basename(video))[0]
+        out_path = os.path.join(args.out_dir, f"{stem}_frames.jsonl")
+        summary_path = os.path.join(args.out_dir, f"{stem}_summary.json")
+        try:
+            summary = engine.run(video, out_path, max_frames=args.max_frames)
+        except Exception as e:
+            print(f"Lỗi khi xử lý {video}: {e}")
+            traceback.print_exc()
+            continue
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=_to_builtin)
+        print(f"-> Kết quả frame: {out_path}\n-> Tổng kết: {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
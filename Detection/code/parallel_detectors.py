@@ -0,0 +1,91 @@
+# parallel_detectors.py
+"""
+Chạy song song các model độc lập trên cùng 1 frame (YOLO dò mặt và YOLO hành vi) với
+NGÂN SÁCH LUỒNG CPU chia sẵn cho từng model.
+
+- Mỗi model có 1 luồng thực thi riêng (cố định); submit() trả về Future, call() chờ kết quả.
+- Phần luồng của mỗi model được áp theo PHIÊN của backend (inference_backend.limit_threads):
+  ONNX Runtime intra_op_num_threads / OpenVINO INFERENCE_NUM_THREADS.
+- Model chạy bằng PyTorch KHÔNG chia được trong cùng process: torch.set_num_threads ghi số
+  luồng toàn process (cả MKL), và mỗi luồng của ATen áp lại giá trị toàn cục đó ở lần chạy
+  song song đầu tiên -> luồng nào gọi sau cùng thì thắng cho mọi model. Các model đó dùng
+  chung pool luồng torch của process (stats()['enforced'] = False); muốn chia cứng thì
+  export sang onnx / openvino hoặc chạy mỗi model 1 process (mp_pipeline.py).
+
+Ví dụ:
+    par = ParallelDetectors({'detect': 0.5, 'behavior': 0.5}, thread_budget=8,
+                            models={'detect': face_model, 'behavior': behavior_model})
+    fb = par.submit('behavior', behavior_fn, frame)
+    boxes = par.call('detect', detect_fn, frame)
+    behaviors = fb.result()
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from inference_backend import limit_threads
+
+DEFAULT_SHARES = {'detect': 0.5, 'behavior': 0.5}
+_warned = set()   # Model đã cảnh báo không chia được luồng (chỉ in 1 lần mỗi process)
+
+
+def partition_threads(budget, shares):
+    """Chia budget luồng theo tỷ lệ shares (mỗi model >= 1). Trả về {tên: số luồng}."""
+    budget = max(1, int(budget))
+    total = float(sum(shares.values())) or 1.0
+    out = {name: max(1, int(budget * w / total)) for name, w in shares.items()}
+    # Phần dư (do làm tròn xuống) cho model có tỷ lệ lớn nhất
+    rest = budget - sum(out.values())
+    if rest > 0:
+        out[max(shares, key=shares.get)] += rest
+    return out
+
+
+class ParallelDetectors:
+    """1 luồng thực thi riêng cho mỗi model; số luồng intra-op chia theo phiên của backend."""
+    def __init__(self, shares=None, thread_budget=None, models=None):
+        self.shares = dict(shares or DEFAULT_SHARES)
+        self.thread_budget = int(thread_budget or os.cpu_count() or 1)
+        self.threads = partition_threads(self.thread_budget, self.shares)
+        # models: {tên: model YOLO đã tải}; model torch / không có -> không áp được phần chia
+        self.enforced = {name: model is not None and limit_threads(model, self.threads[name])
+                         for name, model in (models or {}).items() if name in self.threads}
+        skipped = [n for n in self.threads if not self.enforced.get(n) and n not in _warned]
+        if skipped:
+            _warned.update(skipped)
+            print(f"CẢNH BÁO: phần chia luồng {[f'{n}={self.threads[n]}' for n in skipped]} KHÔNG có tác dụng "
+                  f"(model chạy PyTorch dùng chung pool luồng của process). Tạo bản onnx / openvino bằng "
+                  f"quantize_models.py (vd. --behavior) để chia cứng.")
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"det-{name}")
+            for name in self.threads}
+        self._lock = threading.Lock()
+        self._ms = {name: 0.0 for name in self.threads}
+        self._calls = {name: 0 for name in self.threads}
+
+    def _timed(self, name, fn, args, kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._ms[name] += (time.perf_counter() - t0) * 1000
+                self._calls[name] += 1
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Chạy fn trên luồng của model name. Trả về Future."""
+        return self._executors[name].submit(self._timed, name, fn, args, kwargs)
+
+    def call(self, name, fn, *args, **kwargs):
+        return self.submit(name, fn, *args, **kwargs).result()
+
+    def stats(self):
+        with self._lock:
+            return {'threads': dict(self.threads), 'enforced': dict(self.enforced),
+                    'avg_ms': {k: round(self._ms[k] / self._calls[k], 2) if self._calls[k] else 0.0
+                               for k in self._ms}}
+
+    def close(self):
+        for ex in self._executors.values():
+            ex.shutdown(wait=True)
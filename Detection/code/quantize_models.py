@@ -0,0 +1,291 @@
+# quantize_models.py
+"""
+Tạo bản INT8 cho model YOLO dò mặt và YOLO hành vi (best.pt), hiệu chỉnh (calibrate)
+trên ảnh trong Detection/test/images.
+
+Bản INT8 chỉ được CÔNG BỐ (ghi cạnh file .pt, tên theo inference_backend.quantized_export_path)
+khi độ chính xác không giảm quá ngưỡng so với bản FP32:
+  - Model hành vi: chỉ số như test_model_regression.py (so tập nhãn mỗi ảnh với bộ dữ liệu vàng):
+    tỷ lệ ảnh hoàn hảo, precision, recall, F1.
+  - Model dò mặt (bộ dữ liệu vàng không có nhãn khuôn mặt): mức trùng khớp box với bản FP32
+    (IoU >= 0.5) -> precision / recall / F1 so với FP32.
+Không qua ngưỡng -> xóa bản tạm, giữ FP32. Khi chạy, inference_backend tự ưu tiên bản INT8 (CPU).
+
+Ví dụ:
+    python quantize_models.py --face --behavior               # ONNX Runtime (mặc định)
+    python quantize_models.py --behavior --backend openvino --max-drop 0.01
+"""
+import os
+import json
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from box_geometry import iou_matrix, greedy_assign
+from inference_backend import (export_cached, quantized_export_path, probe_latency_ms, _cache_prefix,
+                               backend_available, BACKEND_ONNX, BACKEND_OPENVINO)
+
+try:
+    from onnxruntime.quantization import (quantize_static, CalibrationDataReader,
+                                          QuantFormat, QuantType)
+except Exception:
+    quantize_static = None
+    CalibrationDataReader = object
+
+# ===== CẤU HÌNH =====
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FACE_MODEL_PATH = os.path.join(BASE_DIR, "..", "yolov8s-face-lindevs.pt")
+GOLDEN_DIR      = os.path.join(BASE_DIR, "..", "test")      # images/ + labels/
+CALIB_IMAGES    = 200      # Số ảnh dùng để hiệu chỉnh
+CALIB_IMGSZ     = 640
+FACE_CONF       = 0.45
+BEHAVIOR_CONF   = 0.35
+MATCH_IOU       = 0.5
+MAX_METRIC_DROP = 0.02     # Mức giảm tối đa (tuyệt đối) của mỗi chỉ số so với FP32
+GATE_METRICS    = ('f1', 'perfect_image_accuracy')
+# =====================
+
+
+def list_images(images_dir, limit=None):
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    return paths[:limit] if limit else paths
+
+
+def letterbox_nchw(img, size=CALIB_IMGSZ):
+    """Tiền xử lý giống ultralytics: letterbox về size x size, BGR->RGB, NCHW float32 [0, 1]."""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((size, size, 3), 114, np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    x = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+    return np.ascontiguousarray(x)
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Cấp từng ảnh đã tiền xử lý cho ONNX Runtime khi hiệu chỉnh."""
+    def __init__(self, input_name, image_paths, size=CALIB_IMGSZ):
+        self.input_name = input_name
+        self.image_paths = list(image_paths)
+        self.size = size
+        self._it = iter(self.image_paths)
+
+    def get_next(self):
+        for p in self._it:
+            img = cv2.imread(str(p))
+            if img is not None:
+                return {self.input_name: letterbox_nchw(img, self.size)}
+        return None
+
+    def rewind(self):
+        self._it = iter(self.image_paths)
+
+
+# ------------------------------------------------------------------
+# CHỈ SỐ ĐỘ CHÍNH XÁC
+# ------------------------------------------------------------------
+def _prf(tp, fp, fn):
+    precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
+    recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.0
+    return precision, recall, f1
+
+
+def label_set_metrics(model, golden, conf=BEHAVIOR_CONF):
+    """
+    Chỉ số giống test_model_regression.py: so tập nhãn dự đoán với tập nhãn chuẩn của mỗi ảnh.
+    golden: list (filename, ảnh, list chỉ số lớp) từ data_loader.load_golden_dataset_per_image.
+    """
+    tp = fp = fn = perfect = 0
+    for _, img, gt_idx in golden:
+        gt = {int(i) for i in gt_idx}
+        res = model(img, conf=conf, verbose=False)[0]
+        pred = {int(c) for c in res.boxes.cls.cpu().numpy()} if res.boxes is not None else set()
+        tp += len(gt & pred); fn += len(gt - pred); fp += len(pred - gt)
+        perfect += int(gt == pred)
+    precision, recall, f1 = _prf(tp, fp, fn)
+    return {'perfect_image_accuracy': perfect / max(len(golden), 1),
+            'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def match_counts(ref_boxes, boxes, iou_thres=MATCH_IOU):
+    """Ghép tham lam box với box tham chiếu theo IoU. Trả về (tp, fp, fn)."""
+    ref_boxes = np.asarray(ref_boxes, dtype=np.float32).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(ref_boxes) == 0 or len(boxes) == 0:
+        return 0, len(boxes), len(ref_boxes)
+    tp = len(greedy_assign(iou_matrix(ref_boxes, boxes), iou_thres))
+    return tp, len(boxes) - tp, len(ref_boxes) - tp
+
+
+def agreement_metrics(ref_model, model, images, conf=FACE_CONF):
+    """Mức trùng khớp box của model so với ref_model (FP32) trên cùng tập ảnh."""
+    tp = fp = fn = perfect = 0
+    for img in images:
+        ref = ref_model(img, conf=conf, verbose=False)[0].boxes.xyxy.cpu().numpy()
+        cur = model(img, conf=conf, verbose=False)[0].boxes.xyxy.cpu().numpy()
+        t, f_p, f_n = match_counts(ref, cur)
+        tp += t; fp += f_p; fn += f_n
+        perfect += int(f_p == 0 and f_n == 0)
+    precision, recall, f1 = _prf(tp, fp, fn)
+    return {'perfect_image_accuracy': perfect / max(len(images), 1),
+            'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def accuracy_gate(ref_metrics, metrics, max_drop=MAX_METRIC_DROP, keys=GATE_METRICS):
+    """True nếu mọi chỉ số trong keys giảm không quá max_drop. Trả về (đạt?, {chỉ số: mức giảm})."""
+    drops = {k: round(ref_metrics[k] - metrics[k], 4) for k in keys}
+    return all(d <= max_drop for d in drops.values()), drops
+
+
+# ------------------------------------------------------------------
+# LƯỢNG TỬ HÓA
+# ------------------------------------------------------------------
+def _quantize_onnx(pt_path, out_path, calib_paths):
+    if quantize_static is None:
+        raise ImportError("Cần onnxruntime (pip install onnxruntime) để lượng tử hóa ONNX.")
+    import onnx
+    import onnxruntime as ort
+    fp32 = export_cached(pt_path, BACKEND_ONNX)
+    input_name = ort.InferenceSession(fp32, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    quantize_static(fp32, out_path, ImageCalibrationReader(input_name, calib_paths),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    # Giữ metadata của ultralytics (tên lớp, imgsz, stride) để YOLO(...) đọc đúng
+    src, dst = onnx.load(fp32), onnx.load(out_path)
+    del dst.metadata_props[:]
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, out_path)
+    return out_path
+
+
+def _quantize_openvino(pt_path, out_dir, calib_dir):
+    from ultralytics import YOLO
+    model = YOLO(pt_path)
+    # ultralytics hiệu chỉnh INT8 (NNCF) trên split 'val' của file data -> trỏ vào ảnh test
+    with tempfile.NamedTemporaryFile('w', suffix=".yaml", delete=False, encoding='utf-8') as f:
+        names = model.names if isinstance(model.names, dict) else dict(enumerate(model.names))
+        f.write(f"path: {Path(calib_dir).parent.resolve().as_posix()}\n"
+                f"train: {Path(calib_dir).name}\nval: {Path(calib_dir).name}\n"
+                f"names: {json.dumps({int(k): v for k, v in names.items()}, ensure_ascii=False)}\n")
+        data_yaml = f.name
+    try:
+        out = str(model.export(format="openvino", int8=True, data=data_yaml, imgsz=CALIB_IMGSZ,
+                               dynamic=True, verbose=False))
+    finally:
+        os.remove(data_yaml)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    shutil.move(out, out_dir)
+    return out_dir
+
+
+def _tmp_path(published, backend):
+    if backend == BACKEND_ONNX:
+        return published[:-len(".int8.onnx")] + ".int8tmp.onnx"
+    return published[:-len("_int8_openvino_model")] + "_int8tmp_openvino_model"
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def quantize_model(pt_path, kind, backend=BACKEND_ONNX, golden_dir=GOLDEN_DIR,
+                   n_calib=CALIB_IMAGES, max_drop=MAX_METRIC_DROP):
+    """
+    Lượng tử hóa 1 model ('face' hoặc 'behavior'), đánh giá, công bố nếu qua ngưỡng.
+    Trả về dict báo cáo (cũng được ghi ra <model>.<hash>.int8.json).
+    """
+    from ultralytics import YOLO
+    from data_loader import load_golden_dataset_per_image
+    if not backend_available(backend):
+        raise ImportError(f"Chưa cài runtime cho backend {backend}.")
+    images_dir = os.path.join(golden_dir, "images")
+    calib = list_images(images_dir, n_calib)
+    published = quantized_export_path(pt_path, backend)
+    tmp = _tmp_path(published, backend)
+    _remove(tmp)
+
+    print(f"[{kind}] Lượng tử hóa INT8 ({backend}) với {len(calib)} ảnh hiệu chỉnh...")
+    if backend == BACKEND_ONNX:
+        _quantize_onnx(pt_path, tmp, calib)
+    else:
+        _quantize_openvino(pt_path, tmp, images_dir)
+
+    ref, q = YOLO(pt_path), YOLO(tmp, task="detect")
+    if kind == "behavior":
+        golden = load_golden_dataset_per_image(Path(golden_dir))
+        ref_m, q_m = label_set_metrics(ref, golden), label_set_metrics(q, golden)
+    else:
+        imgs = [img for img in (cv2.imread(str(p)) for p in list_images(images_dir)) if img is not None]
+        ref_m = {'perfect_image_accuracy': 1.0, 'precision': 1.0, 'recall': 1.0, 'f1': 1.0}
+        q_m = agreement_metrics(ref, q, imgs)
+    passed, drops = accuracy_gate(ref_m, q_m, max_drop)
+    report = {
+        'model': os.path.abspath(pt_path), 'kind': kind, 'backend': backend,
+        'fp32': {k: round(v, 4) for k, v in ref_m.items()},
+        'int8': {k: round(v, 4) for k, v in q_m.items()},
+        'drops': drops, 'max_drop': max_drop, 'published': passed,
+        'ms_per_image': {'fp32': round(probe_latency_ms(ref), 2), 'int8': round(probe_latency_ms(q), 2)},
+    }
+    del q
+    if passed:
+        _remove(published)
+        shutil.move(tmp, published)
+        report['path'] = published
+        print(f"[{kind}] ĐẠT ngưỡng (giảm {drops}) -> công bố {published}")
+    else:
+        _remove(tmp)
+        print(f"[{kind}] KHÔNG đạt ngưỡng (giảm {drops} > {max_drop}) -> giữ FP32")
+    with open(_cache_prefix(pt_path) + ".int8.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lượng tử hóa INT8 model dò mặt / hành vi có kiểm tra độ chính xác")
+    parser.add_argument("--face", action="store_true", help="Lượng tử hóa model dò khuôn mặt")
+    parser.add_argument("--behavior", action="store_true", help="Lượng tử hóa model hành vi (best.pt)")
+    parser.add_argument("--face-model", default=FACE_MODEL_PATH)
+    parser.add_argument("--behavior-model", default=None, help="Mặc định: như BieuCamAnalyzer tìm best.pt")
+    parser.add_argument("--backend", choices=[BACKEND_ONNX, BACKEND_OPENVINO], default=BACKEND_ONNX)
+    parser.add_argument("--golden", default=GOLDEN_DIR, help="Thư mục có images/ và labels/")
+    parser.add_argument("--calib", type=int, default=CALIB_IMAGES, help="Số ảnh hiệu chỉnh")
+    parser.add_argument("--max-drop", type=float, default=MAX_METRIC_DROP,
+                        help="Mức giảm tối đa cho phép của F1 / tỷ lệ ảnh hoàn hảo")
+    args = parser.parse_args()
+    if not (args.face or args.behavior):
+        args.face = args.behavior = True
+
+    jobs = []
+    if args.face:
+        jobs.append(("face", args.face_model))
+    if args.behavior:
+        path = args.behavior_model
+        if path is None:
+            from behavior_analyzer import BEHAVIOR_MODEL_CANDIDATES
+            path = next((os.path.normpath(p) for p in BEHAVIOR_MODEL_CANDIDATES if os.path.exists(p)), None)
+        if path is None:
+            print("Không tìm thấy model hành vi (best.pt).")
+        else:
+            jobs.append(("behavior", path))
+
+    for kind, path in jobs:
+        try:
+            report = quantize_model(path, kind, backend=args.backend, golden_dir=args.golden,
+                                    n_calib=args.calib, max_drop=args.max_drop)
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        except Exception as e:
+            print(f"Lỗi lượng tử hóa {kind} ({path}): {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,213 @@
 # recognition_engine.py
-import os
+import threading
 import numpy as np
 import torch
-import cv2
 from facenet_pytorch import InceptionResnetV1
 
+from box_geometry import iou_xyxy  # giữ tên cũ cho code import từ đây
+from crop_batcher import CropBatcher
+from gallery_store import open_store
+from gallery_index import make_index, load_index, subset_index, match_identities, INDEX_BRUTE, TOPK_TEMPLATES
+
 UNKNOWN_NAME = "Unknown"
 
 class RecognitionEngine:
     """
     Face embedding & recognition với FaceNet (InceptionResnetV1, vggface2).
-    Cung cấp: embed_batch, add_face, predict_batch, save_db, load_db
+    Cung cấp: embed_batch, add_face, remove_face, predict_batch, save_db, load_db
+    Gallery nằm trong self.index (gallery_index.py): brute force / IVF / HNSW, mỗi học sinh
+    có thể có nhiều mẫu (add_templates); so khớp gộp top-k mẫu theo danh tính.
+    Gallery lớn: index_params={'precision': 'int8'} (brute / ivf; hnsw chỉ fp32) quét trên bản nén,
+    tính lại float32 cho top ứng viên.
+    Lưu trữ qua gallery_store.py: sau load_db, mỗi lần thêm / xóa mẫu được ghi nối vào kho ngay.
     """
     def __init__(self, device="cuda" if torch.cuda.is_available() else "cpu",
-                 recog_thres=0.60, face_margin=0.15, out_size=160):
+                 recog_thres=0.60, face_margin=0.15, out_size=160, index_kind=INDEX_BRUTE, index_params=None):
         self.device = device
         self.model = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
-        self.embs = None  # (N, 512) float32 L2-normalized
-        self.names = []   # list[str]
+        self.index_kind = index_kind
+        self.index_params = dict(index_params or {})
+        self.index = make_index(index_kind, **self.index_params)
+        self.store = None              # GalleryStore đang gắn (load_db / save_db)
+        self.partition = None          # Chỉ mục con của lớp đang học (set_partition)
+        self.partition_labels = set()
+        self.partition_fallback = True # Mặt không khớp trong lớp -> tìm lại trên cả gallery
+        self.topk = TOPK_TEMPLATES
         self.recog_thres = float(recog_thres)
         self.face_margin = float(face_margin)
         self.out_size = int(out_size)
+        # Engine dùng chung giữa các luồng (infer, đăng ký, warm-up) -> mỗi luồng 1 bộ đệm crop riêng
+        self._local = threading.local()
 
     def set_threshold(self, thres: float):
         self.recog_thres = float(thres)
 
-    @staticmethod
-    def _safe_int(v): return int(max(0, v))
-
-    def _preprocess_crop(self, bgr, box):
-        h, w = bgr.shape[:2]
-        x1, y1, x2, y2 = [int(v) for v in box]
-        bw, bh = x2 - x1, y2 - y1
-        mx = self._safe_int(bw * self.face_margin)
-        my = self._safe_int(bh * self.face_margin)
-        x1 = max(0, x1 - mx); y1 = max(0, y1 - my)
-        x2 = min(w, x2 + mx); y2 = min(h, y2 + my)
-        crop = bgr[y1:y2, x1:x2]
-        if crop.size == 0:
-            return None
-        rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
-        rgb = cv2.resize(rgb, (self.out_size, self.out_size))
-        t = torch.from_numpy(rgb).permute(2, 0, 1).float() / 255.0
-        t = (t - 0.5) / 0.5
-        return t
+    @property
+    def embs(self):
+        """(N, 512) float32 đã chuẩn hóa L2 của gallery, None nếu trống."""
+        return self.index.vectors() if len(self.index) else None
+
+    @property
+    def names(self):
+        return self.index.labels()
+
+    def clear_db(self):
+        self.index.reset()
+        self.clear_partition()
+
+    def set_partition(self, labels, fallback=True):
+        """Chỉ so khớp với các nhãn labels (vd. student_id của 1 lớp); fallback: mặt không
+        khớp trong lớp được tìm lại trên cả gallery."""
+        self.partition_labels = {str(l) for l in labels}
+        self.partition = subset_index(self.index, self.partition_labels)
+        self.partition_fallback = bool(fallback)
+        return len(self.partition)
+
+    def clear_partition(self):
+        self.partition = None
+        self.partition_labels = set()
+
+    def set_index(self, kind, **params):
+        """Đổi loại chỉ mục, giữ nguyên gallery."""
+        vecs, names = self.index.vectors().copy(), self.index.labels()
+        self.index_kind, self.index_params = kind, params
+        self.index = make_index(kind, **params)
+        if names:
+            self.index.add(vecs, names)
+
+    def _crop_batch(self, items):
+        """
+        items: list (bgr, boxes) -> (tensor (B, 3, S, S) đã chuẩn hóa [-1, 1] trên self.device, owners).
+        Crop được resize thẳng vào bộ đệm uint8 NHWC của luồng gọi (crop_batcher.py); đổi BGR -> RGB,
+        sang float và chuẩn hóa làm 1 lần cho cả batch (trên GPU nếu có: chép uint8 nhẹ hơn 4 lần).
+        Trên CPU tensor uint8 là view của bộ đệm nên bộ đệm không được dùng chung giữa các luồng.
+        """
+        batcher = getattr(self._local, 'batcher', None)
+        if batcher is None or batcher.out_size != self.out_size:
+            batcher = self._local.batcher = CropBatcher(self.out_size)
+        buf, owners = batcher.fill(items, margin=self.face_margin)
+        if not owners:
+            return None, owners
+        t = torch.from_numpy(buf).to(self.device).permute(0, 3, 1, 2).flip(1).float()
+        return t.sub_(127.5).div_(127.5), owners
 
     def embed_batch(self, bgr, boxes):
-        tensors, valid_idx = [], []
-        for i, box in enumerate(boxes):
-            t = self._preprocess_crop(bgr, box)
-            if t is not None:
-                tensors.append(t); valid_idx.append(i)
-        if not tensors:
-            return None, []
-        batch = torch.stack(tensors).to(self.device)
+        return self.embed_multi([(bgr, boxes)])[0]
+
+    def embed_multi(self, items):
+        """
+        Nhúng khuôn mặt của NHIỀU frame (nhiều luồng video) trong 1 lần chạy FaceNet.
+        items: list (bgr, boxes). Trả về list (emb, valid_idx) theo thứ tự items,
+        giống kết quả embed_batch của từng frame.
+        """
+        batch, owners = self._crop_batch(items)
+        out = [(None, []) for _ in items]
+        if batch is None:
+            return out
         with torch.no_grad():
             emb = self.model(batch).cpu().numpy().astype('float32')  # (B,512)
         emb /= (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-9)
-        return emb, valid_idx
-
-    def add_face(self, name, emb_vec):
-        emb = emb_vec.astype('float32')
-        emb /= (np.linalg.norm(emb) + 1e-9)
-        if self.embs is None:
-            self.embs = emb[None, :]
-            self.names = [name]
-        else:
-            self.embs = np.vstack([self.embs, emb[None, :]])
-            self.names.append(name)
+        rows = {}
+        for r, (k, i) in enumerate(owners):
+            rows.setdefault(k, []).append((r, i))
+        for k, lst in rows.items():
+            out[k] = (emb[[r for r, _ in lst]], [i for _, i in lst])
+        return out
+
+    def add_face(self, name, emb_vec, in_partition=False):
+        return int(self.add_templates(name, emb_vec[None, :], in_partition)[0])
+
+    def add_templates(self, name, embs, in_partition=False):
+        """Thêm nhiều mẫu (nhiều góc mặt) cho cùng 1 danh tính trong 1 lần."""
+        embs = np.asarray(embs, dtype='float32').reshape(-1, self.index.dim)
+        embs = embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-9)
+        names = [name] * len(embs)
+        if self.partition is not None and (in_partition or str(name) in self.partition_labels):
+            self.partition_labels.add(str(name))
+            self.partition.add(embs, names)
+        if self.store is not None:
+            self.store.append(names, embs)
+        return self.index.add(embs, names)
+
+    def remove_face(self, name):
+        """Xóa mọi mẫu của name khỏi gallery (và khỏi kho). Trả về số mẫu đã xóa."""
+        if self.store is not None:
+            self.store.delete(name, source=self._on_store_event)
+        return self._remove_in_memory(name)
+
+    def _remove_in_memory(self, name):
+        if self.partition is not None:
+            self.partition.remove_label(name)
+        return self.index.remove_label(name)
+
+    def _on_store_event(self, event, label):
+        # Nơi khác (vd. database.delete_student) xóa mẫu trong kho -> bỏ khỏi gallery đang chạy
+        if event == 'delete':
+            self._remove_in_memory(label)
+
+    def _attach_store(self, store):
+        if self.store is not None:
+            self.store.remove_listener(self._on_store_event)
+        self.store = store
+        if store is not None:
+            store.add_listener(self._on_store_event)
+
+    def _search_top1(self, index, embs):
+        return match_identities(index, embs, k=self.topk)
 
     def predict_batch(self, embs):
-        if self.embs is None or len(self.names) == 0:
+        if len(self.index) == 0:
             return [UNKNOWN_NAME] * len(embs), [0.0] * len(embs)
-        sims = embs @ self.embs.T
-        idxs = np.argmax(sims, axis=1)
-        smax = sims[np.arange(len(embs)), idxs]
-        names = [self.names[i] if s >= self.recog_thres else UNKNOWN_NAME
-                 for i, s in zip(idxs, smax)]
+        if self.partition is None:
+            labels, smax = self._search_top1(self.index, embs)
+        else:
+            labels, smax = [None] * len(embs), np.zeros(len(embs))
+            if len(self.partition):
+                labels, smax = self._search_top1(self.partition, embs)
+            miss = [i for i, s in enumerate(smax) if labels[i] is None or s < self.recog_thres]
+            if miss and self.partition_fallback:
+                fl, fs = self._search_top1(self.index, np.asarray(embs)[miss])
+                for k, i in enumerate(miss):
+                    if fs[k] > smax[i]:
+                        labels[i], smax[i] = fl[k], fs[k]
+        names = [l if l is not None and s >= self.recog_thres else UNKNOWN_NAME
+                 for l, s in zip(labels, smax)]
         return names, [float(s) for s in smax]
 
     def save_db(self, path):
-        if self.embs is None or not self.names:
+        """
+        Gắn gallery vào kho của path. Kho đang gắn thì không cần làm gì (mọi thay đổi đã được
+        ghi nối ngay); kho khác thì ghi toàn bộ gallery hiện tại thay cho nội dung cũ của kho đó.
+        """
+        if len(self.index) == 0:
             raise RuntimeError("DB trống.")
-        np.savez_compressed(path, embs=self.embs, names=np.array(self.names, dtype=object))
+        store = open_store(path)
+        if store is self.store:
+            return
+        for label in set(store.load()[1]):
+            store.delete(label)
+        store.append(self.names, self.embs)
+        self._attach_store(store)
 
     def load_db(self, path):
-        if not os.path.exists(path):
-            raise FileNotFoundError(path)
-        data = np.load(path, allow_pickle=True)
-        self.embs = data["embs"].astype('float32')
-        self.names = list(data["names"].tolist())
-
-
-def iou_xyxy(a, b):
-    ax1, ay1, ax2, ay2 = a
-    bx1, by1, bx2, by2 = b
-    inter_x1, inter_y1 = max(ax1, bx1), max(ay1, by1)
-    inter_x2, inter_y2 = min(ax2, bx2), min(ay2, by2)
-    iw, ih = max(0, inter_x2 - inter_x1), max(0, inter_y2 - inter_y1)
-    inter = iw * ih
-    area_a = (ax2 - ax1) * (ay2 - ay1)
-    area_b = (bx2 - bx1) * (by2 - by1)
-    union = area_a + area_b - inter + 1e-6
-    return inter / union
+        """
+        Tải gallery từ kho (tự nhập faces_db.npz cũ ở lần đầu) và gắn kho để ghi tiếp.
+        Ảnh chụp .npy của kho được memmap làm tầng gốc của chỉ mục (không sao chép, O(1));
+        chỉ các mẫu ghi sau lần compaction cuối được đọc vào RAM.
+        """
+        store = open_store(path)
+        base_embs, base_labels, base_alive, tail_embs, tail_names = store.load_arrays()
+        self.clear_partition()
+        self.index.adopt(base_embs, base_labels, alive=base_alive)
+        if tail_names:
+            self.index.add(tail_embs, tail_names)
+        self._attach_store(store)
+
+    def save_index(self, path):
+        """Lưu cả cấu trúc chỉ mục (tâm cụm IVF...) để lần sau không phải huấn luyện lại."""
+        self.index.save(path)
+
+    def load_index(self, path):
+        self.index = load_index(path)
+        self.clear_partition()
+        self.index_kind = self.index.kind
@@ -0,0 +1,191 @@
+# stage_scheduler.py
+"""
+Bộ lập lịch đồ thị stage (thread pool) để các bước của pipeline chạy GỐI NHAU:
+dò mặt frame N+1 trong lúc FaceMesh / model hành vi đang xử lý frame N.
+
+- Mỗi stage có 1 luồng worker riêng -> các frame đi qua 1 stage đúng thứ tự
+  (an toàn cho stage có trạng thái: bộ đếm bỏ frame, FaceMesh tracking, chấm điểm...).
+- Stage chỉ chạy khi các stage phụ thuộc (after=...) của cùng frame đã xong.
+- Số frame đang xử lý cùng lúc bị giới hạn (max_in_flight); submit() chờ nếu đầy.
+- Torch / MediaPipe nhả GIL trong phần native nên các luồng thực sự chạy song song.
+- stats(): thời gian bận và độ sử dụng (utilization) từng stage -> thấy stage nghẽn.
+  Thông lượng lý tưởng = 1 / (thời gian của stage chậm nhất), không phải tổng các stage.
+
+Ví dụ:
+    sched = StageScheduler(max_in_flight=3)
+    sched.add_stage('detect', detect_fn)
+    sched.add_stage('recog', recog_fn, after=('detect',))
+    sched.add_stage('behavior', behavior_fn)
+    sched.add_stage('assemble', assemble_fn, after=('recog', 'behavior'))
+    fut = sched.submit({'frame': frame})   # Future -> ctx khi mọi stage xong
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class _Stage:
+    __slots__ = ('name', 'fn', 'after', 'dependents', 'executor',
+                 'next_seq', 'ready', 'busy_sec', 'calls', 'errors', 'max_ms')
+
+    def __init__(self, name, fn, after):
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.dependents = []
+        self.executor = None
+        self.next_seq = 1      # Frame tiếp theo được phép chạy ở stage này (giữ thứ tự)
+        self.ready = {}        # seq -> job đã đủ phụ thuộc, chờ tới lượt
+        self.busy_sec = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.max_ms = 0.0
+
+
+class _Job:
+    __slots__ = ('seq', 'ctx', 'waiting', 'remaining', 'future')
+
+    def __init__(self, seq, ctx, stages):
+        self.seq = seq
+        self.ctx = ctx
+        self.waiting = {s.name: len(s.after) for s in stages}
+        self.remaining = len(stages)
+        self.future = Future()
+
+
+class StageScheduler:
+    """
+    Mỗi stage là hàm fn(ctx) -> kết quả; kết quả được lưu vào ctx[tên stage].
+    Nếu stage lỗi: ctx[tên stage] = None và ctx['errors'][tên stage] = exception,
+    các stage sau vẫn chạy (tự kiểm tra None).
+    """
+    def __init__(self, max_in_flight=3, name="stage"):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.name = name
+        self._stages = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._window = threading.BoundedSemaphore(self.max_in_flight)
+        self._next_seq = 1
+        self._t_first = None
+        self._t_last = None
+        self._completed = 0
+        self._closed = False
+
+    def add_stage(self, name, fn, after=()):
+        if self._next_seq > 1:
+            raise RuntimeError("Không thể thêm stage sau khi đã submit frame.")
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' đã tồn tại.")
+        for dep in after:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' phụ thuộc stage chưa khai báo: '{dep}'")
+        st = _Stage(name, fn, after)
+        st.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.name}-{name}")
+        for dep in after:
+            self._stages[dep].dependents.append(st)
+        self._stages[name] = st
+        self._order.append(st)
+        return self
+
+    # ------------------------------------------------------------------
+    def submit(self, ctx, timeout=None):
+        """
+        Đưa 1 frame (dict ctx) vào đồ thị. Chờ nếu đang có max_in_flight frame.
+        Trả về Future (kết quả = ctx), hoặc None nếu hết timeout / đã đóng.
+        """
+        if self._closed:
+            return None
+        if not self._window.acquire(timeout=timeout):
+            return None
+        with self._lock:
+            if self._closed:
+                self._window.release()
+                return None
+            seq = self._next_seq
+            self._next_seq += 1
+            if self._t_first is None:
+                self._t_first = time.perf_counter()
+            ctx.setdefault('seq', seq)
+            ctx.setdefault('errors', {})
+            job = _Job(seq, ctx, self._order)
+            roots = [s for s in self._order if not s.after]
+            for st in roots:
+                self._mark_ready(st, job)
+        return job.future
+
+    def _mark_ready(self, st, job):
+        # Gọi khi đang giữ self._lock
+        st.ready[job.seq] = job
+        while st.next_seq in st.ready:
+            j = st.ready.pop(st.next_seq)
+            st.next_seq += 1
+            st.executor.submit(self._run_stage, st, j)
+
+    def _run_stage(self, st, job):
+        t0 = time.perf_counter()
+        try:
+            job.ctx[st.name] = st.fn(job.ctx)
+        except Exception as e:
+            job.ctx[st.name] = None
+            job.ctx['errors'][st.name] = e
+            st.errors += 1
+        dt = time.perf_counter() - t0
+
+        done = False
+        with self._lock:
+            st.busy_sec += dt
+            st.calls += 1
+            st.max_ms = max(st.max_ms, dt * 1000)
+            for dep in st.dependents:
+                job.waiting[dep.name] -= 1
+                if job.waiting[dep.name] == 0:
+                    self._mark_ready(dep, job)
+            job.remaining -= 1
+            if job.remaining == 0:
+                done = True
+                self._completed += 1
+                self._t_last = time.perf_counter()
+        if done:
+            self._window.release()
+            job.future.set_result(job.ctx)
+
+    # ------------------------------------------------------------------
+    def close(self, wait=True):
+        """Không nhận frame mới; chờ (hoặc không) các frame đang xử lý rồi dừng luồng."""
+        with self._lock:
+            self._closed = True
+        for st in self._order:
+            st.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        """
+        Số liệu từng stage: số lần chạy, thời gian trung bình / lớn nhất (ms) và
+        utilization = thời gian bận / thời gian chạy của cả pipeline.
+        """
+        with self._lock:
+            wall = ((self._t_last or time.perf_counter()) - self._t_first) if self._t_first else 0.0
+            stages = {}
+            for st in self._order:
+                stages[st.name] = {
+                    'calls': st.calls,
+                    'errors': st.errors,
+                    'avg_ms': round(st.busy_sec / st.calls * 1000, 2) if st.calls else 0.0,
+                    'max_ms': round(st.max_ms, 2),
+                    'utilization': round(st.busy_sec / wall, 3) if wall > 0 else 0.0,
+                }
+            busiest = max(stages, key=lambda n: stages[n]['avg_ms']) if stages else None
+            return {
+                'frames': self._completed,
+                'wall_sec': round(wall, 3),
+                'fps': round(self._completed / wall, 2) if wall > 0 else 0.0,
+                'bottleneck': busiest,
+                'serial_ms_per_frame': round(sum(s['avg_ms'] for s in stages.values()), 2),
+                'stages': stages,
+            }
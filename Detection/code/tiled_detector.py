@@ -0,0 +1,177 @@
+# tiled_detector.py
+"""
+Dò khuôn mặt NHỎ (bàn cuối lớp) mà không phải chạy YOLO ở độ phân giải đầy đủ mỗi frame.
+
+- Chế độ 'tiled': chia frame thành các ô (tile) chồng lấn nhau, mỗi ô được YOLO phóng lên imgsz
+  -> mặt nhỏ to hơn trong ảnh đầu vào. Các ô chạy chung 1 lô; thêm 1 lượt toàn khung (thu nhỏ)
+  để bắt mặt lớn nằm vắt qua nhiều ô. Box được đưa về tọa độ frame rồi NMS chung.
+  Bố cục ô chỉ tính 1 lần cho mỗi kích thước frame (cache).
+- Chế độ 'roi': quét toàn bộ (như 'tiled') mỗi full_scan_every frame; giữa 2 lần quét chỉ dò lại
+  các vùng quanh khuôn mặt đã biết (mở rộng theo roi_margin, gộp vùng chồng nhau).
+  Mặt MỚI xuất hiện giữa 2 lần quét sẽ được bắt ở lần quét toàn bộ kế tiếp.
+
+Trả về (boxes int (N,4), scores list) giống offline_engine.boxes_from_result.
+
+Ví dụ:
+    det = TiledFaceDetector(model, tile_size=640, mode=DETECT_ROI)
+    boxes, scores = det.detect(frame_1080p)
+"""
+import numpy as np
+
+from box_geometry import nms
+
+DETECT_FULL  = "full"    # 1 lần YOLO trên cả frame (như cũ)
+DETECT_TILED = "tiled"
+DETECT_ROI   = "roi"
+DETECT_MODES = (DETECT_FULL, DETECT_TILED, DETECT_ROI)
+
+TILE_SIZE       = 640     # Cạnh ô (pixel của frame gốc)
+TILE_OVERLAP    = 0.2     # Tỷ lệ chồng lấn giữa 2 ô kề nhau
+TILE_IMGSZ      = 640     # imgsz YOLO cho mỗi ô
+GLOBAL_PASS     = True    # Thêm 1 lượt toàn khung để bắt mặt lớn
+FULL_SCAN_EVERY = 15      # Chế độ roi: quét toàn bộ mỗi N frame
+ROI_MARGIN      = 0.75    # Mở rộng mỗi box thêm ROI_MARGIN * cạnh lớn mỗi phía
+ROI_MIN_SIZE    = 96      # Cạnh nhỏ nhất của 1 vùng ROI
+ROI_IMGSZ       = 320     # imgsz YOLO cho vùng ROI
+NMS_IOU         = 0.5
+
+
+def compute_tile_layout(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Danh sách ô (x1, y1, x2, y2) phủ kín frame, chồng lấn ~overlap, ô cuối mỗi hàng/cột
+    được đẩy sát mép để không có ô thiếu. Frame nhỏ hơn tile_size -> 1 ô.
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = max(1, int(tile_size * (1.0 - overlap)))
+        s = list(range(0, length - tile_size, step))
+        s.append(length - tile_size)
+        return s
+    tw, th = min(tile_size, width), min(tile_size, height)
+    return [(x, y, x + tw, y + th) for y in starts(height) for x in starts(width)]
+
+
+def roi_regions(boxes, width, height, margin=ROI_MARGIN, min_size=ROI_MIN_SIZE):
+    """Vùng quét lại quanh các box đã biết: mở rộng, kẹp trong frame, gộp các vùng chồng nhau."""
+    regions = []
+    for x1, y1, x2, y2 in np.asarray(boxes).reshape(-1, 4):
+        pad = margin * max(x2 - x1, y2 - y1)
+        cx, cy = (x1 + x2) / 2.0, (y1 + y2) / 2.0
+        half_w = max((x2 - x1) / 2.0 + pad, min_size / 2.0)
+        half_h = max((y2 - y1) / 2.0 + pad, min_size / 2.0)
+        regions.append([max(0, int(cx - half_w)), max(0, int(cy - half_h)),
+                        min(width, int(cx + half_w)), min(height, int(cy + half_h))])
+    merged = True
+    while merged and len(regions) > 1:
+        merged = False
+        out = []
+        for r in regions:
+            for m in out:
+                if r[0] < m[2] and m[0] < r[2] and r[1] < m[3] and m[1] < r[3]:
+                    m[0], m[1] = min(m[0], r[0]), min(m[1], r[1])
+                    m[2], m[3] = max(m[2], r[2]), max(m[3], r[3])
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        regions = out
+    return [tuple(r) for r in regions if r[2] > r[0] and r[3] > r[1]]
+
+
+class TiledFaceDetector:
+    """Bọc model YOLO dò mặt: dò theo ô / theo ROI, trả box ở tọa độ frame."""
+    def __init__(self, model, conf=0.45, mode=DETECT_TILED, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                 tile_imgsz=TILE_IMGSZ, global_pass=GLOBAL_PASS, full_scan_every=FULL_SCAN_EVERY,
+                 roi_margin=ROI_MARGIN, roi_min_size=ROI_MIN_SIZE, roi_imgsz=ROI_IMGSZ, nms_iou=NMS_IOU):
+        if mode not in DETECT_MODES:
+            raise ValueError(f"Chế độ dò không hợp lệ: {mode}")
+        self.model = model
+        self.conf = conf
+        self.mode = mode
+        self.tile_size = int(tile_size)
+        self.overlap = float(overlap)
+        self.tile_imgsz = tile_imgsz
+        self.global_pass = global_pass
+        self.full_scan_every = max(1, int(full_scan_every))
+        self.roi_margin = roi_margin
+        self.roi_min_size = roi_min_size
+        self.roi_imgsz = roi_imgsz
+        self.nms_iou = nms_iou
+        self._layouts = {}            # (w, h) -> bố cục ô
+        self.reset()
+
+    def reset(self):
+        """Gọi khi đổi video / nguồn camera."""
+        self._frame_idx = 0
+        self._last_boxes = np.zeros((0, 4), dtype=int)
+        self.n_full = 0
+        self.n_roi = 0
+
+    def layout(self, width, height):
+        key = (width, height)
+        if key not in self._layouts:
+            self._layouts[key] = compute_tile_layout(width, height, self.tile_size, self.overlap)
+        return self._layouts[key]
+
+    # ------------------------------------------------------------------
+    def _run(self, crops, offsets, imgsz):
+        """YOLO trên list ảnh con (1 lô), cộng offset để về tọa độ frame."""
+        all_boxes, all_scores = [], []
+        if not crops:
+            return all_boxes, all_scores
+        kw = {'imgsz': imgsz} if imgsz else {}
+        for res, (ox, oy) in zip(self.model(crops, conf=self.conf, verbose=False, **kw), offsets):
+            if not res.boxes:
+                continue
+            b = res.boxes.xyxy.cpu().numpy()
+            b[:, [0, 2]] += ox; b[:, [1, 3]] += oy
+            all_boxes.append(b)
+            all_scores.append(res.boxes.conf.cpu().numpy())
+        return all_boxes, all_scores
+
+    def _merge(self, all_boxes, all_scores):
+        if not all_boxes:
+            return np.zeros((0, 4), dtype=int), []
+        boxes = np.concatenate(all_boxes); scores = np.concatenate(all_scores)
+        keep = nms(boxes, scores, self.nms_iou)
+        return boxes[keep].astype(int), scores[keep].tolist()
+
+    def detect_full(self, frame):
+        """Quét toàn bộ: mọi ô (+ 1 lượt toàn khung)."""
+        h, w = frame.shape[:2]
+        tiles = self.layout(w, h)
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        offsets = [(x1, y1) for x1, y1, _, _ in tiles]
+        boxes, scores = self._run(crops, offsets, self.tile_imgsz)
+        if self.global_pass and len(tiles) > 1:
+            gb, gs = self._run([frame], [(0, 0)], None)
+            boxes += gb; scores += gs
+        self.n_full += 1
+        return self._merge(boxes, scores)
+
+    def detect_roi(self, frame, prev_boxes):
+        """Chỉ dò lại quanh các box đã biết."""
+        h, w = frame.shape[:2]
+        regions = roi_regions(prev_boxes, w, h, self.roi_margin, self.roi_min_size)
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+        offsets = [(x1, y1) for x1, y1, _, _ in regions]
+        self.n_roi += 1
+        return self._merge(*self._run(crops, offsets, self.roi_imgsz))
+
+    def detect(self, frame):
+        if self.mode == DETECT_FULL:
+            res = self.model(frame, conf=self.conf, verbose=False)[0]
+            boxes = res.boxes.xyxy.cpu().numpy().astype(int) if res.boxes else np.zeros((0, 4), dtype=int)
+            scores = res.boxes.conf.cpu().numpy().tolist() if res.boxes else []
+            return boxes, scores
+        full = (self.mode == DETECT_TILED or len(self._last_boxes) == 0
+                or self._frame_idx % self.full_scan_every == 0)
+        self._frame_idx += 1
+        boxes, scores = self.detect_full(frame) if full else self.detect_roi(frame, self._last_boxes)
+        self._last_boxes = boxes
+        return boxes, scores
+
+    def stats(self):
+        return {'mode': self.mode, 'full_scans': self.n_full, 'roi_scans': self.n_roi,
+                'cached_layouts': len(self._layouts)}
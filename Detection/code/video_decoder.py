@@ -0,0 +1,291 @@
+# video_decoder.py
+"""
+Bộ đọc video dùng chung cho Camera / engine offline, cùng giao diện với cv2.VideoCapture
+(isOpened, read, grab, get, set, release) và thêm read_into(dst).
+
+- OpenCVCapture: bọc cv2.VideoCapture (webcam, RTSP, hoặc khi không có PyAV).
+  read_into() resize + lật thẳng vào buffer đích, không tạo mảng trung gian.
+- PyAVCapture (cần 'pip install av'): giải mã FFmpeg đa luồng, scale (libswscale) ngay
+  trong bước chuyển frame sang BGR, 1 luồng nền giải mã trước vào hàng đợi (prefetch),
+  tua bằng keyframe (container.seek) thay vì CAP_PROP_POS_FRAMES.
+
+Ví dụ:
+    cap = open_capture("lop_A.mp4", size=(640, 480))
+    ok = cap.read_into(slot.array)
+"""
+import threading
+import queue
+
+import cv2
+import numpy as np
+
+try:
+    import av
+except Exception:
+    av = None
+
+BACKEND_AUTO   = "auto"
+BACKEND_OPENCV = "opencv"
+BACKEND_PYAV   = "pyav"
+
+PREFETCH_FRAMES = 8   # Số frame giải mã trước
+DEFAULT_FPS     = 30.0
+
+
+def open_capture(source, size=None, flip=False, backend=BACKEND_AUTO, prefetch=PREFETCH_FRAMES):
+    """
+    Mở nguồn video. size=(w, h): frame trả về đã được scale; flip=True: lật ngang (webcam).
+    backend 'auto': PyAV cho file video nếu có cài, còn lại OpenCV.
+    """
+    is_device = isinstance(source, int) or str(source).isdigit()
+    if backend == BACKEND_PYAV or (backend == BACKEND_AUTO and av is not None and not is_device):
+        if av is None:
+            raise ImportError("Chưa cài PyAV (pip install av).")
+        try:
+            return PyAVCapture(source, size=size, flip=flip, prefetch=prefetch)
+        except Exception as e:
+            if backend == BACKEND_PYAV:
+                raise
+            print(f"PyAV không mở được {source} ({e}), dùng OpenCV.")
+    return OpenCVCapture(int(source) if is_device else source, size=size, flip=flip)
+
+
+class OpenCVCapture:
+    """cv2.VideoCapture + scale/lật trực tiếp vào buffer đích."""
+    backend = BACKEND_OPENCV
+
+    def __init__(self, source, size=None, flip=False):
+        self.cap = cv2.VideoCapture(source)
+        self.size = tuple(size) if size else None
+        self.flip = flip
+        self._raw = None   # Buffer đọc thô, dùng lại giữa các frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def grab(self):
+        return self.cap.grab()
+
+    def read_into(self, dst):
+        ok, f = self.cap.read(self._raw)
+        if not ok:
+            return False
+        self._raw = f
+        if self.size and f.shape[1::-1] != self.size:
+            cv2.resize(f, self.size, dst=dst)
+        else:
+            np.copyto(dst, f)
+        if self.flip:
+            cv2.flip(dst, 1, dst=dst)
+        return True
+
+    def read(self, image=None):
+        if self.size is None and not self.flip:
+            return self.cap.read(image)
+        if self.size:
+            h, w = self.size[1], self.size[0]
+        else:
+            h, w = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        if image is None or image.shape != (h, w, 3):
+            image = np.empty((h, w, 3), np.uint8)
+        ok = self.read_into(image)
+        return ok, (image if ok else None)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVCapture:
+    """
+    Giải mã bằng PyAV/FFmpeg trong 1 luồng nền.
+    Frame trong hàng đợi đã là BGR uint8 đúng kích thước size (và đã lật nếu flip).
+    """
+    backend = BACKEND_PYAV
+
+    def __init__(self, source, size=None, flip=False, prefetch=PREFETCH_FRAMES):
+        if av is None:
+            raise ImportError("Chưa cài PyAV (pip install av).")
+        self.source = source
+        self.size = tuple(size) if size else None
+        self.flip = flip
+        self.container = av.open(str(source))
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"          # Giải mã đa luồng (frame + slice)
+
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else DEFAULT_FPS
+        self.time_base = float(self.stream.time_base) if self.stream.time_base else 1.0 / self.fps
+        self.frame_count = int(self.stream.frames or 0)
+        if not self.frame_count and self.stream.duration:
+            self.frame_count = int(self.stream.duration * self.time_base * self.fps)
+        ctx = self.stream.codec_context
+        self.src_w, self.src_h = ctx.width, ctx.height
+
+        self._queue = queue.Queue(maxsize=max(1, int(prefetch)))
+        self._lock = threading.Lock()      # Khóa container khi seek
+        self._stop = threading.Event()
+        self._epoch = 0                    # Tăng mỗi lần seek -> bỏ frame cũ trong hàng đợi
+        self._seek_to = None
+        self._pos_frames = 0               # Frame tiếp theo sẽ trả về
+        self._pos_msec = 0.0               # Timestamp frame vừa trả về
+        self._opened = True
+        self._thread = threading.Thread(target=self._decode_loop, name="pyav-decode", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    def _convert(self, frame):
+        if self.size:
+            img = frame.to_ndarray(width=self.size[0], height=self.size[1], format='bgr24')
+        else:
+            img = frame.to_ndarray(format='bgr24')
+        if self.flip:
+            img = cv2.flip(img, 1)
+        return img
+
+    def _frame_time(self, frame):
+        if frame.pts is not None:
+            return frame.pts * self.time_base
+        return frame.time or 0.0
+
+    def _decode_loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                epoch = self._epoch
+                target = self._seek_to
+                self._seek_to = None
+                if target is not None:
+                    self._do_seek(target)
+                it = self.container.decode(self.stream)
+            try:
+                for frame in it:
+                    if self._stop.is_set() or self._epoch != epoch:
+                        break
+                    t = self._frame_time(frame)
+                    if target is not None and t + 0.5 / self.fps < target:
+                        continue   # Sau keyframe: bỏ tới đúng frame cần tua tới
+                    self._put((epoch, self._convert(frame), t))
+                else:
+                    self._put((epoch, None, None))   # Hết video
+                    # Chờ tới khi có lệnh seek (phát lại) hoặc dừng
+                    while not self._stop.is_set() and self._epoch == epoch:
+                        self._stop.wait(0.05)
+            except Exception as e:
+                print(f"Lỗi giải mã PyAV: {e}")
+                self._put((epoch, None, None))
+                while not self._stop.is_set() and self._epoch == epoch:
+                    self._stop.wait(0.05)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self._epoch != item[0]:
+                    return
+
+    def _do_seek(self, t_sec):
+        # Tua tới keyframe gần nhất trước t_sec (nhanh), phần còn lại bỏ qua khi giải mã
+        ts = int(max(0.0, t_sec) / self.time_base)
+        self.container.seek(ts, stream=self.stream, backward=True, any_frame=False)
+
+    # ------------------------------------------------------------------
+    def isOpened(self):
+        return self._opened
+
+    def _next(self):
+        while True:
+            try:
+                epoch, img, t = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                if self._stop.is_set() or not self._thread.is_alive():
+                    return None, None
+                continue
+            if epoch != self._epoch:
+                continue   # Frame trước lệnh seek
+            return img, t
+
+    def grab(self):
+        img, t = self._next()
+        if img is None:
+            return False
+        self._advance(t)
+        return True
+
+    def _advance(self, t):
+        self._pos_msec = t * 1000.0
+        self._pos_frames += 1
+
+    def read_into(self, dst):
+        img, t = self._next()
+        if img is None:
+            return False
+        if img.shape != dst.shape:
+            cv2.resize(img, (dst.shape[1], dst.shape[0]), dst=dst)
+        else:
+            np.copyto(dst, img)
+        self._advance(t)
+        return True
+
+    def read(self, image=None):
+        img, t = self._next()
+        if img is None:
+            return False, None
+        self._advance(t)
+        if image is not None and image.shape == img.shape:
+            np.copyto(image, img)
+            return True, image
+        return True, img
+
+    def seek(self, t_sec):
+        """Tua tới giây t_sec (keyframe trước đó + bỏ frame tới đúng vị trí)."""
+        with self._lock:
+            self._epoch += 1
+            self._seek_to = float(t_sec)
+            self._pos_frames = int(round(t_sec * self.fps))
+            self._pos_msec = t_sec * 1000.0
+        # Rút frame cũ để luồng giải mã không bị chặn ở put()
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._pos_frames)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self._pos_msec
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.size[0] if self.size else self.src_w)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.size[1] if self.size else self.src_h)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.seek(float(value) / self.fps)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.seek(float(value) / 1000.0)
+        return False
+
+    def release(self):
+        self._stop.set()
+        self._opened = False
+        if self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        try:
+            self.container.close()
+        except Exception:
+            pass
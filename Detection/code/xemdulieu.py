@@ -4,18 +4,17 @@ import numpy as np
 from collections import Counter
 from textwrap import indent
 
+from gallery_store import read_gallery
+
 def main():
-    parser = argparse.ArgumentParser(description="Xem nội dung faces_db.npz")
-    parser.add_argument("path", help="Đường dẫn tới file .npz (ví dụ: faces_db.npz)")
+    parser = argparse.ArgumentParser(description="Xem nội dung gallery khuôn mặt (kho faces_db.store hoặc faces_db.npz)")
+    parser.add_argument("path", help="Đường dẫn tới faces_db.npz / faces_db.store")
     parser.add_argument("--show", type=int, default=10,
                         help="Số tên/embedding mẫu muốn in ra (mặc định 10)")
     args = parser.parse_args()
 
-    data = np.load(args.path, allow_pickle=True)
-
-    # Lấy dữ liệu
-    embs  = data["embs"].astype("float32")      # (N, 512)
-    names = data["names"]                       # (N,)
+    # Lấy dữ liệu (đọc kho gallery_store nếu đã có)
+    embs, names = read_gallery(args.path)      # (N, 512), list[str]
 
     # Thông tin tổng quan
     print("=== THÔNG TIN DATABASE ===")
@@ -26,7 +25,7 @@ def main():
     print()
 
     # Thống kê tên
-    names_list = names.tolist()
+    names_list = list(names)
     counter = Counter(names_list)
     print("=== THỐNG KÊ TÊN (top) ===")
     for name, cnt in counter.most_common(20):
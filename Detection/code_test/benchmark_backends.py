@@ -0,0 +1,77 @@
+# Detection/code_test/benchmark_backends.py
+"""
+So sánh các backend suy luận của model dò khuôn mặt (torch / onnx / openvino) trên
+ảnh trong Detection/test/images: thời gian mỗi ảnh và số khuôn mặt dò được
+(so với torch để thấy bản export có lệch kết quả hay không).
+
+Ví dụ:
+    python benchmark_backends.py --limit 100
+    python benchmark_backends.py --backends torch onnx
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from inference_backend import load_detector, available_backends, BACKENDS
+
+MODEL_PATH = Path(CODE_DIR).parent / "yolov8s-face-lindevs.pt"
+IMAGES_DIR = Path(CODE_DIR).parent / "test" / "images"
+CONF_THRES = 0.45
+
+
+def load_images(limit=None):
+    paths = sorted(p for p in IMAGES_DIR.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if limit:
+        paths = paths[:limit]
+    return [img for img in (cv2.imread(str(p)) for p in paths) if img is not None]
+
+
+def bench(backend, images):
+    model = load_detector(str(MODEL_PATH), backend=backend, device="cpu")
+    model(images[0], conf=CONF_THRES, verbose=False)   # Khởi động
+    counts = []
+    t0 = time.perf_counter()
+    for img in images:
+        res = model(img, conf=CONF_THRES, verbose=False)[0]
+        counts.append(len(res.boxes) if res.boxes is not None else 0)
+    el = time.perf_counter() - t0
+    return el * 1000.0 / len(images), np.array(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo tốc độ các backend YOLO dò mặt trên test/images")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=None,
+                        help="Backend cần đo (mặc định: mọi backend đã cài)")
+    parser.add_argument("--limit", type=int, default=None, help="Chỉ dùng N ảnh đầu")
+    args = parser.parse_args()
+
+    images = load_images(args.limit)
+    if not images:
+        print(f"Không có ảnh trong {IMAGES_DIR}"); return
+    backends = args.backends or available_backends()
+    print(f"{len(images)} ảnh, backend: {backends}")
+
+    ref = None
+    print(f"{'Backend':<10}{'ms/ảnh':>10}{'FPS':>10}{'Tổng mặt':>10}{'Ảnh lệch':>10}")
+    for b in backends:
+        try:
+            ms, counts = bench(b, images)
+        except Exception as e:
+            print(f"{b:<10} lỗi: {e}"); continue
+        if ref is None:
+            ref = counts
+        diff = int(np.count_nonzero(counts != ref))
+        print(f"{b:<10}{ms:>10.1f}{1000.0 / ms:>10.1f}{int(counts.sum()):>10}{diff:>10}")
+
+
+if __name__ == "__main__":
+    main()
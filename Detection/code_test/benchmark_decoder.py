@@ -0,0 +1,76 @@
+# Detection/code_test/benchmark_decoder.py
+"""
+So sánh thông lượng giải mã video (FPS):
+  - cũ:   cv2.VideoCapture.read() + cv2.resize() (như camera.py trước đây)
+  - mới:  video_decoder.open_capture(...).read_into(buffer) với từng backend có sẵn
+
+Ví dụ:
+    python benchmark_decoder.py ../test/lop_hoc.mp4 --frames 1000
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from video_decoder import open_capture, av, BACKEND_OPENCV, BACKEND_PYAV
+
+VIEW_W, VIEW_H = 640, 480
+
+
+def bench_legacy(path, n_frames):
+    cap = cv2.VideoCapture(path)
+    n = 0
+    t0 = time.perf_counter()
+    try:
+        while n < n_frames:
+            ok, f = cap.read()
+            if not ok:
+                break
+            cv2.resize(f, (VIEW_W, VIEW_H))
+            n += 1
+    finally:
+        cap.release()
+    return n, time.perf_counter() - t0
+
+
+def bench_decoder(path, n_frames, backend):
+    cap = open_capture(path, size=(VIEW_W, VIEW_H), backend=backend)
+    buf = np.empty((VIEW_H, VIEW_W, 3), np.uint8)
+    n = 0
+    t0 = time.perf_counter()
+    try:
+        while n < n_frames and cap.read_into(buf):
+            n += 1
+    finally:
+        cap.release()
+    return n, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo FPS giải mã video: OpenCV cũ vs video_decoder")
+    parser.add_argument("video", help="File video dùng để đo")
+    parser.add_argument("--frames", type=int, default=500, help="Số frame đọc mỗi lần đo")
+    args = parser.parse_args()
+
+    runs = [("cv2 read + resize", lambda: bench_legacy(args.video, args.frames)),
+            ("decoder opencv", lambda: bench_decoder(args.video, args.frames, BACKEND_OPENCV))]
+    if av is not None:
+        runs.append(("decoder pyav", lambda: bench_decoder(args.video, args.frames, BACKEND_PYAV)))
+    else:
+        print("Chưa cài PyAV (pip install av) -> bỏ qua backend pyav.")
+
+    print(f"{'Cách đọc':<22}{'Frame':>8}{'Giây':>10}{'FPS':>10}")
+    for name, fn in runs:
+        n, el = fn()
+        print(f"{name:<22}{n:>8}{el:>10.2f}{n / max(el, 1e-9):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Detection/code_test/benchmark_gallery_index.py
+"""
+Đo recall@1 và độ trễ truy vấn của các chỉ mục gallery (gallery_index.py) trên gallery giả
+lập 1k / 10k / 100k danh tính (embedding 512 chiều, gom theo nhóm như dữ liệu mặt thật).
+Kết quả đúng (ground truth) = brute force.
+
+Ví dụ:
+    python benchmark_gallery_index.py --sizes 1000 10000 100000 --nprobe 4 8 16
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import gallery_index
+from gallery_index import make_index, INDEX_BRUTE, INDEX_IVF, INDEX_HNSW, EMB_DIM
+
+
+def _unit(x):
+    return (x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-9)).astype(np.float32)
+
+
+def synthetic_gallery(n, n_groups=256, seed=0):
+    """n danh tính quanh n_groups hướng chung (mặt người không phân bố đều trên mặt cầu)."""
+    rng = np.random.default_rng(seed)
+    groups = _unit(rng.normal(size=(n_groups, EMB_DIM)))
+    g = rng.integers(0, n_groups, size=n)
+    return _unit(groups[g] + 0.8 * _unit(rng.normal(size=(n, EMB_DIM))))
+
+
+def synthetic_queries(gallery, n_queries, noise=0.5, seed=1):
+    """Ảnh mới của người đã đăng ký: embedding gallery + nhiễu."""
+    rng = np.random.default_rng(seed)
+    who = rng.integers(0, len(gallery), size=n_queries)
+    return _unit(gallery[who] + noise * _unit(rng.normal(size=(n_queries, EMB_DIM))))
+
+
+def measure(index, queries, batch):
+    t0 = time.perf_counter()
+    ids = np.concatenate([index.search(queries[s:s + batch], k=1)[1][:, 0]
+                          for s in range(0, len(queries), batch)])
+    ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    return ids, ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall / độ trễ của chỉ mục gallery khuôn mặt")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=8, help="Số mặt mỗi lần truy vấn (≈ số mặt / frame)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128], help="ef_search của HNSW")
+    args = parser.parse_args()
+
+    print(f"{'gallery':>8} | {'chỉ mục':<22} | {'recall@1':>8} | {'ms/truy vấn':>11} | {'dựng (s)':>8}")
+    for n in args.sizes:
+        gallery = synthetic_gallery(n)
+        labels = [str(i) for i in range(n)]
+        queries = synthetic_queries(gallery, args.queries)
+
+        variants = [(INDEX_BRUTE, "brute", {})]
+        variants += [(INDEX_IVF, f"ivf nprobe={p}", {'nprobe': p}) for p in args.nprobe]
+        if gallery_index.hnswlib is not None:
+            variants += [(INDEX_HNSW, f"hnsw ef={ef}", {'ef_search': ef}) for ef in args.ef]
+        truth, built = None, {}
+        for kind, name, params in variants:
+            t0 = time.perf_counter()
+            if kind == INDEX_IVF and INDEX_IVF in built:
+                index = built[INDEX_IVF]; index.nprobe = params['nprobe']      # Dùng lại cụm đã huấn luyện
+            else:
+                index = make_index(kind, **params)
+                index.add(gallery, labels)
+                built[kind] = index
+            build_s = time.perf_counter() - t0
+            ids, ms = measure(index, queries, args.batch)
+            if truth is None:
+                truth = ids
+            recall = float(np.mean(ids == truth))
+            print(f"{n:>8} | {name:<22} | {recall:>8.3f} | {ms:>11.3f} | {build_s:>8.2f}")
+        if gallery_index.hnswlib is None:
+            print(f"{n:>8} | (bỏ qua HNSW: chưa cài hnswlib)")
+
+
+if __name__ == "__main__":
+    main()
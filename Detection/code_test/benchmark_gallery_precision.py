@@ -0,0 +1,100 @@
+# Detection/code_test/benchmark_gallery_precision.py
+"""
+So sánh gallery float32 với bản nén float16 / int8 (quét thô trên bản nén + tính lại float32
+cho `rerank` ứng viên): byte ma trận quét, byte vector nằm trong RAM, độ trễ truy vấn, tỉ lệ
+top-1 trùng float32 và độ chính xác nhận dạng.
+
+Mỗi kiểu chạy với 2 cách lưu float32:
+- ram:  index.add(...) — float32 ở tầng RAM, bản nén là THÊM vào (RAM tăng, chỉ quét nhỏ đi).
+- mmap: adopt() memmap .npy như load_db của kho — RAM chỉ còn bản nén; các hàng float32 được
+        tính lại do OS nạp theo trang (không tính vào cột RAM).
+
+Dữ liệu: gallery thật (--db, vd. ../code/faces_db.npz hoặc faces_db.store) nếu có, cộng các
+gallery giả lập --sizes. Truy vấn = embedding đã đăng ký + nhiễu (--noise, mô phỏng ảnh mới
+của cùng người); nhận dạng đúng khi nhãn top-1 trùng nhãn gốc.
+
+Ví dụ:
+    python benchmark_gallery_precision.py --db ../code/faces_db.npz --sizes 10000 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from gallery_index import make_index, INDEX_BRUTE, PRECISION_FP32, PRECISION_FP16, PRECISION_INT8
+from gallery_store import read_gallery, store_exists
+from benchmark_gallery_index import synthetic_gallery, _unit
+
+
+def noisy_queries(gallery, labels, n_queries, noise, seed=1):
+    rng = np.random.default_rng(seed)
+    who = rng.integers(0, len(gallery), size=n_queries)
+    q = _unit(gallery[who] + noise * _unit(rng.normal(size=(n_queries, gallery.shape[1]))))
+    return q, [labels[i] for i in who]
+
+
+def build(gallery, labels, precision, layout, tmp, rerank):
+    index = make_index(INDEX_BRUTE, dim=gallery.shape[1], precision=precision, rerank=rerank)
+    if layout == "ram":
+        index.add(gallery, labels)
+    else:
+        path = os.path.join(tmp, "embs.npy")
+        if not os.path.exists(path):
+            np.save(path, gallery)
+        index.adopt(np.load(path, mmap_mode='r'), np.array([l.encode("utf-8") for l in labels], dtype="S64"))
+    return index
+
+
+def run(name, gallery, labels, args):
+    queries, truth = noisy_queries(gallery, labels, args.queries, args.noise)
+    base = None
+    tmp = tempfile.mkdtemp()
+    for layout, precision in [(l, p) for l in ("ram", "mmap") for p in (PRECISION_FP32, PRECISION_FP16, PRECISION_INT8)]:
+        index = build(gallery, labels, precision, layout, tmp, args.rerank)
+        index.search(queries[:args.batch], k=1)                    # Làm nóng
+        t0 = time.perf_counter()
+        ids = np.concatenate([index.search(queries[s:s + args.batch], k=1)[1][:, 0]
+                              for s in range(0, len(queries), args.batch)])
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        found = index.labels_of(ids)
+        scan_mb, ram_mb = index.scan_bytes() / 2 ** 20, index.memory_bytes() / 2 ** 20
+        if base is None:
+            base = (ram_mb, ms, ids)          # Mốc: float32 toàn bộ trong RAM
+        agree = float(np.mean(ids == base[2]))
+        acc = float(np.mean([f == t for f, t in zip(found, truth)]))
+        change = 100.0 * (ram_mb / base[0] - 1)
+        print(f"{name:>14} | {layout:<4} | {precision:<5} | {scan_mb:>8.1f} | {ram_mb:>8.1f} | {change:>+7.1f}% | "
+              f"{ms:>8.3f} | {base[1] / ms:>6.2f}x | {agree:>7.3f} | {acc:>7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gallery float32 / float16 / int8: bộ nhớ, tốc độ, độ chính xác")
+    parser.add_argument("--db", default=os.path.join(CODE_DIR, "faces_db.npz"), help="Gallery đã đăng ký")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=8, help="Số mặt mỗi lần truy vấn (≈ số mặt / frame)")
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--rerank", type=int, default=32, help="Số ứng viên tính lại bằng float32")
+    args = parser.parse_args()
+
+    print(f"{'gallery':>14} | {'lưu':<4} | {'kiểu':<5} | {'MB quét':>8} | {'MB RAM':>8} | {'RAM':>8} | "
+          f"{'ms/truy vấn':>8} | {'tăng tốc':>7} | {'trùng fp32':>7} | {'đúng':>7}")
+    if store_exists(args.db):
+        embs, labels = read_gallery(args.db)
+        if labels:
+            run(f"thật ({len(labels)})", _unit(np.asarray(embs, dtype=np.float32)), labels, args)
+    else:
+        print(f"(không thấy gallery thật ở {args.db}, chỉ chạy dữ liệu giả lập)")
+    for n in args.sizes:
+        run(f"giả lập {n}", synthetic_gallery(n), [str(i) for i in range(n)], args)
+
+
+if __name__ == "__main__":
+    main()
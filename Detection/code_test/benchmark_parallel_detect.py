@@ -0,0 +1,112 @@
+# Detection/code_test/benchmark_parallel_detect.py
+"""
+Đo độ trễ mỗi frame khi chạy YOLO dò mặt + YOLO hành vi:
+  - tuần tự (như infer_thread trước đây): dò mặt xong, frame có mặt mới chạy model hành vi
+  - song song (như Camera._infer_loop_serial với parallel_detectors.py): model hành vi gửi đi
+    trước dò mặt, 2 model chạy cùng lúc, chia ngân sách luồng CPU; lần dò trước không thấy mặt
+    (phòng trống) -> bỏ qua model hành vi ở frame sau
+In kèm số luồng torch.get_num_threads() đo NGAY TRONG mỗi job (thứ thực sự chạy) và phần chia
+có áp được theo phiên backend không (torch: không, onnx / openvino: có).
+
+Ví dụ:
+    python benchmark_parallel_detect.py --limit 100 --budget 8 --backend onnx
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from inference_backend import load_detector
+from behavior_analyzer import load_behavior_model, BEHAVIOR_CONF_THRES
+from parallel_detectors import ParallelDetectors, DEFAULT_SHARES
+
+MODEL_PATH = Path(CODE_DIR).parent / "yolov8s-face-lindevs.pt"
+IMAGES_DIR = Path(CODE_DIR).parent / "test" / "images"
+CONF_THRES = 0.45
+
+
+def load_frames(limit):
+    paths = sorted(p for p in IMAGES_DIR.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))[:limit]
+    return [cv2.resize(img, (640, 480)) for img in (cv2.imread(str(p)) for p in paths) if img is not None]
+
+
+def _n_faces(res):
+    return len(res[0].boxes) if res and res[0].boxes is not None else 0
+
+
+def _summary(lat_ms):
+    a = np.array(lat_ms)
+    return f"trung bình {a.mean():6.1f} ms | p95 {np.percentile(a, 95):6.1f} ms | {1000.0 / a.mean():5.1f} FPS"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh dò mặt + hành vi tuần tự và song song")
+    parser.add_argument("--limit", type=int, default=100, help="Số ảnh dùng để đo")
+    parser.add_argument("--budget", type=int, default=os.cpu_count(), help="Tổng số luồng CPU")
+    parser.add_argument("--face-share", type=float, default=DEFAULT_SHARES['detect'],
+                        help="Tỷ lệ luồng cho model dò mặt (phần còn lại cho model hành vi)")
+    parser.add_argument("--backend", default="torch", help="Backend model dò mặt: torch / onnx / openvino / auto")
+    args = parser.parse_args()
+
+    frames = load_frames(args.limit)
+    face = load_detector(str(MODEL_PATH), backend=args.backend, device="cpu")
+    behavior, _ = load_behavior_model()
+    if behavior is None:
+        print("Không tìm thấy model hành vi (best.pt)."); return
+    import torch
+    seen = {'detect': set(), 'behavior': set()}   # torch.get_num_threads() trong từng job
+
+    def detect(f):
+        seen['detect'].add(torch.get_num_threads())
+        return face(f, conf=CONF_THRES, verbose=False)
+
+    def behave(f):
+        seen['behavior'].add(torch.get_num_threads())
+        return behavior(f, conf=BEHAVIOR_CONF_THRES, verbose=False)
+    detect(frames[0]); behave(frames[0])        # Khởi động
+
+    torch.set_num_threads(args.budget)
+    serial = []
+    for f in frames:
+        t0 = time.perf_counter()
+        if _n_faces(detect(f)) > 0:
+            behave(f)
+        serial.append((time.perf_counter() - t0) * 1000)
+
+    par = ParallelDetectors({'detect': args.face_share, 'behavior': 1.0 - args.face_share}, args.budget,
+                            models={'detect': face, 'behavior': behavior})
+    for s in seen.values():
+        s.clear()
+    par.call('detect', detect, frames[0]); par.call('behavior', behave, frames[0])
+    parallel, skipped, had_faces = [], 0, True
+    try:
+        for f in frames:
+            t0 = time.perf_counter()
+            fb = par.submit('behavior', behave, f) if had_faces else None
+            had_faces = _n_faces(par.call('detect', detect, f)) > 0
+            if fb is not None:
+                fb.result()
+            else:
+                skipped += 1
+            parallel.append((time.perf_counter() - t0) * 1000)
+    finally:
+        par.close()
+
+    print(f"{len(frames)} frame 640x480, ngân sách {args.budget} luồng, chia {par.threads}, "
+          f"áp theo phiên backend {par.enforced}")
+    print(f"torch.get_num_threads() thực tế trong job song song: "
+          f"{ {k: sorted(v) for k, v in seen.items()} }")
+    print(f"Tuần tự : {_summary(serial)}")
+    print(f"Song song: {_summary(parallel)} | bỏ qua model hành vi {skipped} frame (phòng trống)")
+
+
+if __name__ == "__main__":
+    main()
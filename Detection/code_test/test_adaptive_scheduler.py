@@ -0,0 +1,49 @@
+# Detection/code_test/test_adaptive_scheduler.py
+# Kiểm thử bộ điều khiển thích ứng: giảm tải khi vượt ngân sách, tăng lại khi dư, ghi quyết định
+
+import os
+import sys
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from adaptive_scheduler import AdaptiveController, EVERY_LIMITS
+
+
+def _feed(ctl, stage_ms, frames):
+    for _ in range(frames):
+        for s, ms in stage_ms.items():
+            if ctl.should_run(s):
+                ctl.record(s, ms / 1000.0)
+        ctl.frame_done()
+
+
+def test_nhip_chay_theo_every():
+    ctl = AdaptiveController(target_fps=30, every={'recog': 3}, verbose=False)
+    runs = [ctl.should_run('recog') for _ in range(6)]
+    assert runs == [True, False, False, True, False, False]
+
+
+def test_vuot_ngan_sach_thi_giam_tai_stage_ton_nhat():
+    ctl = AdaptiveController(target_fps=30, adjust_every=5, verbose=False)
+    _feed(ctl, {'detect': 10, 'recog': 5, 'mesh': 5, 'behavior': 40}, frames=5)
+    m = ctl.metrics()
+    assert m['every']['behavior'] == 2 and m['degrades'] == 1
+    assert m['decisions'][-1]['action'] == 'degrade'
+    assert m['decisions'][-1]['detail'] == 'behavior_every=2'
+
+
+def test_het_cach_giam_nhip_thi_giam_do_phan_giai():
+    ctl = AdaptiveController(target_fps=30, adjust_every=1, verbose=False)
+    ctl.every = {s: hi for s, (lo, hi) in EVERY_LIMITS.items()}
+    _feed(ctl, {'detect': 200, 'recog': 5, 'mesh': 5, 'behavior': 5}, frames=3)
+    assert ctl.imgsz < 640
+
+
+def test_du_ngan_sach_thi_tang_lai_chat_luong():
+    ctl = AdaptiveController(target_fps=10, every={'behavior': 4}, adjust_every=1, verbose=False)
+    _feed(ctl, {'detect': 5, 'recog': 2, 'mesh': 2, 'behavior': 10}, frames=20)
+    m = ctl.metrics()
+    assert m['every']['behavior'] == 1 and m['upgrades'] >= 3
+    assert m['load'] < 1.0
@@ -0,0 +1,70 @@
+# Detection/code_test/test_box_geometry.py
+# Kiểm thử ma trận IoU / chồng lấn / khoảng cách và ghép cặp tham lam / Hungarian
+
+import os
+import sys
+import itertools
+
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from box_geometry import (iou_matrix, overlap_matrix, center_distance_matrix, greedy_assign,
+                          hungarian_assign, linear_assignment, _hungarian_numpy, nms, iou_xyxy)
+
+
+def _random_boxes(rng, n):
+    xy = rng.uniform(0, 500, size=(n, 2))
+    wh = rng.uniform(10, 120, size=(n, 2))
+    return np.hstack([xy, xy + wh]).astype(np.float32)
+
+
+def _iou_pair(a, b):
+    iw = max(0.0, min(a[2], b[2]) - max(a[0], b[0])); ih = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = iw * ih
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def test_ma_tran_khop_tinh_tung_cap():
+    rng = np.random.default_rng(1)
+    a, b = _random_boxes(rng, 7), _random_boxes(rng, 5)
+    iou = iou_matrix(a, b)
+    assert iou.shape == (7, 5)
+    for i, j in itertools.product(range(7), range(5)):
+        assert abs(iou[i, j] - _iou_pair(a[i], b[j])) < 1e-5
+    assert abs(iou_xyxy(a[0], a[0]) - 1.0) < 1e-6
+    # Mặt nằm trọn trong box hành vi -> tỉ lệ 1; box rỗng -> 0
+    ov = overlap_matrix([[10, 10, 20, 20], [5, 5, 5, 5]], [[0, 0, 100, 100]])
+    assert np.allclose(ov[:, 0], [1.0, 0.0])
+    assert np.allclose(center_distance_matrix([[0, 0, 2, 2]], [[3, 4, 5, 6]]), [[5.0]])
+    assert iou_matrix(np.zeros((0, 4)), b).shape == (0, 5)
+
+
+def test_hungarian_toi_uu_hon_tham_lam():
+    score = np.array([[0.9, 0.8], [0.8, 0.1]])
+    assert greedy_assign(score, 0.05) == [(0, 0), (1, 1)]
+    assert sorted(hungarian_assign(score, 0.05)) == [(0, 1), (1, 0)]
+    # Cặp dưới ngưỡng bị bỏ
+    assert hungarian_assign(np.array([[0.2]]), 0.3) == []
+
+
+def test_hungarian_numpy_dung_voi_vet_can():
+    rng = np.random.default_rng(2)
+    for n, m in [(3, 3), (3, 5), (5, 3), (4, 6)]:
+        cost = rng.uniform(0, 10, size=(n, m))
+        rows, cols = linear_assignment(cost)
+        got = cost[rows, cols].sum()
+        if n <= m:
+            best = min(sum(cost[i, p[i]] for i in range(n)) for p in itertools.permutations(range(m), n))
+            assert abs(cost[np.arange(n), _hungarian_numpy(cost)].sum() - best) < 1e-9
+        else:
+            best = min(sum(cost[p[j], j] for j in range(m)) for p in itertools.permutations(range(n), m))
+        assert len(rows) == min(n, m) and abs(got - best) < 1e-9
+
+
+def test_nms_giu_box_diem_cao():
+    boxes = [[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]]
+    assert nms(boxes, [0.5, 0.9, 0.7], 0.5) == [1, 2]
+    assert nms(np.zeros((0, 4)), [], 0.5) == []
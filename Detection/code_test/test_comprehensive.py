@@ -30,6 +30,7 @@ except ImportError:
 # IMPORT CÁC CLASS GỐC
 from profiler import SystemProfiler
 from stability_profiler import StabilityProfiler
+from box_geometry import iou_matrix, overlap_matrix, greedy_assign
 
 # --- IMPORT DATABASE MODULE (MySQL) ---
 try:
@@ -98,56 +99,17 @@ class TestAdvancedPerformance:
                 return p
         return None
 
-    # --- LOGIC TÍNH TOÁN IOU (DÙNG CHO TRACKING) ---
-    def _calculate_iou(self, box1, box2):
-        """Tính Intersection over Union giữa 2 box"""
-        x1 = max(box1[0], box2[0])
-        y1 = max(box1[1], box2[1])
-        x2 = min(box1[2], box2[2])
-        y2 = min(box1[3], box2[3])
-
-        intersection = max(0, x2 - x1) * max(0, y2 - y1)
-        area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
-        area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
-        
-        union = area1 + area2 - intersection
-        return intersection / union if union > 0 else 0
-
-    # --- LOGIC GHÉP CẶP BEHAVIOR (BOX TRONG BOX) ---
-    def _calculate_overlap_ratio(self, face_box, behavior_box):
-        try:
-            fx1, fy1, fx2, fy2 = face_box
-            bx1, by1, bx2, by2 = behavior_box
-            
-            ix1 = max(fx1, bx1)
-            iy1 = max(fy1, by1)
-            ix2 = min(fx2, bx2)
-            iy2 = min(fy2, by2)
-            
-            iw = max(0, ix2 - ix1)
-            ih = max(0, iy2 - iy1)
-            intersection = iw * ih
-            face_area = (fx2 - fx1) * (fy2 - fy1)
-            
-            return intersection / face_area if face_area > 0 else 0.0
-        except: return 0.0
-
     def _map_behaviors_to_faces(self, face_boxes, behavior_detections):
         mapping = {}
         if not face_boxes or not behavior_detections: return mapping
 
-        for beh in behavior_detections:
-            beh_box = beh['xy']
-            best_face_idx = -1
-            max_overlap = 0.0
+        # Tỉ lệ mặt nằm trong box hành vi, tính 1 lần cho mọi cặp (mặt x hành vi)
+        ratios = overlap_matrix(face_boxes, [beh['xy'] for beh in behavior_detections])
+        for j, beh in enumerate(behavior_detections):
+            best_face_idx = int(np.argmax(ratios[:, j]))
+            max_overlap = ratios[best_face_idx, j]
 
-            for idx, f_box in enumerate(face_boxes):
-                ratio = self._calculate_overlap_ratio(f_box, beh_box)
-                if ratio > max_overlap:
-                    max_overlap = ratio
-                    best_face_idx = idx
-            
-            if max_overlap > 0.3 and best_face_idx != -1:
+            if max_overlap > 0.3:
                 if best_face_idx not in mapping:
                     mapping[best_face_idx] = beh
                 else:
@@ -302,21 +264,15 @@ class TestAdvancedPerformance:
             box_idx_to_track_id = {}
             matched_track_ids = set()
 
-            # Thuật toán Greedy Matching bằng IoU
-            # Duyệt qua từng box mới, tìm track cũ khớp nhất
-            for original_idx, new_box in current_frame_boxes:
-                best_iou = 0
-                best_tid = -1
-                
-                for tid, t_data in active_tracks.items():
-                    if tid in matched_track_ids: continue # Track đã được match với box khác
-                    iou = self._calculate_iou(new_box, t_data['box'])
-                    if iou > best_iou:
-                        best_iou = iou
-                        best_tid = tid
-                
-                if best_iou > IOU_MATCH_THRESH:
+            # Greedy Matching bằng ma trận IoU (box mới x track cũ), tính 1 lần
+            track_ids = list(active_tracks)
+            ious = iou_matrix([b for _, b in current_frame_boxes],
+                              [active_tracks[tid]['box'] for tid in track_ids])
+            matched_box = {r: track_ids[c] for r, c in greedy_assign(ious, IOU_MATCH_THRESH + 1e-9)}
+            for k, (original_idx, new_box) in enumerate(current_frame_boxes):
+                if k in matched_box:
                     # Match thành công: Giữ nguyên ID cũ
+                    best_tid = matched_box[k]
                     matched_track_ids.add(best_tid)
                     box_idx_to_track_id[original_idx] = best_tid
                     active_tracks[best_tid]['box'] = new_box
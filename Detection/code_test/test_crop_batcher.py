@@ -0,0 +1,53 @@
+# Detection/code_test/test_crop_batcher.py
+# Kiểm thử cắt + resize theo batch: giống hệt cách cắt từng box cũ, bỏ box ngoài ảnh, dùng lại bộ đệm
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from crop_batcher import CropBatcher
+
+
+def _crop_tung_box(bgr, box, margin=0.15, size=160):
+    """Cách cắt cũ của RecognitionEngine._preprocess_crop (trước bước chuẩn hóa torch)."""
+    h, w = bgr.shape[:2]
+    x1, y1, x2, y2 = [int(v) for v in box]
+    mx, my = int(max(0, (x2 - x1) * margin)), int(max(0, (y2 - y1) * margin))
+    x1, y1 = max(0, x1 - mx), max(0, y1 - my)
+    x2, y2 = min(w, x2 + mx), min(h, y2 + my)
+    crop = bgr[y1:y2, x1:x2]
+    if crop.size == 0:
+        return None
+    return cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB), (size, size))
+
+
+def test_giong_het_cat_tung_box_nhieu_frame():
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, size=(240, 320, 3), dtype=np.uint8) for _ in range(2)]
+    xy = rng.uniform(-10, 300, size=(12, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(8, 60, size=(12, 2))])
+    boxes[3] = [400, 10, 450, 60]                  # Nằm hẳn ngoài ảnh -> bỏ qua
+    items = [(frames[0], boxes[:7]), (frames[1], []), (frames[1], boxes[7:])]
+    buf, owners = CropBatcher(160).fill(items, margin=0.15)
+    expected = [(k, i) for k, (f, bs) in enumerate(items) for i, b in enumerate(bs)
+                if _crop_tung_box(f, b) is not None]
+    assert owners == expected and (0, 3) not in owners
+    assert buf.shape == (len(expected), 160, 160, 3) and buf.dtype == np.uint8
+    for row, (k, i) in enumerate(owners):
+        ref = _crop_tung_box(items[k][0], items[k][1][i])
+        assert np.array_equal(buf[row][..., ::-1], ref)
+
+
+def test_dung_lai_bo_dem_giua_cac_frame():
+    img = np.full((100, 100, 3), 7, dtype=np.uint8)
+    batcher = CropBatcher(32)
+    first, _ = batcher.fill([(img, [[0, 0, 50, 50]] * 5)])
+    again, owners = batcher.fill([(img, [[10, 10, 40, 40]] * 3)])
+    assert np.shares_memory(first, again) and len(owners) == 3 and np.all(again == 7)
+    assert len(batcher.fill([(img, [])])[1]) == 0
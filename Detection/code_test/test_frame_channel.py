@@ -0,0 +1,126 @@
+# Detection/code_test/test_frame_channel.py
+# Kiểm thử kênh frame (đánh số, chính sách bỏ frame, đánh thức luồng, bộ đếm)
+# và frame pool cấp phát sẵn dùng chung với kênh
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from frame_channel import (FrameChannel, POLICY_LATEST_ONLY, POLICY_DROP_OLDEST,
+                           POLICY_BLOCK)
+from frame_pool import FramePool
+
+
+def test_seq_tang_dan_va_khong_xu_ly_trung():
+    ch = FrameChannel(capacity=4, policy=POLICY_DROP_OLDEST)
+    seqs = [ch.put(f"frame{i}") for i in range(3)]
+    assert seqs == [1, 2, 3]
+    got = [ch.get(timeout=0.1).seq for _ in range(3)]
+    assert got == [1, 2, 3]
+    assert ch.get(timeout=0.01) is None  # Không trả lại frame đã tiêu thụ
+
+
+def test_latest_only_giu_frame_moi_nhat_va_dem_drop():
+    dropped = []
+    ch = FrameChannel(policy=POLICY_LATEST_ONLY, on_drop=dropped.append)
+    for i in range(5):
+        ch.put(i)
+    pkt = ch.get(timeout=0.1)
+    assert pkt.seq == 5 and pkt.frame == 4
+    st = ch.stats()
+    assert st['produced'] == 5 and st['consumed'] == 1 and st['dropped'] == 4
+    assert [p.seq for p in dropped] == [1, 2, 3, 4]
+
+
+def test_drop_oldest_giu_capacity_frame_moi_nhat():
+    ch = FrameChannel(capacity=2, policy=POLICY_DROP_OLDEST)
+    for i in range(4):
+        ch.put(i)
+    assert [ch.get(timeout=0.1).frame for _ in range(2)] == [2, 3]
+    assert ch.stats()['dropped'] == 2
+
+
+def test_block_cho_den_khi_co_cho_trong():
+    ch = FrameChannel(capacity=1, policy=POLICY_BLOCK)
+    ch.put("a")
+    assert ch.put("b", timeout=0.05) is None  # Đầy -> hết timeout
+
+    def consumer():
+        time.sleep(0.05)
+        ch.get(timeout=1.0)
+
+    th = threading.Thread(target=consumer)
+    th.start()
+    assert ch.put("c", timeout=1.0) == 2
+    th.join()
+    assert ch.stats()['dropped'] == 0
+
+
+def test_get_duoc_danh_thuc_khi_co_frame_hoac_khi_dong():
+    ch = FrameChannel()
+    result = {}
+
+    def consumer():
+        result['pkt'] = ch.get(timeout=2.0)
+        result['after_close'] = ch.get(timeout=2.0)
+
+    th = threading.Thread(target=consumer)
+    th.start()
+    time.sleep(0.02)
+    ch.put("x")
+    time.sleep(0.02)
+    ch.close()
+    th.join(timeout=1.0)
+    assert not th.is_alive()
+    assert result['pkt'].frame == "x"
+    assert result['after_close'] is None
+    assert ch.put("y") is None
+
+
+def test_latest_khong_tieu_thu_frame():
+    ch = FrameChannel(capacity=2, policy=POLICY_DROP_OLDEST)
+    ch.put("a"); ch.put("b")
+    assert ch.latest().frame == "b"
+    assert ch.latest(after_seq=2) is None
+    assert len(ch) == 2
+
+
+def test_chinh_sach_khong_hop_le():
+    with pytest.raises(ValueError):
+        FrameChannel(policy="random")
+
+
+def test_pool_tra_slot_khi_frame_bi_bo_hoac_da_xu_ly():
+    pool = FramePool(3, (4, 4, 3))
+    ch = FrameChannel(policy=POLICY_LATEST_ONLY, on_drop=lambda p: pool.release(p.meta['slot']))
+    for _ in range(3):
+        slot = pool.acquire()
+        ch.put(slot.view(), meta={'slot': slot, 'gen': slot.generation})
+    assert pool.in_use == 1  # 2 frame bị 'latest' bỏ -> slot đã quay về pool
+    pkt = ch.get(timeout=0.1)
+    assert not pkt.frame.flags.writeable
+    pool.release(pkt.meta['slot'])
+    assert pool.in_use == 0
+
+
+def test_pool_het_slot_va_phat_hien_ghi_de():
+    pool = FramePool(1, (2, 2))
+    slot = pool.acquire()
+    slot.array[:] = 7
+    gen = slot.generation
+    assert pool.acquire() is None and pool.stats()['exhausted'] == 1
+    assert np.all(pool.copy_out(slot, gen) == 7)
+    pool.release(slot)
+    again = pool.acquire()          # Cùng slot, thế hệ mới
+    assert again is slot
+    assert pool.copy_out(slot, gen) is None
+    with pytest.raises(RuntimeError):
+        pool.release(again); pool.release(again)
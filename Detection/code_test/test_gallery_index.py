@@ -0,0 +1,170 @@
+# Detection/code_test/test_gallery_index.py
+# Kiểm thử chỉ mục gallery: brute force chính xác, IVF khớp brute force, xóa mềm, lưu / tải, bản nén fp16 / int8
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import gallery_index
+from gallery_index import (make_index, load_index, subset_index, match_identities, select_templates,
+                           INDEX_BRUTE, INDEX_IVF, INDEX_HNSW, PRECISION_FP16, PRECISION_INT8)
+
+DIM = 32
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def _gallery(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return _unit(rng.normal(size=(n, DIM))), [str(i) for i in range(n)]
+
+
+def test_brute_force_tim_dung_va_xoa_mem():
+    vecs, labels = _gallery(50)
+    idx = make_index(INDEX_BRUTE, dim=DIM)
+    idx.add(vecs, labels)
+    scores, ids = idx.search(vecs[:5], k=3)
+    assert idx.labels_of(ids[:, 0]) == labels[:5]
+    assert np.all(scores[:, 0] >= scores[:, 1])
+    assert idx.remove_label("2") == 1 and len(idx) == 49
+    _, ids = idx.search(vecs[2:3], k=1)
+    assert idx.labels_of(ids[:, 0]) != ["2"]
+    idx.compact()
+    assert len(idx) == 49 and "2" not in idx.labels()
+    # k lớn hơn gallery -> phần thiếu là -1
+    small = make_index(INDEX_BRUTE, dim=DIM); small.add(vecs[:2], labels[:2])
+    assert small.search(vecs[:1], k=4)[1][0, 2:].tolist() == [-1, -1]
+
+
+def test_ivf_quet_het_cum_khop_brute_force():
+    vecs, labels = _gallery(600, seed=1)
+    ivf = make_index(INDEX_IVF, dim=DIM, nlist=16, nprobe=16, train_min=100)
+    ivf.add(vecs[:300], labels[:300])
+    ivf.add(vecs[300:], labels[300:])          # thêm dần sau khi đã huấn luyện
+    assert ivf.is_trained
+    brute = make_index(INDEX_BRUTE, dim=DIM); brute.add(vecs, labels)
+    q = _unit(vecs[::7] + 0.05 * np.random.default_rng(2).normal(size=(len(vecs[::7]), DIM)))
+    assert np.array_equal(ivf.search(q, k=2)[1], brute.search(q, k=2)[1])
+    ivf.remove_label(labels[0])
+    assert ivf.labels_of(ivf.search(vecs[:1], k=1)[1][:, 0]) != [labels[0]]
+
+
+def test_luu_va_tai_lai_chi_muc(tmp_path):
+    vecs, labels = _gallery(300, seed=3)
+    ivf = make_index(INDEX_IVF, dim=DIM, nlist=8, nprobe=2, train_min=100)
+    ivf.add(vecs, labels)
+    ivf.remove([5])
+    path = str(tmp_path / "gallery.idx.npz")
+    ivf.save(path)
+    back = load_index(path)
+    assert back.kind == INDEX_IVF and back.nprobe == 2 and len(back) == 299
+    assert np.array_equal(back.centroids, ivf.centroids)
+    assert np.array_equal(back.search(vecs[:20], k=1)[1], ivf.search(vecs[:20], k=1)[1])
+
+
+def test_gallery_con_theo_lop():
+    vecs, labels = _gallery(200, seed=5)
+    full = make_index(INDEX_IVF, dim=DIM, nlist=8, train_min=50)
+    full.add(vecs, labels)
+    full.remove_label("3")
+    cls = subset_index(full, ["1", "2", "3", "999"])
+    assert sorted(cls.labels()) == ["1", "2"]
+    # Mặt của lớp khác không thể khớp trong gallery lớp
+    _, ids = cls.search(vecs[10:11], k=1)
+    assert cls.labels_of(ids[:, 0])[0] in ("1", "2")
+    assert len(subset_index(full, [])) == 0
+
+
+def test_nhieu_mau_moi_hoc_sinh_va_gop_top_k():
+    rng = np.random.default_rng(6)
+    base = _unit(rng.normal(size=(2, DIM)))
+    # Học sinh "A": 3 góc mặt lệch về các hướng khác nhau quanh base[0]; "B": 1 mẫu
+    views = _unit(base[0] + 0.9 * _unit(rng.normal(size=(3, DIM))))
+    idx = make_index(INDEX_BRUTE, dim=DIM)
+    idx.add(views, ["A"] * 3)
+    idx.add(base[1:2], ["B"])
+    assert sorted(idx.identities()) == ["A", "B"] and len(idx.templates("A")) == 3
+    # Ảnh mới gần tâm của A: tâm khớp tốt hơn bất kỳ mẫu lẻ nào
+    q = base[0:1]
+    labels, scores = match_identities(idx, q, k=4)
+    assert labels == ["A"]
+    assert scores[0] >= float(np.max(views @ q[0])) and abs(scores[0] - float(idx.centroid("A") @ q[0])) < 1e-5
+    idx.remove(idx.templates("A")[:1])
+    assert len(idx.templates("A")) == 2 and idx.remove_label("A") == 2 and idx.identities() == ["B"]
+
+
+def test_bo_nho_tang_gap_doi_va_chon_mau_da_dang():
+    idx = make_index(INDEX_BRUTE, dim=DIM)
+    caps = set()
+    for i in range(300):
+        idx.add(_unit(np.ones((1, DIM))), [str(i)])
+        caps.add(len(idx._vecs))
+    assert sorted(caps) == [64, 128, 256, 512]
+    first = _unit(np.eye(DIM)[0:1])[0]
+    cand = _unit(np.stack([np.eye(DIM)[0] + 0.01, np.eye(DIM)[1], np.eye(DIM)[0] + 0.02]))
+    picked = select_templates(cand, n=2, first=first)
+    assert picked.shape == (2, DIM) and np.allclose(picked[1], cand[1])
+
+
+@pytest.mark.parametrize("precision", [PRECISION_FP16, PRECISION_INT8])
+def test_ban_nen_tinh_lai_float32_khop_brute_force(tmp_path, precision):
+    vecs, labels = _gallery(1000, seed=7)
+    exact = make_index(INDEX_BRUTE, dim=DIM); exact.add(vecs, labels)
+    idx = make_index(INDEX_BRUTE, dim=DIM, precision=precision, rerank=16)
+    idx.add(vecs[:600], labels[:600])
+    idx.add(vecs[600:], labels[600:])
+    idx.remove_label("4"); exact.remove_label("4")
+    q = _unit(vecs[::9] + 0.3 * np.random.default_rng(8).normal(size=(len(vecs[::9]), DIM)))
+    s1, i1 = idx.search(q, k=3)
+    s0, i0 = exact.search(q, k=3)
+    assert np.array_equal(i1, i0) and np.allclose(s1, s0, atol=1e-5)   # Điểm cuối là float32 thật
+    assert idx.scan_bytes() < exact.scan_bytes() / (1.9 if precision == PRECISION_FP16 else 3.5)
+    assert idx.memory_bytes() > exact.memory_bytes()      # Tầng RAM: giữ cả float32 lẫn bản nén
+    np.save(tmp_path / "embs.npy", vecs)
+    mapped = make_index(INDEX_BRUTE, dim=DIM, precision=precision, rerank=16)
+    mapped.adopt(np.load(tmp_path / "embs.npy", mmap_mode='r'), np.array(labels, dtype="S64"))
+    assert mapped.memory_bytes() == mapped.scan_bytes()   # float32 nằm ở memmap -> RAM chỉ còn bản nén
+    path = str(tmp_path / "p.idx.npz")
+    idx.save(path)
+    back = load_index(path)
+    assert back.precision == precision and np.array_equal(back.search(q, k=3)[1], i0)
+
+
+@pytest.mark.skipif(gallery_index.hnswlib is None, reason="chưa cài hnswlib")
+def test_hnsw_tim_dung():
+    vecs, labels = _gallery(500, seed=4)
+    idx = make_index(INDEX_HNSW, dim=DIM)
+    idx.add(vecs, labels)
+    _, ids = idx.search(vecs[:20], k=1)
+    assert idx.labels_of(ids[:, 0]) == labels[:20]
+
+
+@pytest.mark.parametrize("precision", [PRECISION_FP16, PRECISION_INT8])
+def test_ivf_ban_nen_khop_ivf_float32(tmp_path, precision):
+    vecs, labels = _gallery(800, seed=9)
+    exact = make_index(INDEX_IVF, dim=DIM, nlist=8, nprobe=3, train_min=100)
+    idx = make_index(INDEX_IVF, dim=DIM, nlist=8, nprobe=3, train_min=100, precision=precision, rerank=16)
+    for ix in (exact, idx):
+        ix.add(vecs, labels)
+        ix.remove_label("5")
+    q = _unit(vecs[::7] + 0.3 * np.random.default_rng(3).normal(size=(len(vecs[::7]), DIM)))
+    s0, i0 = exact.search(q, k=3)
+    s1, i1 = idx.search(q, k=3)
+    assert idx.is_trained and np.array_equal(i1, i0) and np.allclose(s1, s0, atol=1e-5)
+    path = str(tmp_path / "ivf.idx.npz")
+    idx.save(path)
+    back = load_index(path)
+    assert back.kind == INDEX_IVF and back.precision == precision and np.array_equal(back.search(q, k=3)[1], i0)
+
+
+def test_hnsw_tu_choi_ban_nen():
+    with pytest.raises(ValueError):
+        make_index(INDEX_HNSW, dim=DIM, precision=PRECISION_INT8)
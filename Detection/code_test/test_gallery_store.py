@@ -0,0 +1,135 @@
+# Detection/code_test/test_gallery_store.py
+# Kiểm thử kho gallery ghi nối tiếp: tombstone, nhập npz cũ, đuôi ghi dở, compaction, ảnh chụp memmap, listener
+
+import os
+import sys
+
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import gallery_store
+from gallery_store import GalleryStore, open_store, store_exists, MANIFEST
+from gallery_index import make_index
+
+DIM = 8
+
+
+def _embs(n, seed=0):
+    e = np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+    return e / np.linalg.norm(e, axis=1, keepdims=True)
+
+
+def test_them_xoa_va_dang_ky_lai(tmp_path):
+    store = GalleryStore(str(tmp_path / "g.store"), dim=DIM)
+    e = _embs(4)
+    store.append(["1", "2", "1"], e[:3])
+    assert store.delete("1") == 2 and store.delete("1") == 0
+    store.append(["1"], e[3:])                 # Đăng ký lại sau khi xóa
+    embs, labels = store.load()
+    assert labels == ["2", "1"] and np.allclose(embs, e[[1, 3]])
+    # Mở lại từ đĩa -> cùng nội dung
+    again = GalleryStore(str(tmp_path / "g.store"), dim=DIM)
+    assert again.load()[1] == ["2", "1"] and len(again) == 2
+
+
+def test_nhap_npz_cu_ca_hai_kieu_khoa(tmp_path):
+    e = _embs(3)
+    np.savez(tmp_path / "a.npz", embs=e, names=np.array(["7", "8", "9"], dtype=object))
+    np.savez(tmp_path / "b.npz", embeddings=e[:2], labels=np.array(["5", "6"]))
+    a = open_store(str(tmp_path / "a.npz"), dim=DIM)
+    assert a.load()[1] == ["7", "8", "9"]
+    assert a.stats()['snapshot'] == 3 and isinstance(a.load_arrays()[0], np.memmap)   # Nhập thẳng thành ảnh chụp
+    b = open_store(str(tmp_path / "b.npz"), dim=DIM)
+    assert b.delete("5") == 1 and b.load()[1] == ["6"]
+    assert store_exists(str(tmp_path / "b.npz")) and not store_exists(str(tmp_path / "c.npz"))
+
+
+def test_bo_qua_duoi_ghi_do_khi_mat_dien(tmp_path):
+    root = str(tmp_path / "g.store")
+    store = GalleryStore(root, dim=DIM)
+    store.append(["1", "2"], _embs(2))
+    seg = os.path.join(root, store.manifest['segments'][-1]['file'])
+    with open(seg, "ab") as f:                 # Bản ghi đã ghi ra đĩa nhưng MANIFEST chưa commit
+        f.write(b"\x01" * (store.dtype.itemsize + 5))
+    again = GalleryStore(root, dim=DIM)
+    assert again.load()[1] == ["1", "2"]
+    again.append(["3"], _embs(1, seed=1))
+    assert GalleryStore(root, dim=DIM).load()[1] == ["1", "2", "3"]
+    assert os.path.getsize(seg) == 3 * store.dtype.itemsize
+
+
+def test_compaction_giu_ban_ghi_song_va_xoa_segment_cu(tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery_store, "SEGMENT_RECORDS", 4)
+    monkeypatch.setattr(gallery_store, "COMPACT_DEAD_RATIO", 1.0)
+    monkeypatch.setattr(gallery_store, "COMPACT_MAX_SEGMENTS", 100)
+    root = str(tmp_path / "g.store")
+    store = GalleryStore(root, dim=DIM)
+    e = _embs(10)
+    store.append([str(i % 5) for i in range(10)], e)
+    store.delete("0"); store.delete("3")
+    before = store.load()
+    assert store.stats()['segments'] == 3
+    store.compact()
+    st = store.stats()
+    assert st['dead'] == 0 and st['tombstones'] == 0 and st['records'] == 6
+    after = store.load()
+    assert after[1] == before[1] and np.allclose(after[0], before[0])
+    on_disk = sorted(f for f in os.listdir(root) if f.startswith("seg_"))
+    assert on_disk == sorted(s['file'] for s in store.manifest['segments'])
+    store.append(["0"], e[:1])                 # Sau compaction vẫn ghi / đọc bình thường
+    assert GalleryStore(root, dim=DIM).load()[1] == before[1] + ["0"]
+
+
+def test_anh_chup_memmap_nap_vao_chi_muc_khong_sao_chep(tmp_path):
+    root = str(tmp_path / "g.store")
+    store = GalleryStore(root, dim=DIM)
+    e = _embs(6)
+    store.append(["1", "2", "3", "4"], e[:4])
+    store.compact()
+    store.append(["5"], e[4:5])                # Đuôi journal sau ảnh chụp
+    store.delete("2")                          # Tombstone áp lên ảnh chụp
+    again = GalleryStore(root, dim=DIM)
+    base, base_labels, alive, tail, tail_labels = again.load_arrays()
+    assert isinstance(base, np.memmap) and base.shape == (4, DIM)
+    assert alive.tolist() == [True, False, True, True] and tail_labels == ["5"]
+    idx = make_index(dim=DIM)
+    idx.adopt(base, base_labels, alive=alive)
+    idx.add(tail, tail_labels)
+    assert np.shares_memory(idx._base, base) and sorted(idx.identities()) == ["1", "3", "4", "5"]
+    assert idx.labels_of(idx.search(e[[0, 3, 4]], k=1)[1][:, 0]) == ["1", "4", "5"]
+    assert again.load()[1] == ["1", "3", "4", "5"]
+    # Compaction lần 2 gộp ảnh chụp cũ + đuôi, dọn thư mục ảnh chụp cũ
+    again.compact()
+    assert [d for d in os.listdir(root) if d.startswith("snap_")] == [again.manifest['snapshot']['dir']]
+    assert GalleryStore(root, dim=DIM).load()[1] == ["1", "3", "4", "5"] and again.stats()['dead'] == 0
+
+
+def test_duoi_journal_dai_tu_gop_va_giu_anh_chup_dang_ghi(tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery_store, "COMPACT_TAIL_RECORDS", 4)
+    root = str(tmp_path / "g.store")
+    store = GalleryStore(root, dim=DIM)
+    store.append([str(i) for i in range(6)], _embs(6))
+    store.wait_compaction()
+    assert store.stats()['snapshot'] == 6 and store.stats()['segments'] == 0
+    # Ảnh chụp đang ghi dở (đã giữ chỗ trong MANIFEST) không bị process khác mở kho xóa mất
+    name = f"snap_{store.manifest['next_segment']:06d}"
+    store.manifest['next_segment'] += 1
+    store.manifest['pending_snapshot'] = name
+    store._commit()
+    store.append(["x"], _embs(1))              # MANIFEST mới có next_segment lớn hơn số đang ghi
+    os.makedirs(os.path.join(root, name))
+    GalleryStore(root, dim=DIM)
+    assert os.path.isdir(os.path.join(root, name))
+
+
+def test_bao_listener_khi_xoa(tmp_path):
+    store = GalleryStore(str(tmp_path / "g.store"), dim=DIM)
+    store.append(["1"], _embs(1))
+    events = []
+    store.add_listener(lambda ev, label: events.append((ev, label)))
+    store.delete("1")
+    assert events == [('delete', '1')]
+    assert os.path.exists(os.path.join(store.root, MANIFEST))
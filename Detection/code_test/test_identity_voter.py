@@ -0,0 +1,62 @@
+# Detection/code_test/test_identity_voter.py
+# Kiểm thử bỏ phiếu danh tính theo track: khóa khi đủ tin cậy, giảm số lần nhúng, mở khóa khi lệch
+
+import os
+import sys
+
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from identity_voter import IdentityVoter, UNKNOWN_NAME
+
+RNG = np.random.default_rng(0)
+GALLERY = RNG.normal(size=(2, 64)).astype(np.float32)
+GALLERY /= np.linalg.norm(GALLERY, axis=1, keepdims=True)
+NAMES = ["1", "2"]
+
+
+def predict(embs, thres=0.6):
+    sims = embs @ GALLERY.T
+    idx = np.argmax(sims, axis=1)
+    s = sims[np.arange(len(embs)), idx]
+    return [NAMES[i] if v >= thres else UNKNOWN_NAME for i, v in zip(idx, s)], [float(v) for v in s]
+
+
+def noisy(k, scale=0.3):
+    e = GALLERY[k] + RNG.normal(scale=scale / 8, size=64).astype(np.float32)
+    return e / np.linalg.norm(e)
+
+
+def test_khoa_danh_tinh_va_giam_so_lan_nhung():
+    v = IdentityVoter(predict, lock_votes=3, lock_conf=0.7, verify_every=10)
+    calls = 0
+    for f in range(40):
+        if v.needs_embedding(7, f):
+            calls += 1
+            label, conf = v.observe_batch([7], noisy(0)[None], f)[0]
+    assert v.is_locked(7) and label == "1" and conf >= 0.7
+    assert calls < 10
+
+
+def test_mo_khoa_khi_doi_nguoi_trong_track():
+    v = IdentityVoter(predict, lock_votes=2, verify_every=1)
+    for f in range(3):
+        v.observe_batch([1], noisy(0)[None], f)
+    assert v.is_locked(1)
+    label, _ = v.observe_batch([1], noisy(1)[None], 3)[0]
+    assert not v.is_locked(1) and label == "2"
+    assert v.stats()['unlocks'] == 1
+
+
+def test_khong_khoa_nguoi_la_va_xoa_track_cu():
+    v = IdentityVoter(predict, lock_votes=2)
+    stranger = RNG.normal(size=(1, 64)).astype(np.float32)
+    stranger /= np.linalg.norm(stranger)
+    for f in range(5):
+        assert v.observe_batch([3], stranger, f)[0][0] == UNKNOWN_NAME
+    assert not v.is_locked(3) and v.needs_embedding(3, 5)
+    v.prune([])
+    assert v.stats()['tracks'] == 0
@@ -0,0 +1,32 @@
+# Detection/code_test/test_inference_backend.py
+# Kiểm thử khóa cache bản export: gắn với nội dung file .pt, đổi model thì đổi đường dẫn
+
+import os
+import sys
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from inference_backend import (cached_export_path, file_hash, _read_choice, _write_choice,
+                               BACKEND_ONNX, BACKEND_OPENVINO, BACKEND_TORCH)
+
+
+def test_duong_dan_cache_theo_hash_noi_dung(tmp_path):
+    pt = tmp_path / "face.pt"
+    pt.write_bytes(b"model-v1")
+    onnx_v1 = cached_export_path(str(pt), BACKEND_ONNX)
+    assert onnx_v1 == str(tmp_path / f"face.{file_hash(str(pt))}.onnx")
+    assert cached_export_path(str(pt), BACKEND_OPENVINO).endswith("_openvino_model")
+    assert cached_export_path(str(pt), BACKEND_TORCH) == str(pt)
+
+    pt.write_bytes(b"model-v2")          # Đổi model -> phải export lại
+    assert cached_export_path(str(pt), BACKEND_ONNX) != onnx_v1
+
+
+def test_ghi_nho_backend_nhanh_nhat(tmp_path):
+    pt = tmp_path / "face.pt"
+    pt.write_bytes(b"model")
+    assert _read_choice(str(pt)) is None
+    _write_choice(str(pt), BACKEND_ONNX, {BACKEND_TORCH: 40.0, BACKEND_ONNX: 25.0})
+    assert _read_choice(str(pt)) == BACKEND_ONNX
@@ -0,0 +1,51 @@
+# Detection/code_test/test_media_clock.py
+# Kiểm thử đồng hồ theo thời gian video và việc FocusScoreManager dùng nó cho các timer
+
+import os
+import sys
+
+import cv2
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from media_clock import MediaClock
+from focus_manager import FocusScoreManager, PHONE_REPEAT_PENALTY_TIME
+
+
+class _FakeCap:
+    def __init__(self, msec=0.0, pos_frames=0, fps=25.0):
+        self.props = {cv2.CAP_PROP_POS_MSEC: msec, cv2.CAP_PROP_POS_FRAMES: pos_frames,
+                      cv2.CAP_PROP_FPS: fps}
+
+    def get(self, prop):
+        return self.props.get(prop, 0.0)
+
+
+def test_lay_thoi_gian_tu_pos_msec_hoac_so_frame():
+    clock = MediaClock()
+    assert clock.update_from_capture(_FakeCap(msec=1500.0)) == 1.5
+    # Backend không có POS_MSEC -> dùng số frame / fps
+    clock2 = MediaClock()
+    assert clock2.update_from_capture(_FakeCap(msec=0.0), frame_index=50, fps=25.0) == 2.0
+
+
+def test_dong_ho_khong_lui_khi_tua_ve_dau():
+    clock = MediaClock(default_fps=10.0)
+    clock.set(100.0)
+    t = clock.set(0.0)               # Phát lại từ đầu
+    assert t > 100.0
+    assert clock.set(1.0) > t
+
+
+def test_diem_theo_thoi_gian_video_khong_phu_thuoc_toc_do_xu_ly():
+    """Video 5 phút dùng điện thoại, xử lý tức thì: số lần phạt đúng theo thời gian video."""
+    clock = MediaClock()
+    fm = FocusScoreManager(base_score=0, clock=clock)
+    fps = 5
+    for n in range(int(300 * fps)):
+        clock.set_frame(n, fps)
+        fm.update_student_score(1, ['phone'], 'HEAD_STRAIGHT', 'EYES_OPEN')
+    expected = -(1 + int((300 - 1.0 / fps) // PHONE_REPEAT_PENALTY_TIME))
+    assert fm.get_student_score(1) == expected
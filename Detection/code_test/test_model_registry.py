@@ -0,0 +1,45 @@
+# Detection/code_test/test_model_registry.py
+# Kiểm thử kho model dùng chung: tải 1 lần (kể cả khi nhiều luồng cùng lấy), warm-up, báo lỗi tải
+
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from model_registry import ModelRegistry
+
+
+def test_tai_mot_lan_du_nhieu_luong_cung_lay():
+    reg = ModelRegistry(device="cpu")
+    calls = []
+
+    def loader(r):
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    reg.register("m", loader)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(reg.get("m"))) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(calls) == 1 and all(g is got[0] for g in got)
+    assert reg.get("m") is got[0]
+
+
+def test_warm_up_chay_thu_va_bo_qua_model_loi():
+    reg = ModelRegistry(device="cpu")
+    warmed = []
+    reg.register("ok", lambda r: "model", warmer=lambda m, frame: warmed.append((m, frame.shape)))
+    reg.register("hong", lambda r: 1 / 0)
+    reg.warm_up(["ok", "hong"])
+    assert warmed == [("model", (480, 640, 3))]
+    assert reg.stats()['warmed'] == ["ok"] and "hong" in reg.stats()['errors']
+    with pytest.raises(ZeroDivisionError):
+        reg.get("hong")
@@ -0,0 +1,47 @@
+# Detection/code_test/test_parallel_detectors.py
+# Kiểm thử chia ngân sách luồng và việc 2 model chạy đồng thời trên 2 luồng riêng
+
+import os
+import sys
+import time
+import threading
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from parallel_detectors import ParallelDetectors, partition_threads
+
+
+def test_chia_ngan_sach_luong():
+    assert partition_threads(8, {'detect': 0.5, 'behavior': 0.5}) == {'detect': 4, 'behavior': 4}
+    assert partition_threads(7, {'detect': 0.6, 'behavior': 0.4}) == {'detect': 5, 'behavior': 2}
+    assert partition_threads(1, {'detect': 0.5, 'behavior': 0.5}) == {'detect': 1, 'behavior': 1}
+
+
+def test_hai_model_chay_dong_thoi():
+    par = ParallelDetectors(thread_budget=2)
+    barrier = threading.Barrier(2, timeout=2.0)
+    names = []
+
+    def job(tag):
+        barrier.wait()            # Chỉ qua được khi cả 2 đang chạy cùng lúc
+        names.append(threading.current_thread().name.split('_')[0])
+        return tag
+
+    t0 = time.perf_counter()
+    fb = par.submit('behavior', job, 'b')
+    assert par.call('detect', job, 'd') == 'd' and fb.result() == 'b'
+    assert time.perf_counter() - t0 < 2.0
+    assert sorted(names) == ['det-behavior', 'det-detect']
+    par.close()
+
+
+def test_model_torch_khong_ap_duoc_phan_chia_luong():
+    class FakeTorchModel:
+        backend_name = "torch"
+    par = ParallelDetectors({'detect': 0.75, 'behavior': 0.25}, thread_budget=4,
+                            models={'detect': FakeTorchModel(), 'behavior': None})
+    assert par.threads == {'detect': 3, 'behavior': 1}
+    assert par.stats()['enforced'] == {'detect': False, 'behavior': False}
+    par.close()
@@ -0,0 +1,26 @@
+# Detection/code_test/test_quantize_gate.py
+# Kiểm thử ngưỡng độ chính xác khi công bố bản INT8 và phép ghép box so với FP32
+
+import os
+import sys
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from quantize_models import accuracy_gate, match_counts
+
+
+def test_ghep_box_theo_iou():
+    ref = [[0, 0, 10, 10], [20, 20, 30, 30]]
+    cur = [[1, 1, 10, 10], [50, 50, 60, 60]]
+    assert match_counts(ref, cur) == (1, 1, 1)
+    assert match_counts(ref, []) == (0, 0, 2)
+
+
+def test_tu_choi_khi_giam_qua_nguong():
+    ref = {'f1': 0.90, 'perfect_image_accuracy': 0.80}
+    ok, drops = accuracy_gate(ref, {'f1': 0.89, 'perfect_image_accuracy': 0.79}, max_drop=0.02)
+    assert ok
+    ok, drops = accuracy_gate(ref, {'f1': 0.85, 'perfect_image_accuracy': 0.80}, max_drop=0.02)
+    assert not ok and drops['f1'] == 0.05
@@ -0,0 +1,75 @@
+# Detection/code_test/test_stage_scheduler.py
+# Kiểm thử bộ lập lịch stage: thứ tự frame, phụ thuộc, chạy gối nhau, lỗi stage, số liệu
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from stage_scheduler import StageScheduler
+
+
+def _build(sleep_a=0.0, sleep_b=0.0, seen=None):
+    sched = StageScheduler(max_in_flight=3)
+    sched.add_stage('a', lambda c: time.sleep(sleep_a) or c['x'] + 1)
+    sched.add_stage('b', lambda c: time.sleep(sleep_b) or 10)
+    sched.add_stage('join', lambda c: (seen.append(c['seq']) if seen is not None else None) or c['a'] + c['b'],
+                    after=('a', 'b'))
+    return sched
+
+
+def test_ket_qua_dung_va_giu_thu_tu_frame():
+    seen = []
+    sched = _build(sleep_a=0.002, seen=seen)
+    futs = [sched.submit({'x': i}) for i in range(10)]
+    assert [f.result(timeout=2)['join'] for f in futs] == [i + 11 for i in range(10)]
+    assert seen == list(range(1, 11))
+    sched.close()
+
+
+def test_cac_stage_chay_goi_nhau():
+    sched = _build(sleep_a=0.03, sleep_b=0.03)
+    t0 = time.perf_counter()
+    futs = [sched.submit({'x': i}) for i in range(6)]
+    for f in futs:
+        f.result(timeout=2)
+    elapsed = time.perf_counter() - t0
+    sched.close()
+    assert elapsed < 6 * 0.06 * 0.8   # Nhanh hơn hẳn tổng thời gian các stage
+    st = sched.stats()
+    assert st['frames'] == 6 and st['bottleneck'] in ('a', 'b')
+    assert 0.0 < st['stages']['a']['utilization'] <= 1.0
+
+
+def test_gioi_han_so_frame_dang_xu_ly():
+    gate = threading.Event()
+    sched = StageScheduler(max_in_flight=2)
+    sched.add_stage('wait', lambda c: gate.wait(2))
+    assert sched.submit({}) is not None and sched.submit({}) is not None
+    assert sched.submit({}, timeout=0.05) is None
+    gate.set()
+    assert sched.submit({}, timeout=1.0) is not None
+    sched.close()
+
+
+def test_stage_loi_khong_chan_cac_stage_sau():
+    sched = StageScheduler()
+    sched.add_stage('bad', lambda c: 1 / 0)
+    sched.add_stage('after', lambda c: c['bad'] is None, after=('bad',))
+    ctx = sched.submit({}).result(timeout=2)
+    assert ctx['after'] is True
+    assert isinstance(ctx['errors']['bad'], ZeroDivisionError)
+    assert sched.stats()['stages']['bad']['errors'] == 1
+    sched.close()
+
+
+def test_phu_thuoc_chua_khai_bao():
+    sched = StageScheduler()
+    with pytest.raises(ValueError):
+        sched.add_stage('x', lambda c: None, after=('khong_co',))
@@ -0,0 +1,86 @@
+# Detection/code_test/test_tiled_detector.py
+# Kiểm thử bố cục ô, NMS giữa các ô và chế độ ROI (quét toàn bộ định kỳ, giữa chừng chỉ quét quanh mặt)
+
+import os
+import sys
+
+import numpy as np
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'code'))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+from tiled_detector import TiledFaceDetector, compute_tile_layout, roi_regions, DETECT_ROI
+
+
+class _Boxes:
+    def __init__(self, xyxy, conf):
+        self.xyxy = _Arr(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+        self.conf = _Arr(np.asarray(conf, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.conf.a)
+
+
+class _Arr:
+    def __init__(self, a):
+        self.a = a
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.a.copy()
+
+
+class _Res:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class _FakeModel:
+    """'Dò' 1 khuôn mặt cố định (tọa độ frame) trong mọi ảnh con có chứa nó."""
+    def __init__(self, frame, face):
+        self.frame, self.face = frame, face
+        self.calls = []
+
+    def __call__(self, crops, conf=0.5, verbose=False, imgsz=None):
+        self.calls.append(len(crops))
+        out = []
+        for c in crops:
+            # Tìm vị trí ảnh con trong frame qua địa chỉ bộ nhớ của view
+            off = (c.__array_interface__['data'][0] - self.frame.__array_interface__['data'][0]) // 3
+            oy, ox = divmod(off, self.frame.shape[1])
+            x1, y1, x2, y2 = self.face
+            h, w = c.shape[:2]
+            if ox <= x1 and oy <= y1 and x2 <= ox + w and y2 <= oy + h:
+                out.append(_Res(_Boxes([[x1 - ox, y1 - oy, x2 - ox, y2 - oy]], [0.9])))
+            else:
+                out.append(_Res(_Boxes(np.zeros((0, 4)), [])))
+        return out
+
+
+def test_bo_cuc_o_phu_kin_frame():
+    tiles = compute_tile_layout(1920, 1080, tile_size=640, overlap=0.2)
+    assert max(t[2] for t in tiles) == 1920 and max(t[3] for t in tiles) == 1080
+    assert all(t[2] - t[0] == 640 and t[3] - t[1] == 640 for t in tiles)
+    assert compute_tile_layout(320, 240, tile_size=640) == [(0, 0, 320, 240)]
+
+
+def test_nms_gop_box_trung_giua_cac_o():
+    frame = np.zeros((1080, 1920, 3), np.uint8)
+    model = _FakeModel(frame, (600, 100, 630, 130))   # Nằm trong vùng chồng lấn của 2 ô
+    det = TiledFaceDetector(model, tile_size=640, overlap=0.2)
+    boxes, scores = det.detect(frame)
+    assert boxes.tolist() == [[600, 100, 630, 130]] and len(scores) == 1
+
+
+def test_che_do_roi_chi_quet_quanh_mat_giua_cac_lan_quet_toan_bo():
+    frame = np.zeros((1080, 1920, 3), np.uint8)
+    model = _FakeModel(frame, (1500, 900, 1530, 930))
+    det = TiledFaceDetector(model, mode=DETECT_ROI, tile_size=640, full_scan_every=3)
+    for _ in range(3):
+        boxes, _ = det.detect(frame)
+        assert boxes.tolist() == [[1500, 900, 1530, 930]]
+    assert det.stats()['full_scans'] == 1 and det.stats()['roi_scans'] == 2
+    assert roi_regions([[10, 10, 20, 20], [15, 15, 25, 25]], 100, 100) == [(0, 0, 68, 68)]